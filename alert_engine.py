@@ -0,0 +1,356 @@
+import bisect
+import csv
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+
+from sqlalchemy import or_, select, update
+
+import currency_conversion
+from models.user import db, Trade
+
+logger = logging.getLogger(__name__)
+
+
+def base_symbol(market):
+    """Quote key of a market, as used by the quote cache"""
+    return market.split('/')[0].upper()
+
+
+def quote_usd_rate(market):
+    """USD value of the market's quote currency if it is fixed, else None.
+
+    Ticks are USD quotes of the base symbol, so only levels in USD or a
+    pinned currency can be compared with them; books hold levels in USD.
+    """
+    return currency_conversion.fixed_usd_rate(currency_conversion.split_market(market)[1])
+
+
+def _usd(level, rate):
+    return None if level is None else level * rate
+
+
+class TriggerBook:
+    """Stop and target levels of one symbol, sorted so a tick only visits the levels it crosses.
+
+    Stops fire at or below their level and are kept ascending, so the ones
+    a falling price crosses sit at the end of the list; targets are kept
+    negated for the same reason. A tick is a bisect plus a tail slice.
+    """
+
+    def __init__(self):
+        self.stop_levels, self.stop_ids = [], []
+        self.target_keys, self.target_ids = [], []
+
+    def __len__(self):
+        return len(self.stop_ids) + len(self.target_ids)
+
+    def add(self, trade_id, stop=None, target=None):
+        if stop is not None:
+            self._insert(self.stop_levels, self.stop_ids, stop, trade_id)
+        if target is not None:
+            self._insert(self.target_keys, self.target_ids, -target, trade_id)
+
+    def extend(self, stops, targets):
+        """Bulk add (level, trade_id) pairs with one sort instead of an insert each"""
+        self.stop_levels, self.stop_ids = self._merged(self.stop_levels, self.stop_ids, stops)
+        self.target_keys, self.target_ids = self._merged(
+            self.target_keys, self.target_ids, [(-level, trade_id) for level, trade_id in targets])
+
+    def remove(self, trade_id, stop=None, target=None):
+        if stop is not None:
+            self._remove(self.stop_levels, self.stop_ids, stop, trade_id)
+        if target is not None:
+            self._remove(self.target_keys, self.target_ids, -target, trade_id)
+
+    def cross(self, price):
+        """Remove and return (kind, trade_id, level) for every trigger the price reached"""
+        stops = self._pop_tail(self.stop_levels, self.stop_ids, bisect.bisect_left(self.stop_levels, price))
+        targets = self._pop_tail(self.target_keys, self.target_ids, bisect.bisect_left(self.target_keys, -price))
+        return [('stop', trade_id, level) for level, trade_id in stops] + \
+            [('target', trade_id, -key) for key, trade_id in targets]
+
+    @staticmethod
+    def _insert(keys, ids, key, trade_id):
+        i = bisect.bisect_right(keys, key)
+        keys.insert(i, key)
+        ids.insert(i, trade_id)
+
+    @staticmethod
+    def _remove(keys, ids, key, trade_id):
+        i = bisect.bisect_left(keys, key)
+        while i < len(keys) and keys[i] == key:
+            if ids[i] == trade_id:
+                del keys[i]
+                del ids[i]
+                return
+            i += 1
+
+    @staticmethod
+    def _merged(keys, ids, pairs):
+        merged = sorted(list(zip(keys, ids)) + list(pairs))
+        return [key for key, _ in merged], [trade_id for _, trade_id in merged]
+
+    @staticmethod
+    def _pop_tail(keys, ids, start):
+        fired = list(zip(keys[start:], ids[start:]))
+        del keys[start:]
+        del ids[start:]
+        return fired
+
+
+class AlertEngine:
+    """Watches the stop and target levels of open trades against every quote update.
+
+    Triggers are indexed per base symbol in TriggerBooks, so a tick costs
+    O(log n + k) for the k levels it crosses. Each level fires once; fired
+    alerts go onto a bounded queue for delivery, and the dispatcher clears
+    the level in the database before delivering (see claim_alert), so a
+    restart or another process's engine can't deliver it again. The engine
+    loads the open trades lazily on its first tick, and the calculator keeps
+    it in step with trades written in this process afterwards. Run it in
+    one process; see app.start_background_services.
+    """
+
+    def __init__(self, queue_size=None):
+        queue_size = int(queue_size if queue_size is not None else os.getenv('ALERT_QUEUE_MAX_SIZE', 10000))
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.loaded = False
+        self._books = {}  # base symbol -> TriggerBook
+        self._levels = {}  # trade_id -> (user_id, market, stop, target)
+        self._pending = None  # level changes made while a load is running
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(book) for book in self._books.values())
+
+    def load_open_trades(self):
+        """Index the levels of every open trade; needs an app context"""
+        with self._lock:
+            self._pending = {}
+        rows = db.session.execute(
+            select(Trade.id, Trade.user_id, Trade.market, Trade.stop_price, Trade.target_price).where(
+                Trade.remaining_units > 0, or_(Trade.stop_price.is_not(None), Trade.target_price.is_not(None)))
+        ).all()
+        self.load(rows)
+
+    def load(self, rows):
+        """Replace all triggers with (trade_id, user_id, market, stop, target) rows"""
+        levels = {trade_id: (user_id, market, stop, target) for trade_id, user_id, market, stop, target in rows}
+        with self._lock:
+            # Writes that landed while the rows were being read win over them
+            levels.update(self._pending or {})
+            staged = {}
+            for trade_id, entry in list(levels.items()):
+                if entry is None:
+                    continue
+                _, market, stop, target = entry
+                rate = quote_usd_rate(market)
+                if rate is None:
+                    logger.warning("Not watching levels of trade %s: %s is not quoted in a fixed-rate currency",
+                                   trade_id, market)
+                    levels[trade_id] = None
+                    continue
+                stops, targets = staged.setdefault(base_symbol(market), ([], []))
+                if stop is not None:
+                    stops.append((stop * rate, trade_id))
+                if target is not None:
+                    targets.append((target * rate, trade_id))
+            self._books = {}
+            for symbol, (stops, targets) in staged.items():
+                self._books[symbol] = book = TriggerBook()
+                book.extend(stops, targets)
+            self._levels = {trade_id: entry for trade_id, entry in levels.items() if entry is not None}
+            self._pending = None
+            self.loaded = True
+        logger.info("Alert engine loaded %d trades with stop or target levels", len(self._levels))
+
+    def set_levels(self, trade_id, user_id, market, stop=None, target=None):
+        """Arm the trade's levels, replacing earlier ones; None for both disarms it"""
+        rate = quote_usd_rate(market)
+        armed = (stop is not None or target is not None) and rate is not None
+        entry = (user_id, market, stop, target) if armed else None
+        with self._lock:
+            if self._pending is not None:
+                self._pending[trade_id] = entry
+            if not self.loaded:
+                return
+            self._discard(trade_id)
+            if entry is not None:
+                self._levels[trade_id] = entry
+                self._books.setdefault(base_symbol(market), TriggerBook()).add(
+                    trade_id, _usd(stop, rate), _usd(target, rate))
+
+    def remove(self, trade_id):
+        """Disarm a trade, e.g. once it is closed"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[trade_id] = None
+            if self.loaded:
+                self._discard(trade_id)
+
+    def _discard(self, trade_id):
+        entry = self._levels.pop(trade_id, None)
+        if entry is not None:
+            _, market, stop, target = entry
+            rate = quote_usd_rate(market)
+            self._books[base_symbol(market)].remove(trade_id, _usd(stop, rate), _usd(target, rate))
+
+    def on_quotes(self, quotes):
+        """Fire every trigger reached by the {symbol: price} quotes; returns the alerts queued"""
+        alerts = []
+        fired_at = datetime.utcnow().isoformat()
+        with self._lock:
+            for symbol, price in quotes.items():
+                book = self._books.get(symbol)
+                if not book:
+                    continue
+                for kind, trade_id, _ in book.cross(price):
+                    user_id, market, stop, target = self._levels[trade_id]
+                    # Reported in the market's own currency; the trade's other level stays armed
+                    quote_price = price / quote_usd_rate(market)
+                    if kind == 'stop':
+                        level, stop = stop, None
+                    else:
+                        level, target = target, None
+                    if stop is None and target is None:
+                        del self._levels[trade_id]
+                    else:
+                        self._levels[trade_id] = (user_id, market, stop, target)
+                    alerts.append({'tradeId': trade_id, 'userId': user_id, 'market': market, 'kind': kind,
+                                   'level': level, 'price': quote_price, 'firedAt': fired_at})
+
+        dropped = 0
+        for alert in alerts:
+            try:
+                self.queue.put_nowait(alert)
+            except queue.Full:
+                dropped += 1
+        if dropped:
+            self.dropped += dropped
+            logger.warning("Alert queue full; dropped %d alert(s)", dropped)
+        return alerts
+
+    def drain(self, max_items=None):
+        """Take queued alerts without blocking"""
+        alerts = []
+        while max_items is None or len(alerts) < max_items:
+            try:
+                alerts.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return alerts
+
+    def attach(self, app, quote_cache):
+        """Check triggers on every quote cache update, loading open trades on the first one"""
+        def on_update(quotes):
+            if not self.loaded:
+                with app.app_context():
+                    try:
+                        self.load_open_trades()
+                    except Exception as e:
+                        logger.error("Loading alert triggers failed: %s", e)
+                        return
+                    finally:
+                        db.session.remove()
+            self.on_quotes(quotes)
+
+        quote_cache.add_listener(on_update)
+
+
+def claim_alert(alert):
+    """Clear the fired level on the trade; False if it was already cleared or changed, e.g. by another process"""
+    column = Trade.stop_price if alert['kind'] == 'stop' else Trade.target_price
+    try:
+        result = db.session.execute(
+            update(Trade).where(Trade.id == alert['tradeId'], column == alert['level']).values({column.key: None})
+        )
+        db.session.commit()
+        return result.rowcount == 1
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def log_alert(alert):
+    logger.info("%s reached for trade %s (%s, user %s): price %s vs level %s", alert['kind'].capitalize(),
+                alert['tradeId'], alert['market'], alert['userId'], alert['price'], alert['level'], extra={'alert': alert})
+
+
+class AlertDispatcher:
+    """Background thread handing queued alerts to delivery handlers.
+
+    With an app, each alert is first claimed in the database and skipped
+    if the claim fails, so every level is delivered once across restarts
+    and processes.
+    """
+
+    def __init__(self, engine, handlers=None, app=None):
+        self.engine = engine
+        self.handlers = handlers or [log_alert]
+        self.app = app
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                alert = self.engine.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if self.app is not None and not self._claim(alert):
+                continue
+            for handler in self.handlers:
+                try:
+                    handler(alert)
+                except Exception as e:
+                    logger.error("Alert delivery failed: %s", e)
+
+    def _claim(self, alert):
+        with self.app.app_context():
+            try:
+                return claim_alert(alert)
+            except Exception as e:
+                logger.error("Claiming alert for trade %s failed: %s", alert['tradeId'], e)
+                return False
+            finally:
+                db.session.remove()
+
+
+def read_ticks(path):
+    """(symbol, price) pairs from a CSV tick file with `symbol` and `price` columns, in file order"""
+    with open(path, newline='') as stream:
+        for row in csv.DictReader(stream):
+            yield base_symbol(row['symbol']), float(row['price'])
+
+
+def replay(engine, ticks):
+    """Feed recorded ticks through the engine one at a time; returns every alert fired"""
+    alerts = []
+    for symbol, price in ticks:
+        alerts.extend(engine.on_quotes({symbol: price}))
+    return alerts
+
+
+# Shared by the calculator and the quote cache listener in this process
+alert_engine = AlertEngine()
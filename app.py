@@ -1,25 +1,40 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, Response, stream_with_context
 import os
 import logging
-from financial_calculator import TradeCalculator
-import numpy as np
-import pandas as pd
-import traceback
+from financial_calculator import TradeCalculator, BatchValidationError, POSITION_ERRORS, calculate_position_sizes, position_size_grid
+from price_worker import PriceRefreshWorker
+import json
+import math
+import time
+import click
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from models.user import db, User
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from models.user import db, User, Trade
+import alert_engine
+import database
+import instrumentation
+import portfolio_rollup
+import serializers
+import structured_logging
+import trade_export
+from user_cache import user_cache
+
+# JSON logs written from a background thread; see structured_logging for the LOG_* settings
+structured_logging.configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.json = serializers.FastJSONProvider(app)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY") or "a secret key"
 
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///investment_calculator.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = database.database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
+# Request timing, per-request SQL accounting, opt-in profiling and /metrics
+instrumentation.init_app(app)
+
 # Flask-Login configuration
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -28,11 +43,17 @@ login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 # Initialize the trade calculator
 trade_calculator = TradeCalculator()
 
+# Background price refresh keeps quotes off the request path
+price_worker = PriceRefreshWorker(app, trade_calculator)
+
+# Stop/target alerts fire on quote updates and are delivered off the request path
+alert_dispatcher = alert_engine.AlertDispatcher(trade_calculator.alert_engine, app=app)
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -97,6 +118,41 @@ def summary():
     summary_data = trade_calculator.get_summary()
     return render_template('summary.html', active_page='summary', summary=summary_data)
 
+# An open stream occupies a worker thread for its whole life, so the app must
+# be served by a threaded or async server (app.run is started with
+# threaded=True; under gunicorn use --threads or a gevent worker, never plain
+# sync workers). Short streams keep that cost bounded; browsers reconnect.
+SUMMARY_STREAM_MAX_SECONDS = int(os.environ.get('SUMMARY_STREAM_MAX_SECONDS', 60))
+SUMMARY_STREAM_KEEPALIVE_SECONDS = 15
+
+@app.route('/summary/stream')
+@login_required
+def summary_stream():
+    user_id = current_user.id
+    quote_cache = trade_calculator.quote_cache
+
+    def generate():
+        # Streams end after a while; EventSource reconnects on its own
+        deadline = time.monotonic() + SUMMARY_STREAM_MAX_SECONDS
+        state = None
+        yield "retry: 5000\n\n"
+        while time.monotonic() < deadline:
+            version = quote_cache.version
+            state, changes = trade_calculator.price_update(user_id, state)
+            # Don't hold a DB connection while waiting for the next tick
+            db.session.remove()
+            if changes['quotes'] or 'totalProfitLoss' in changes:
+                yield f"event: prices\ndata: {json.dumps(changes)}\n\n"
+            else:
+                yield ": keepalive\n\n"
+            quote_cache.wait_for_update(version, timeout=SUMMARY_STREAM_KEEPALIVE_SECONDS)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/calculate', methods=['POST'])
 def calculate():
     try:
@@ -105,7 +161,7 @@ def calculate():
             return jsonify({"error": "No data provided"}), 400
 
         # Log incoming request
-        logger.info(f"Calculate request received: {data}")
+        logger.debug("Calculate request received: %s", data)
 
         # Validate and convert numeric inputs
         try:
@@ -114,11 +170,11 @@ def calculate():
             entry_price = float(data.get('entryPrice', 0))
             exit_price = float(data.get('exitPrice', 0))
         except (ValueError, TypeError) as e:
-            logger.error(f"Invalid numeric input: {str(e)}")
+            logger.warning("Invalid numeric input: %s", e)
             return jsonify({"error": "Invalid numeric values provided"}), 400
 
         # Validate inputs
-        if any(pd.isna([capital_total, risk_percentage, entry_price, exit_price])):
+        if any(math.isnan(v) for v in [capital_total, risk_percentage, entry_price, exit_price]):
             return jsonify({"error": "Invalid numerical values provided"}), 400
 
         if any(v <= 0 for v in [capital_total, entry_price, exit_price]):
@@ -144,11 +200,170 @@ def calculate():
             'totalPositionValue': round(total_position_value, 2)
         }
 
-        logger.info(f"Calculation successful: {result}")
+        logger.debug("Calculation successful: %s", result)
+        return jsonify(result)
+
+    except Exception as e:
+        logger.exception("Unexpected error")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+BATCH_INPUT_FIELDS = ['capitalTotal', 'riskPercentage', 'entryPrice', 'exitPrice']
+BATCH_MAX_SCENARIOS = int(os.environ.get('BATCH_MAX_SCENARIOS', 2_000_000))
+
+@app.route('/calculate/batch', methods=['POST'])
+def calculate_batch():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        is_grid = bool(data.get('grid'))
+        spec = data['grid'] if is_grid else data.get('scenarios')
+        if not isinstance(spec, dict):
+            return jsonify({"error": "Provide either 'scenarios' or 'grid'"}), 400
+
+        missing_fields = [field for field in BATCH_INPUT_FIELDS if field not in spec]
+        if missing_fields:
+            return jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
+
+        inputs = [spec[field] for field in BATCH_INPUT_FIELDS]
+        lengths = [len(values) if isinstance(values, list) else 1 for values in inputs]
+        count = math.prod(lengths) if is_grid else max(lengths)
+        if count > BATCH_MAX_SCENARIOS:
+            return jsonify({"error": f"Too many scenarios (maximum {BATCH_MAX_SCENARIOS})"}), 400
+
+        try:
+            if is_grid:
+                inputs = position_size_grid(*inputs)
+            results = calculate_position_sizes(*inputs)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid scenario arrays: {str(e)}"}), 400
+
+        count = len(results['error'])
+
+        error_rows = results['error'].nonzero()[0]
+        response = {'count': count}
+        for key in ['capitalAtRisk', 'riskPerUnit', 'positionSize', 'totalPositionValue']:
+            values = results[key].tolist()
+            for row in error_rows.tolist():
+                values[row] = None
+            response[key] = values
+        response['errors'] = [
+            {'row': row, 'error': POSITION_ERRORS[code]}
+            for row, code in zip(error_rows.tolist(), results['error'][error_rows].tolist())
+        ]
+
+        logger.info("Batch calculation: %d scenarios, %d invalid", count, len(error_rows))
+        return jsonify(response)
+
+    except Exception as e:
+        logger.exception("Unexpected error in calculate_batch")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+def risk_model(user_id, stop_percentage=None, win_rate=None, payoff=None):
+    """Simulation model from an explicit win rate and payoff, else from the user's sale history"""
+    import monte_carlo
+
+    if win_rate is not None or payoff is not None:
+        if win_rate is None or payoff is None:
+            raise ValueError("Provide both winRate and payoff")
+        return monte_carlo.parametric_model(win_rate, payoff)
+    return monte_carlo.history_model(trade_calculator.sale_return_percentages(user_id), stop_percentage)
+
+@app.route('/simulate/risk', methods=['POST'])
+@login_required
+def simulate_risk():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        if 'riskPercentage' not in data:
+            return jsonify({"error": "Missing required fields: riskPercentage"}), 400
+
+        import monte_carlo
+
+        try:
+            def optional_float(field):
+                return float(data[field]) if data.get(field) is not None else None
+
+            stop_percentage = optional_float('stopPercentage')
+            if stop_percentage is None and 'entryPrice' in data and 'exitPrice' in data:
+                # Same risk per unit as /calculate, as a share of the entry price
+                entry_price, exit_price = float(data['entryPrice']), float(data['exitPrice'])
+                if entry_price <= 0:
+                    return jsonify({"error": "Values must be greater than zero"}), 400
+                stop_percentage = abs(entry_price - exit_price) / entry_price * 100
+            model = risk_model(current_user.id, stop_percentage, optional_float('winRate'), optional_float('payoff'))
+            result = monte_carlo.simulate(
+                model,
+                risk_percentage=float(data['riskPercentage']),
+                trades=int(data.get('trades', 100)),
+                paths=int(data.get('paths', 100_000)),
+                ruin_threshold=float(data.get('ruinThreshold', 50)),
+                capital_total=float(data.get('capitalTotal', 1)),
+                seed=data.get('seed'),
+                time_budget=optional_float('timeBudget')
+            )
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        logger.info("Risk simulation: %d paths of %d trades in %ss",
+                    result['paths'], result['trades'], result['elapsedSeconds'])
+        return jsonify(result)
+
+    except Exception as e:
+        logger.exception("Unexpected error in simulate_risk")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+@app.route('/backtest', methods=['POST'])
+@login_required
+def run_backtest():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        required_fields = ['market', 'capitalTotal', 'riskPercentage', 'stopPercentage']
+        missing_fields = [field for field in required_fields if field not in data]
+        if missing_fields:
+            return jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
+        for field in ('from', 'to'):
+            value = data.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (str, int))):
+                return jsonify({"error": f"'{field}' must be an ISO date string or epoch seconds"}), 400
+
+        import backtest
+        import candle_store
+
+        try:
+            candles = candle_store.CandleStore().read(
+                data['market'], start=data.get('from'), end=data.get('to'), timeframe=data.get('timeframe', '1m'))
+            if not len(candles):
+                return jsonify({"error": f"No candles stored for {data['market']}"}), 404
+            # Longer windows can't fit in the range, and the exit search allocates per held bar
+            too_long = [field for field in ('fastPeriod', 'slowPeriod', 'maxHoldBars')
+                        if field in data and int(data[field]) > len(candles)]
+            if too_long:
+                return jsonify({"error": f"{', '.join(too_long)} cannot exceed the {len(candles)} bars in range"}), 400
+            result = backtest.backtest(
+                candles,
+                capital_total=float(data['capitalTotal']),
+                risk_percentage=float(data['riskPercentage']),
+                stop_percentage=float(data['stopPercentage']),
+                reward_ratio=float(data.get('rewardRatio', 2)),
+                fast=int(data.get('fastPeriod', 20)),
+                slow=int(data.get('slowPeriod', 50)),
+                max_hold=int(data.get('maxHoldBars', 500))
+            )
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        logger.info("Backtest of %s: %d bars, %d trades in %ss",
+                    data['market'], result['bars'], result['trades'], result['elapsedSeconds'])
         return jsonify(result)
 
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Unexpected error in run_backtest")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 @app.route('/add_trade', methods=['POST'])
@@ -160,7 +375,7 @@ def add_trade():
             return jsonify({"error": "No data provided"}), 400
 
         # Log incoming request
-        logger.info(f"Add trade request received: {data}")
+        logger.debug("Add trade request received: %s", data)
 
         # Validate required fields
         required_fields = ['market', 'entryPrice', 'units']
@@ -173,24 +388,24 @@ def add_trade():
             trade = trade_calculator.add_trade(
                 market=data['market'],
                 entry_price=data['entryPrice'],
-                units=data['units']
+                units=data['units'],
+                stop_price=data.get('stopPrice'),
+                target_price=data.get('targetPrice')
             )
 
-            # Get trades data
-            trades_data = trade_calculator.get_trades_json()
-            
-            logger.info(f"Trade added successfully: {trade}")
+            price_worker.request_refresh()
+
+            logger.info("Trade %s added in %s", trade['id'], trade['Market'])
             return jsonify({
-                'trades': trades_data,
                 'newTrade': trade
             })
 
         except ValueError as e:
-            logger.error(f"Trade validation error: {str(e)}")
+            logger.warning("Trade validation error: %s", e)
             return jsonify({"error": str(e)}), 400
 
     except Exception as e:
-        logger.error(f"Unexpected error in add_trade: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Unexpected error in add_trade")
         return jsonify({"error": "An unexpected error occurred while processing the trade"}), 500
 
 @app.route('/sell_units/<int:trade_id>', methods=['POST'])
@@ -202,7 +417,7 @@ def sell_units(trade_id):
             return jsonify({"error": "No data provided"}), 400
 
         # Log incoming request
-        logger.info(f"Sell units request received for trade {trade_id}: {data}")
+        logger.debug("Sell units request received for trade %s: %s", trade_id, data)
 
         required_fields = ['units', 'exitPrice']
         missing_fields = [field for field in required_fields if field not in data]
@@ -217,26 +432,129 @@ def sell_units(trade_id):
                 exit_price=data['exitPrice']
             )
 
-            # Get updated trades data and sales history
-            trades_data = trade_calculator.get_trades_json()
+            # Get updated sales history for this trade only
             sales_history = trade_calculator.get_trade_sales_history(trade_id)
             
-            logger.info(f"Units sold successfully: {result}")
+            logger.info("Sold %s units of trade %s", result['sale']['Units Sold'], trade_id)
             return jsonify({
-                'trades': trades_data,
                 'salesHistory': sales_history,
                 'sale': result['sale'],
                 'updatedTrade': result['updated_trade']
             })
 
         except ValueError as e:
-            logger.error(f"Sale validation error: {str(e)}")
+            logger.warning("Sale validation error: %s", e)
             return jsonify({"error": str(e)}), 400
 
     except Exception as e:
-        logger.error(f"Unexpected error in sell_units: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Unexpected error in sell_units")
         return jsonify({"error": "An unexpected error occurred while processing the sale"}), 500
 
+@app.route('/api/trades/batch', methods=['POST'])
+@login_required
+def api_trades_batch():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        logger.debug("Batch request received: %s", data)
+
+        try:
+            result = trade_calculator.apply_batch(data.get('operations'))
+        except BatchValidationError as e:
+            logger.warning("Batch validation error: %s", e)
+            return jsonify({"error": str(e), "errors": e.errors}), 400
+        except ValueError as e:
+            logger.warning("Batch validation error: %s", e)
+            return jsonify({"error": str(e)}), 400
+
+        if result['newTrades']:
+            price_worker.request_refresh()
+        logger.info("Batch applied: %d trades added, %d sales", len(result['newTrades']), len(result['sales']))
+        return jsonify(result)
+
+    except Exception as e:
+        logger.exception("Unexpected error in api_trades_batch")
+        return jsonify({"error": "An unexpected error occurred while processing the batch"}), 500
+
+@app.route('/trades/<int:trade_id>/levels', methods=['POST'])
+@login_required
+def set_trade_levels(trade_id):
+    try:
+        data = request.get_json()
+        if data is None:
+            return jsonify({"error": "No data provided"}), 400
+
+        try:
+            trade = trade_calculator.set_trade_levels(
+                trade_id,
+                stop_price=data.get('stopPrice'),
+                target_price=data.get('targetPrice')
+            )
+            return jsonify({'updatedTrade': trade})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        logger.exception("Unexpected error in set_trade_levels")
+        return jsonify({"error": "An unexpected error occurred while setting alert levels"}), 500
+
+@app.route('/api/trades')
+@login_required
+def api_trades():
+    try:
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+        trades_data, next_cursor = trade_calculator.get_trades_page(
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            market=request.args.get('market'),
+            status=request.args.get('status'),
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to')
+        )
+        return jsonify({'trades': trades_data, 'nextCursor': next_cursor})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error listing trades")
+        return jsonify({"error": "Failed to retrieve trades"}), 500
+
+@app.route('/api/summary')
+@login_required
+def api_summary():
+    try:
+        etag, summary_data = trade_calculator.get_versioned_summary(currency=request.args.get('currency'))
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = jsonify(summary_data)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error building summary")
+        return jsonify({"error": "Failed to retrieve summary"}), 500
+
+@app.route('/api/equity')
+@login_required
+def api_equity():
+    try:
+        curve = trade_calculator.get_equity_curve(
+            interval=request.args.get('interval', 'day'),
+            market=request.args.get('market'),
+            window=request.args.get('window', type=int),
+            currency=request.args.get('currency')
+        )
+        return jsonify(curve)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error building equity curve")
+        return jsonify({"error": "Failed to retrieve equity curve"}), 500
+
 @app.route('/get_sales_history/<int:trade_id>')
 @login_required
 def get_sales_history(trade_id):
@@ -244,12 +562,235 @@ def get_sales_history(trade_id):
         sales_history = trade_calculator.get_trade_sales_history(trade_id)
         return jsonify({'salesHistory': sales_history})
     except Exception as e:
-        logger.error(f"Error retrieving sales history: {str(e)}")
+        logger.exception("Error retrieving sales history")
         return jsonify({"error": "Failed to retrieve sales history"}), 500
 
-# Create database tables
-with app.app_context():
-    db.create_all()
+@app.route('/import/trades', methods=['POST'])
+@login_required
+def import_trades():
+    try:
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({"error": "No file provided"}), 400
+
+        fmt = request.args.get('format') or ('jsonl' if upload.filename.endswith(('.jsonl', '.ndjson')) else 'csv')
+        logger.info("Import request received: %s (%s)", upload.filename, fmt)
+
+        try:
+            # pandas is only loaded once someone imports a file
+            import trade_import
+            report = trade_import.import_trades(upload.stream, current_user.id, fmt=fmt)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify(report)
+
+    except Exception as e:
+        logger.exception("Unexpected error in import_trades")
+        return jsonify({"error": "An unexpected error occurred while importing trades"}), 500
+
+@app.route('/export/<any(trades, sales):kind>')
+@login_required
+def export_data(kind):
+    fmt = request.args.get('format', 'csv')
+    try:
+        stream = trade_export.export_stream(kind, current_user.id, fmt=fmt)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    extension = 'jsonl' if fmt == 'ndjson' else fmt
+    return Response(
+        stream_with_context(stream),
+        mimetype=trade_export.EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={kind}.{extension}'}
+    )
+
+@app.cli.command('export-data')
+@click.argument('kind', type=click.Choice(['trades', 'sales']))
+@click.option('--email', required=True, help='Owner of the exported rows')
+@click.option('--format', 'fmt', type=click.Choice(list(trade_export.EXPORT_FORMATS)), default='csv')
+@click.option('--output', type=click.File('wb'), default='-', help='Output file (default: stdout)')
+@click.option('--chunk-size', type=int, default=5000)
+def export_data_command(kind, email, fmt, output, chunk_size):
+    """Stream trades or sales to CSV, NDJSON or Parquet."""
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        raise click.ClickException(f"No user with email {email}")
+    try:
+        for piece in trade_export.export_stream(kind, user.id, fmt=fmt, chunk_size=chunk_size):
+            output.write(piece)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+@app.cli.command('import-trades')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--email', required=True, help='Owner of the imported trades')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None)
+@click.option('--chunk-size', type=int, default=10000)
+def import_trades_command(path, email, fmt, chunk_size):
+    """Bulk import trade history from a CSV or JSONL file."""
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        raise click.ClickException(f"No user with email {email}")
+
+    import trade_import
+
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, 'rb') as stream:
+        report = trade_import.import_trades(
+            stream, user.id, fmt=fmt, chunk_size=chunk_size,
+            progress=lambda r: click.echo(f"{r['rowsRead']} rows read, {r['tradesImported']} trades imported, "
+                                          f"{r['errorCount']} errors", err=True)
+        )
+    for error in report['errors']:
+        click.echo(f"Row {error['row']}: {error['error']}", err=True)
+    click.echo(f"Imported {report['tradesImported']} trades and {report['salesImported']} sales "
+               f"({report['errorCount']} rows rejected)")
+
+@app.cli.command('simulate-risk')
+@click.option('--email', required=True, help='User whose sale history is sampled')
+@click.option('--risk', type=float, required=True, help='Percentage of equity risked per trade')
+@click.option('--stop', type=float, default=None, help='Stop distance as a percentage of the entry price')
+@click.option('--win-rate', type=float, default=None, help='Win rate (%) instead of the sale history')
+@click.option('--payoff', type=float, default=None, help='Average win / average loss, with --win-rate')
+@click.option('--trades', type=int, default=100, show_default=True)
+@click.option('--paths', type=int, default=1_000_000, show_default=True)
+@click.option('--ruin-threshold', type=float, default=50, show_default=True, help='Drawdown (%) counted as ruin')
+@click.option('--seed', type=int, default=None)
+@click.option('--time-budget', type=float, default=None, help='Seconds before pending paths are dropped')
+def simulate_risk_command(email, risk, stop, win_rate, payoff, trades, paths, ruin_threshold, seed, time_budget):
+    """Monte Carlo drawdown and risk-of-ruin distribution for a position-sizing policy."""
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        raise click.ClickException(f"No user with email {email}")
+
+    import monte_carlo
+
+    try:
+        model = risk_model(user.id, stop, win_rate, payoff)
+        result = monte_carlo.simulate(model, risk, trades=trades, paths=paths, ruin_threshold=ruin_threshold,
+                                      seed=seed, time_budget=time_budget)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        monte_carlo.shutdown()
+    click.echo(json.dumps(result, indent=2))
+
+@app.cli.command('replay-ticks')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def replay_ticks_command(path):
+    """Replay a CSV tick file (symbol,price) against the open trades' stop and target levels."""
+    engine = alert_engine.AlertEngine(queue_size=0)
+    engine.load_open_trades()
+    started = time.perf_counter()
+    alerts = alert_engine.replay(engine, alert_engine.read_ticks(path))
+    for alert in alerts:
+        click.echo(json.dumps(alert))
+    click.echo(f"{len(alerts)} alert(s) fired in {time.perf_counter() - started:.3f}s", err=True)
+
+@app.cli.command('import-candles')
+@click.argument('market')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--timeframe', default='1m', show_default=True)
+def import_candles_command(market, path, timeframe):
+    """Append OHLCV bars from a CSV (time,open,high,low,close[,volume]) to the candle store."""
+    import candle_store
+
+    try:
+        written = candle_store.CandleStore().import_file(market, path, timeframe)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Appended {written} {timeframe} bar(s) for {market.upper()}")
+
+@app.cli.command('backtest')
+@click.argument('market')
+@click.option('--timeframe', default='1m', show_default=True)
+@click.option('--from', 'start', default=None, help='First bar time (ISO date)')
+@click.option('--to', 'end', default=None, help='End of the range, exclusive (ISO date)')
+@click.option('--capital', type=float, default=10000, show_default=True)
+@click.option('--risk', type=float, default=1, show_default=True, help='Percentage of capital risked per trade')
+@click.option('--stop', type=float, default=2, show_default=True, help='Stop distance below entry (%)')
+@click.option('--reward', type=float, default=2, show_default=True, help='Target distance as a multiple of the stop')
+@click.option('--fast', type=int, default=20, show_default=True)
+@click.option('--slow', type=int, default=50, show_default=True)
+@click.option('--max-hold', type=int, default=500, show_default=True, help='Bars before a time exit')
+def backtest_command(market, timeframe, start, end, capital, risk, stop, reward, fast, slow, max_hold):
+    """Backtest /calculate position sizing on stored candles with an SMA crossover entry."""
+    import backtest
+    import candle_store
+
+    try:
+        candles = candle_store.CandleStore().read(market, start=start, end=end, timeframe=timeframe)
+        if not len(candles):
+            raise click.ClickException(f"No candles stored for {market.upper()}")
+        result = backtest.backtest(candles, capital, risk, stop, reward, fast, slow, max_hold)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(json.dumps(result, indent=2))
+
+@app.cli.command('rebuild-rollups')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user')
+def rebuild_rollups(user_id):
+    """Recompute portfolio_stats from the trade and sale tables."""
+    drifted = portfolio_rollup.rebuild(user_id)
+    click.echo(f"Portfolio rollups rebuilt; {drifted} market row(s) had drifted")
+
+@app.cli.command('copy-database')
+@click.argument('target_url')
+@click.option('--chunk-size', default=5000, show_default=True, type=int)
+def copy_database_command(target_url, chunk_size):
+    """Copy every table into an empty database at TARGET_URL, e.g. SQLite to PostgreSQL."""
+    target_url = database.normalize_url(target_url)
+    try:
+        copied = database.copy_database(db.metadata, db.engine, target_url, chunk_size=chunk_size)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for table, rows in copied.items():
+        click.echo(f"{table}: {rows} row(s)")
+    click.echo("Set DATABASE_URL to the target to switch over")
+
+def init_db():
+    """Create missing tables, columns and indexes and drop an out-of-date rollup table"""
+    with app.app_context():
+        portfolio_rollup.ensure_schema()
+        for name in database.add_missing_columns(db.engine, Trade.__table__):
+            logger.info("Added column trade.%s", name)
+        db.create_all()
+        # create_all skips indexes on tables that already exist
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or migrate the database schema."""
+    init_db()
+    click.echo("Database schema is up to date")
+
+_background_started = False
+
+def start_background_services():
+    """Start price refresh, alert delivery and candle recording threads; call once from the server entry point.
+
+    Nothing starts at import, so CLI commands, tests and the Monte Carlo
+    pool's spawned workers (which re-import __main__) stay free of pollers.
+    Under a multi-process server, enable them (PRICE_WORKER_ENABLED=1) in
+    one process only.
+    """
+    global _background_started
+    if _background_started or os.environ.get('PRICE_WORKER_ENABLED', '1') != '1':
+        return
+    _background_started = True
+    trade_calculator.alert_engine.attach(app, trade_calculator.quote_cache)
+    alert_dispatcher.start()
+    if os.environ.get('CANDLE_RECORDING', '0') == '1':
+        import candle_store
+
+        candle_recorder = candle_store.CandleRecorder(candle_store.CandleStore(), os.getenv('CANDLE_TIMEFRAME', '1m'))
+        trade_calculator.quote_cache.add_listener(candle_recorder.on_quotes)
+    price_worker.start()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    init_db()
+    start_background_services()
+    app.run(host='0.0.0.0', port=5000, threaded=True)
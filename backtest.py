@@ -0,0 +1,127 @@
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Entries x holding bars examined per exit-search block; bounds memory
+EXIT_SEARCH_CELLS = 4_000_000
+
+
+def sma_crossover_entries(close, fast, slow):
+    """Bars where the fast simple moving average crosses above the slow one"""
+    if len(close) <= slow:
+        return np.empty(0, dtype=np.int64)
+    sums = np.concatenate([[0.0], np.cumsum(close, dtype=np.float64)])
+    fast_ma = (sums[fast:] - sums[:-fast]) / fast
+    slow_ma = (sums[slow:] - sums[:-slow]) / slow
+    # Both aligned so index k is bar k + slow - 1
+    above = fast_ma[slow - fast:] > slow_ma
+    return np.flatnonzero(above[1:] & ~above[:-1]) + slow
+
+
+def find_exits(candles, entries, stop, target, max_hold):
+    """First bar after each entry whose range reaches the stop or target, else the last bar held.
+
+    Returns (exit bar, exit price, outcome) with outcome -1 for a stop, 1
+    for a target and 0 for a time exit. A bar reaching both counts as a
+    stop, and a bar opening beyond a level fills at its open.
+    """
+    open_, high, low, close = (np.asarray(candles[f]) for f in ('open', 'high', 'low', 'close'))
+    n = len(close)
+    # Row i holds bars i .. i + max_hold - 1, padded past the end so no window runs short
+    lows = sliding_window_view(np.concatenate([low, np.full(max_hold, np.inf)]), max_hold)
+    highs = sliding_window_view(np.concatenate([high, np.full(max_hold, -np.inf)]), max_hold)
+
+    exit_bar = np.empty(len(entries), dtype=np.int64)
+    outcome = np.empty(len(entries), dtype=np.int8)
+    block = max(1, EXIT_SEARCH_CELLS // max_hold)
+    for lo in range(0, len(entries), block):
+        first_bar = entries[lo:lo + block] + 1
+        hit_stop = lows[first_bar] <= stop[lo:lo + block, None]
+        hit = hit_stop | (highs[first_bar] >= target[lo:lo + block, None])
+        offset = hit.argmax(axis=1)
+        reached = hit[np.arange(len(first_bar)), offset]
+        exit_bar[lo:lo + block] = np.where(reached, first_bar + offset, np.minimum(first_bar + max_hold - 1, n - 1))
+        stopped = reached & hit_stop[np.arange(len(first_bar)), offset]
+        outcome[lo:lo + block] = np.where(stopped, -1, np.where(reached, 1, 0))
+
+    price = np.where(outcome == -1, np.minimum(open_[exit_bar], stop),
+                     np.where(outcome == 1, np.maximum(open_[exit_bar], target), close[exit_bar]))
+    return exit_bar, price, outcome
+
+
+def one_position_at_a_time(entries, exit_bars):
+    """Indexes of the entries taken when a new position opens only after the previous one exits"""
+    next_free = np.searchsorted(entries, exit_bars, side='right')
+    taken = []
+    i = 0
+    while i < len(entries):
+        taken.append(i)
+        i = next_free[i]
+    return np.asarray(taken, dtype=np.int64)
+
+
+def backtest(candles, capital_total, risk_percentage, stop_percentage, reward_ratio=2.0, fast=20, slow=50,
+             max_hold=500):
+    """Replay the /calculate position sizing over historical bars.
+
+    A long position opens at the close of every fast/slow SMA crossover
+    while flat, with its stop `stop_percentage` below the entry and its
+    target `reward_ratio` times that distance above. Each position is
+    sized like /calculate: capital at risk / risk per unit, with capital
+    compounding from the trades before it.
+    """
+    if capital_total <= 0 or stop_percentage <= 0 or reward_ratio <= 0:
+        raise ValueError("Values must be greater than zero")
+    if not 0 < risk_percentage <= 100:
+        raise ValueError("Risk percentage must be between 0 and 100")
+    if stop_percentage >= 100:
+        raise ValueError("Stop distance must be below 100%")
+    if not 1 <= fast < slow:
+        raise ValueError("Fast period must be at least 1 and below the slow period")
+    if max_hold < 1:
+        raise ValueError("Maximum holding period must be at least 1 bar")
+
+    started = time.perf_counter()
+    close = np.asarray(candles['close'])
+    # Holding past the last bar changes nothing, but the exit search pads every window to max_hold
+    max_hold = min(max_hold, max(len(close), 1))
+    entries = sma_crossover_entries(close, fast, slow)
+    entries = entries[entries < len(close) - 1]
+    entry_price = close[entries]
+    stop = entry_price * (1 - stop_percentage / 100)
+    target = entry_price * (1 + reward_ratio * stop_percentage / 100)
+    exit_bar, exit_price, outcome = find_exits(candles, entries, stop, target, max_hold)
+
+    taken = one_position_at_a_time(entries, exit_bar)
+    entry_price, stop, exit_price, outcome = entry_price[taken], stop[taken], exit_price[taken], outcome[taken]
+    # P/L of units = capital * risk / (entry - stop), as a fraction of the capital going in
+    r_multiple = (exit_price - entry_price) / (entry_price - stop)
+    equity = capital_total * np.cumprod(1 + risk_percentage / 100 * r_multiple)
+    peak = np.maximum.accumulate(np.concatenate([[capital_total], equity]))[1:]
+    elapsed = time.perf_counter() - started
+
+    def iso(epoch):
+        return datetime.fromtimestamp(int(epoch), tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+    trades = len(taken)
+    final_capital = float(equity[-1]) if trades else float(capital_total)
+    return {
+        'bars': len(close),
+        'start': iso(candles['time'][0]) if len(close) else None,
+        'end': iso(candles['time'][-1]) if len(close) else None,
+        'signals': len(entries),
+        'trades': trades,
+        'wins': int((r_multiple > 0).sum()),
+        'winRate': float((r_multiple > 0).mean() * 100) if trades else 0.0,
+        'stops': int((outcome == -1).sum()),
+        'targets': int((outcome == 1).sum()),
+        'timeExits': int((outcome == 0).sum()),
+        'avgR': float(r_multiple.mean()) if trades else 0.0,
+        'finalCapital': final_capital,
+        'totalReturnPct': (final_capital / capital_total - 1) * 100,
+        'maxDrawdownPct': float(((peak - equity) / peak).max() * 100) if trades else 0.0,
+        'elapsedSeconds': round(elapsed, 4),
+        'barsPerSecond': int(len(close) / elapsed) if elapsed > 0 else None,
+    }
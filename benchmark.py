@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""Reproducible benchmark of the calculator and route hot paths.
+
+Runs against a throwaway SQLite database filled by a seeded synthetic
+generator, with prices from the stub provider, and prints p50/p95 timings
+and peak memory per operation as JSON. Pass --baseline with an earlier
+result file to fail on regressions, and --concurrency to measure mixed
+summary/add_trade/sell_units throughput across worker processes.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+MARKETS = ['BTC/USDT', 'ETH/USDT', 'SOL/USDT', 'ADA/USDT', 'XRP/USDT', 'DOGE/USDT', 'DOT/USDT', 'LINK/USDT']
+BASE_PRICES = {'BTC': 65000.0, 'ETH': 2500.0, 'SOL': 150.0, 'ADA': 0.45, 'XRP': 0.6,
+               'DOGE': 0.12, 'DOT': 6.5, 'LINK': 14.0}
+
+
+def configure_environment(workdir):
+    """Point the app at a temp database and the stub price provider; must run before importing app"""
+    prices_path = os.path.join(workdir, 'prices.json')
+    with open(prices_path, 'w') as f:
+        json.dump(BASE_PRICES, f)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ['PRICE_PROVIDERS'] = 'stub'
+    os.environ['PRICE_STUB_FILE'] = prices_path
+    os.environ['PRICE_WORKER_ENABLED'] = '0'
+
+
+def generate_dataset(db, seed, users, trades_per_user, max_sales, markets):
+    """Seeded synthetic users x trades x sales x markets, bulk inserted; returns the user ids"""
+    from models.user import User, Trade, Sale
+    import portfolio_rollup
+
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    market_names = MARKETS[:markets]
+    user_ids = []
+    for u in range(users):
+        user = User(email=f"bench{u}@example.com")
+        user.set_password('benchmark')
+        db.session.add(user)
+        db.session.flush()
+        user_ids.append(user.id)
+
+        trades = []
+        for _ in range(trades_per_user):
+            market = rng.choice(market_names)
+            entry_price = round(BASE_PRICES[market.split('/')[0]] * rng.uniform(0.5, 1.5), 4)
+            units = round(rng.uniform(0.1, 10), 4)
+            trades.append(Trade(market=market, entry_price=entry_price, units=units, remaining_units=units,
+                                position_size=entry_price * units, user_id=user.id,
+                                date=start + timedelta(minutes=rng.randint(0, 500000))))
+        db.session.add_all(trades)
+        db.session.flush()
+
+        sales = []
+        for trade in trades:
+            for _ in range(rng.randint(0, max_sales)):
+                if rng.random() < 0.25:
+                    sold = trade.remaining_units
+                else:
+                    sold = round(trade.remaining_units * rng.uniform(0.1, 0.5), 4)
+                exit_price = round(trade.entry_price * rng.uniform(0.7, 1.4), 4)
+                pl = (exit_price - trade.entry_price) * sold
+                sales.append(Sale(units_sold=sold, exit_price=exit_price, partial_pl=pl,
+                                  partial_pl_percentage=(exit_price - trade.entry_price) / trade.entry_price * 100,
+                                  trade_id=trade.id, date=trade.date + timedelta(days=rng.randint(1, 60))))
+                trade.remaining_units -= sold
+                trade.position_size = trade.entry_price * trade.remaining_units
+                if trade.remaining_units == 0:
+                    break
+        db.session.add_all(sales)
+        db.session.commit()
+
+    portfolio_rollup.rebuild()
+    return user_ids
+
+
+def insert_payload_user(db, seed, rows):
+    """A user with `rows` trades and no sales, bulk inserted for serialization benchmarks"""
+    from sqlalchemy import insert
+    from models.user import User, Trade
+    import portfolio_rollup
+
+    rng = random.Random(seed)
+    user = User(email='payload@example.com')
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.flush()
+    start = datetime(2023, 1, 1)
+    trades = []
+    for i in range(rows):
+        market = rng.choice(MARKETS)
+        entry_price = round(BASE_PRICES[market.split('/')[0]] * rng.uniform(0.5, 1.5), 4)
+        units = round(rng.uniform(0.1, 10), 4)
+        trades.append({'market': market, 'entry_price': entry_price, 'units': units, 'remaining_units': units,
+                       'position_size': entry_price * units, 'user_id': user.id,
+                       'date': start + timedelta(minutes=i)})
+    db.session.execute(insert(Trade), trades)
+    db.session.commit()
+    portfolio_rollup.rebuild(user.id)
+    return user.id
+
+
+def legacy_trades_payload(app, user_id):
+    """The pre-serializer path: ORM objects, per-value pd.isna, stdlib JSON encoder"""
+    import pandas as pd
+    from flask.json.provider import DefaultJSONProvider
+    from financial_calculator import TradeCalculator
+    from models.user import Trade
+
+    trades = Trade.query.filter_by(user_id=user_id).all()
+    data = [{k: (v.isoformat() if isinstance(v, datetime) else None if pd.isna(v) else v)
+             for k, v in TradeCalculator.trade_to_dict(trade).items()} for trade in trades]
+    return DefaultJSONProvider(app).dumps({'trades': data}, separators=(',', ':'))
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    p95_index = max(0, int(round(0.95 * len(samples))) - 1)
+    return {
+        'n': len(samples),
+        'p50_ms': round(statistics.median(samples) * 1000, 3),
+        'p95_ms': round(samples[p95_index] * 1000, 3),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'min_ms': round(samples[0] * 1000, 3),
+    }
+
+
+def measure(fn, iterations, warmup):
+    """Time `fn` after warming it up, then run it once more under tracemalloc for its peak allocation"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = summarize(samples)
+    result['peak_kib'] = round(peak / 1024, 1)
+    return result
+
+
+def mixed_workload_worker(user_id, seconds, seed):
+    """One worker process: a mixed summary/add_trade/sell_units loop through the routes for `seconds`"""
+    from app import app
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rng = random.Random(seed)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    counts = {'summary': 0, 'add_trade': 0, 'sell_units': 0}
+    errors = 0
+    own_trades = []
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        roll = rng.random()
+        if roll < 0.5 or (roll >= 0.8 and not own_trades):
+            operation, response = 'summary', client.get('/api/summary')
+        elif roll < 0.8:
+            market = rng.choice(MARKETS)
+            operation, response = 'add_trade', client.post('/add_trade', json={
+                'market': market, 'entryPrice': BASE_PRICES[market.split('/')[0]], 'units': 10})
+            if response.status_code == 200:
+                own_trades.append(response.get_json()['newTrade']['id'])
+        else:
+            operation, response = 'sell_units', client.post(f"/sell_units/{rng.choice(own_trades)}", json={
+                'units': 0.01, 'exitPrice': 100})
+        if response.status_code == 200:
+            counts[operation] += 1
+        else:
+            errors += 1
+        response.close()
+    return counts, errors, time.perf_counter() - started
+
+
+def run_concurrency(user_ids, worker_counts, seconds, seed):
+    """Throughput of the mixed workload at each worker count, one process per worker"""
+    # spawn: each worker imports the app and opens its own connections
+    context = multiprocessing.get_context('spawn')
+    levels = []
+    for workers in worker_counts:
+        with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = [pool.submit(mixed_workload_worker, user_ids[i % len(user_ids)], seconds, seed + i)
+                       for i in range(workers)]
+            outcomes = [f.result() for f in futures]
+
+        by_operation = {}
+        for counts, _, _ in outcomes:
+            for operation, count in counts.items():
+                by_operation[operation] = by_operation.get(operation, 0) + count
+        levels.append({
+            'workers': workers,
+            'ops': sum(by_operation.values()),
+            # Each worker times its own loop, so app import time is excluded
+            'ops_per_second': round(sum(sum(counts.values()) / elapsed for counts, _, elapsed in outcomes), 1),
+            'errors': sum(errors for _, errors, _ in outcomes),
+            'by_operation': by_operation,
+        })
+    return levels
+
+
+def measure_import_time(repeat=3):
+    """Cold `import app` in fresh interpreters via -X importtime; best of `repeat` runs"""
+    script = "import sys, app; print(','.join(m for m in ('numpy', 'pandas') if m in sys.modules))"
+    best = None
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], capture_output=True,
+                                   text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        children, app_ms = [], None
+        for line in completed.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"; nesting is shown by
+            # indentation and a package's imports are listed just before it
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            depth = (len(name) - len(name.lstrip())) // 2
+            if depth == 0:
+                if name.strip() == 'app':
+                    app_ms = int(cumulative) / 1000
+                    break
+                children = []
+            elif depth == 1:
+                children.append((name.strip(), int(cumulative) / 1000))
+        if app_ms is None:
+            raise RuntimeError("app import not found in importtime output")
+        if best is None or app_ms < best['app_ms']:
+            best = {
+                'app_ms': round(app_ms, 1),
+                'heaviest_ms': {n: round(ms, 1) for n, ms in sorted(children, key=lambda c: -c[1])[:10]},
+                'scientific_modules_loaded': [m for m in completed.stdout.strip().split(',') if m],
+            }
+    return best
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='trade-benchmark-')
+    configure_environment(workdir)
+
+    import_time = measure_import_time()
+    from flask_login import login_user
+    from app import app, init_db, trade_calculator
+    from models.user import db, User, Trade
+    logging.getLogger().setLevel(logging.WARNING)
+    init_db()
+
+    rng = random.Random(args.seed)
+    results = {}
+    with app.app_context():
+        started = time.perf_counter()
+        user_ids = generate_dataset(db, args.seed, args.users, args.trades, args.max_sales, args.markets)
+        generate_seconds = time.perf_counter() - started
+        user_id = user_ids[0]
+
+        with app.test_request_context():
+            login_user(db.session.get(User, user_id))
+            calc = trade_calculator
+
+            results['get_summary'] = measure(calc.get_summary, args.iterations, args.warmup)
+            results['get_trades_json'] = measure(calc.get_trades_json, args.iterations, args.warmup)
+
+            def add_trade():
+                market = rng.choice(MARKETS[:args.markets])
+                calc.add_trade(market, BASE_PRICES[market.split('/')[0]], round(rng.uniform(1, 5), 4))
+            results['add_trade'] = measure(add_trade, args.iterations, args.warmup)
+
+            open_ids = [t.id for t in Trade.query.filter(Trade.user_id == user_id, Trade.remaining_units > 1)
+                        .order_by(Trade.id).all()]
+
+            def sell_units():
+                trade = db.session.get(Trade, rng.choice(open_ids))
+                calc.sell_units(trade.id, round(trade.remaining_units * 0.01, 6), trade.entry_price * 1.05)
+            results['sell_units'] = measure(sell_units, args.iterations, args.warmup)
+
+        if args.payload_rows:
+            payload_user_id = insert_payload_user(db, args.seed, args.payload_rows)
+            with app.test_request_context():
+                login_user(db.session.get(User, payload_user_id))
+                legacy = legacy_trades_payload(app, payload_user_id)
+                current = app.json.dumps({'trades': trade_calculator.get_trades_json()}, separators=(',', ':'))
+                assert current == legacy, 'serialized trades differ from the legacy output'
+                payload_iterations = max(3, args.iterations // 5)
+                results['trades_payload_legacy'] = measure(
+                    lambda: legacy_trades_payload(app, payload_user_id), payload_iterations, 1)
+                results['trades_payload'] = measure(
+                    lambda: app.json.dumps({'trades': trade_calculator.get_trades_json()}, separators=(',', ':')),
+                    payload_iterations, 1)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    def route(method, path, expected=200, **kwargs):
+        def call():
+            response = client.open(path, method=method, **kwargs)
+            assert response.status_code == expected, f"{method} {path} returned {response.status_code}"
+            response.close()
+        return call
+
+    calculate_body = {'capitalTotal': 10000, 'riskPercentage': 1, 'entryPrice': 100, 'exitPrice': 95}
+    results['POST /calculate'] = measure(route('POST', '/calculate', json=calculate_body),
+                                         args.iterations, args.warmup)
+    results['GET /summary'] = measure(route('GET', '/summary'), args.iterations, args.warmup)
+    results['GET /api/summary'] = measure(route('GET', '/api/summary'), args.iterations, args.warmup)
+    results['GET /api/trades'] = measure(route('GET', '/api/trades?limit=50'), args.iterations, args.warmup)
+    results['POST /add_trade'] = measure(
+        route('POST', '/add_trade', json={'market': 'BTC/USDT', 'entryPrice': 65000, 'units': 0.5}),
+        args.iterations, args.warmup)
+
+    concurrency = None
+    if args.concurrency:
+        worker_counts = [int(n) for n in args.concurrency.split(',')]
+        concurrency = run_concurrency(user_ids, worker_counts, args.concurrency_seconds, args.seed)
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'database': dialect,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'scale': {'users': args.users, 'trades_per_user': args.trades,
+                      'max_sales_per_trade': args.max_sales, 'markets': args.markets},
+            'payload_rows': args.payload_rows,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'import': import_time,
+            'generate_seconds': round(generate_seconds, 3),
+            # ru_maxrss is KiB on Linux
+            'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'results': results,
+        'concurrency': concurrency,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Names of operations whose p50 grew by more than `threshold` (a fraction) over the baseline"""
+    regressions = []
+    for name, result in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous and previous['p50_ms'] > 0 and result['p50_ms'] > previous['p50_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p50 {previous['p50_ms']}ms -> {result['p50_ms']}ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--trades', type=int, default=2000, help='trades per user')
+    parser.add_argument('--max-sales', type=int, default=3, help='max sales per trade')
+    parser.add_argument('--markets', type=int, default=len(MARKETS), choices=range(1, len(MARKETS) + 1))
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--payload-rows', type=int, default=100000,
+                        help='trades in the serialization payload benchmark (0 to skip)')
+    parser.add_argument('--concurrency', help='comma-separated worker counts for the mixed-workload run, e.g. 1,2,4')
+    parser.add_argument('--concurrency-seconds', type=float, default=5, help='duration of each concurrency level')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='earlier JSON report to compare p50 timings against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p50 slowdown, e.g. 0.2 for 20%%')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
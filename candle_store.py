@@ -0,0 +1,183 @@
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# One record per bar; times are bar open times in epoch seconds
+CANDLE_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8'),
+])
+TIMEFRAMES = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600, '4h': 14400, '1d': 86400}
+
+
+def to_epoch(value):
+    """Epoch seconds from an int, a datetime (naive means UTC) or an ISO date string"""
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        raise TypeError("Times must be epoch seconds, datetimes or ISO date strings")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+class CandleStore:
+    """Append-only OHLCV files per market and timeframe, read back as memory-mapped arrays.
+
+    Each file is a flat run of CANDLE_DTYPE records in time order, so a
+    range read is a binary search on the mapped times and a slice of the
+    mapping; no bytes are copied until the caller touches them. A partial
+    record left by an interrupted append is ignored.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.getenv('CANDLE_STORE_DIR', os.path.join('instance', 'candles'))
+        self._lock = threading.Lock()
+
+    def path(self, market, timeframe='1m'):
+        if timeframe not in TIMEFRAMES:
+            raise ValueError(f"Timeframe must be one of: {', '.join(TIMEFRAMES)}")
+        name = re.sub(r'[^A-Z0-9]+', '-', market.upper()).strip('-')
+        if not name:
+            raise ValueError("Market symbol is required")
+        return os.path.join(self.root, f"{name}.{timeframe}.ohlcv")
+
+    def markets(self):
+        """(market file name, timeframe) pairs present in the store"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(tuple(name[:-len('.ohlcv')].rsplit('.', 1))
+                      for name in os.listdir(self.root) if name.endswith('.ohlcv'))
+
+    def read(self, market, start=None, end=None, timeframe='1m'):
+        """Bars with start <= time < end as a read-only memory-mapped view"""
+        path = self.path(market, timeframe)
+        count = os.path.getsize(path) // CANDLE_DTYPE.itemsize if os.path.exists(path) else 0
+        if not count:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        candles = np.memmap(path, dtype=CANDLE_DTYPE, mode='r', shape=(count,))
+        times = candles['time']
+        lo = 0 if start is None else int(np.searchsorted(times, to_epoch(start), side='left'))
+        hi = count if end is None else int(np.searchsorted(times, to_epoch(end), side='left'))
+        return candles[lo:hi]
+
+    def last_time(self, market, timeframe='1m'):
+        candles = self.read(market, timeframe=timeframe)
+        return int(candles['time'][-1]) if len(candles) else None
+
+    def append(self, market, candles, timeframe='1m'):
+        """Append bars newer than the stored ones; returns how many were written"""
+        candles = np.sort(np.asarray(candles, dtype=CANDLE_DTYPE), order='time')
+        if not all(np.isfinite(candles[field]).all() for field in ('open', 'high', 'low', 'close')):
+            raise ValueError("Candles must have finite prices")
+        with self._lock:
+            last = self.last_time(market, timeframe)
+            if last is not None:
+                candles = candles[candles['time'] > last]
+            # Keep the last of any duplicated bar times
+            keep = np.append(candles['time'][1:] != candles['time'][:-1], True) if len(candles) else []
+            candles = candles[keep]
+            if not len(candles):
+                return 0
+            path = self.path(market, timeframe)
+            os.makedirs(self.root, exist_ok=True)
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as stream:
+                # Drop a partial record from an interrupted append before writing after it
+                stream.truncate(os.path.getsize(path) // CANDLE_DTYPE.itemsize * CANDLE_DTYPE.itemsize)
+                stream.seek(0, os.SEEK_END)
+                candles.tofile(stream)
+        return len(candles)
+
+    def import_file(self, market, path, timeframe='1m', chunk_size=500_000):
+        """Append bars from a CSV with time,open,high,low,close[,volume] columns; time in epoch seconds or ISO"""
+        import pandas as pd
+
+        written = 0
+        for chunk in pd.read_csv(path, chunksize=chunk_size):
+            chunk.columns = [str(c).strip().lower() for c in chunk.columns]
+            missing = [c for c in ('time', 'open', 'high', 'low', 'close') if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"Missing required columns: {', '.join(missing)}")
+            times = chunk['time']
+            if not pd.api.types.is_numeric_dtype(times):
+                times = (pd.to_datetime(times, utc=True) - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+            candles = np.empty(len(chunk), dtype=CANDLE_DTYPE)
+            candles['time'] = times.to_numpy(dtype=np.int64)
+            for field in ('open', 'high', 'low', 'close'):
+                candles[field] = chunk[field].to_numpy(dtype=float)
+            candles['volume'] = chunk['volume'].to_numpy(dtype=float) if 'volume' in chunk.columns else 0.0
+            written += self.append(market, candles, timeframe)
+        return written
+
+
+class CandleRecorder:
+    """Builds bars from quote updates and appends each one to the store once its period is over.
+
+    Quotes carry no volume, so recorded bars have a volume of zero.
+    """
+
+    def __init__(self, store, timeframe='1m', quote_currency='USD'):
+        self.store = store
+        self.timeframe = timeframe
+        self.period = TIMEFRAMES[timeframe]
+        self.quote_currency = quote_currency
+        self._bars = {}  # symbol -> [time, open, high, low, close]
+        self._lock = threading.Lock()
+
+    def on_quotes(self, quotes, now=None):
+        now = int(now if now is not None else time.time())
+        bar_time = now - now % self.period
+        finished = []
+        with self._lock:
+            for symbol, price in quotes.items():
+                bar = self._bars.get(symbol)
+                if bar is not None and bar[0] != bar_time:
+                    finished.append((symbol, bar))
+                    bar = None
+                if bar is None:
+                    self._bars[symbol] = [bar_time, price, price, price, price]
+                else:
+                    bar[2] = max(bar[2], price)
+                    bar[3] = min(bar[3], price)
+                    bar[4] = price
+        for symbol, bar in finished:
+            self._write(symbol, bar)
+
+    def flush(self):
+        """Write the bars still being built, e.g. at shutdown"""
+        with self._lock:
+            bars, self._bars = self._bars, {}
+        for symbol, bar in bars.items():
+            self._write(symbol, bar)
+
+    def _write(self, symbol, bar):
+        try:
+            self.store.append(f"{symbol}/{self.quote_currency}",
+                              np.array([tuple(bar) + (0.0,)], dtype=CANDLE_DTYPE), self.timeframe)
+        except Exception as e:
+            logger.error("Recording %s candle failed: %s", symbol, e)
+
+
+def generate_candles(bars, seed=0, start=1_577_836_800, timeframe='1m', start_price=100.0, volatility=0.001):
+    """Random-walk OHLCV fixture data, for tests and offline backtests"""
+    rng = np.random.default_rng(seed)
+    period = TIMEFRAMES[timeframe]
+    close = start_price * np.exp(np.cumsum(rng.normal(0, volatility, bars)))
+    open_ = np.concatenate([[start_price], close[:-1]])
+    wick = np.abs(rng.normal(0, volatility / 2, (2, bars))) * close
+    candles = np.empty(bars, dtype=CANDLE_DTYPE)
+    candles['time'] = start + np.arange(bars, dtype=np.int64) * period
+    candles['open'] = open_
+    candles['close'] = close
+    candles['high'] = np.maximum(open_, close) + wick[0]
+    candles['low'] = np.maximum(np.minimum(open_, close) - wick[1], 1e-9)
+    candles['volume'] = rng.gamma(2.0, 50.0, bars)
+    return candles
@@ -0,0 +1,109 @@
+import logging
+import os
+
+import pytest
+from flask import Flask
+from flask_login import LoginManager, login_user
+
+import structured_logging
+from alert_engine import AlertEngine
+from currency_conversion import ConversionCache
+from financial_calculator import TradeCalculator
+from models.user import db, User
+from price_providers import PriceEngine, StubProvider
+from quote_cache import QuoteCache
+from summary_cache import SummaryCache
+from user_cache import user_cache
+
+# Quotes the `client` fixture's calculator serves instead of calling the providers
+WEB_PRICES = {'BTC': 65000.0, 'ETH': 2500.0, 'SOL': 150.0}
+
+
+@pytest.fixture(autouse=True)
+def fresh_equity_cache():
+    """Sale ids restart with every test database, so cached equity curves must not outlive a test"""
+    import equity_curve
+
+    equity_curve.equity_cache.clear()
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TESTING'] = True
+    app.secret_key = 'test'
+    db.init_app(app)
+
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def make_user(email):
+    user = User(email=email)
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def user_context(app):
+    """Request context with a logged-in user, as the trade routes see it"""
+    with app.test_request_context():
+        user = make_user('trader@example.com')
+        login_user(user)
+        yield user
+
+
+@pytest.fixture(scope='session')
+def web(tmp_path_factory):
+    """The app.py module, imported once against a throwaway SQLite file and left without its log writer"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{tmp_path_factory.mktemp('web') / 'web.db'}"
+    root = logging.getLogger()
+    saved = (list(root.handlers), root.level)
+    import app as web
+    structured_logging.stop_logging()
+    root.handlers[:] = saved[0]
+    root.setLevel(saved[1])
+    return web
+
+
+@pytest.fixture
+def client(web, monkeypatch):
+    """Test client for app.py's routes, logged in as a fresh user, with fixed offline prices"""
+    calculator = TradeCalculator(
+        quote_cache=QuoteCache(ttl=60, max_size=100),
+        price_engine=PriceEngine([StubProvider(WEB_PRICES)]),
+        summary_cache=SummaryCache(),
+        alert_engine=AlertEngine(),
+        conversion_cache=ConversionCache()
+    )
+    calculator.alert_engine.load([])
+    monkeypatch.setattr(web, 'trade_calculator', calculator)
+    with web.app.app_context():
+        db.create_all()
+        user = make_user('web@example.com')
+        user_id = user.id
+    user_cache.clear()
+
+    test_client = web.app.test_client()
+    with test_client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    test_client.user_id = user_id
+    yield test_client
+
+    user_cache.clear()
+    with web.app.app_context():
+        db.session.remove()
+        db.drop_all()
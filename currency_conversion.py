@@ -0,0 +1,134 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+
+# NumPy is imported where a matrix is built, so importing this module (and
+# the app) doesn't pay for it
+
+# Providers quote every symbol in USD; it is the anchor every rate is relative to
+REFERENCE_CURRENCY = 'USD'
+
+
+def parse_fixed_rates(spec):
+    """{currency: USD value} from 'USDT=1,USDC=1,EUR=1.08'"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        currency, _, rate = item.partition('=')
+        rates[currency.strip().upper()] = float(rate)
+    return rates
+
+
+# Pegged and fiat currencies are pinned here rather than fetched from the crypto providers
+FIXED_RATES = parse_fixed_rates(os.getenv('FX_FIXED_RATES', 'USDT=1,USDC=1'))
+REPORTING_CURRENCY = os.getenv('REPORTING_CURRENCY', REFERENCE_CURRENCY).upper()
+# The crypto providers don't quote fiat; these have a rate only when pinned in FX_FIXED_RATES
+FIAT_CURRENCIES = frozenset(c.strip().upper() for c in os.getenv(
+    'FX_FIAT_CURRENCIES',
+    'EUR,GBP,JPY,CHF,CAD,AUD,NZD,CNY,HKD,SGD,KRW,INR,BRL,MXN,TRY,ZAR,SEK,NOK,DKK,PLN'
+).split(',') if c.strip())
+
+
+def split_market(market):
+    """(base, quote) currencies of a market symbol; a bare symbol is quoted in USD"""
+    base, _, quote = market.upper().partition('/')
+    return base, quote or REFERENCE_CURRENCY
+
+
+def fixed_usd_rate(currency):
+    """USD value of a currency that needs no quote (USD itself or a pinned one), else None"""
+    if currency == REFERENCE_CURRENCY:
+        return 1.0
+    return FIXED_RATES.get(currency)
+
+
+def needs_quote(currency, fixed_rates=None):
+    """Whether the currency's USD value has to come from the price providers"""
+    fixed_rates = FIXED_RATES if fixed_rates is None else fixed_rates
+    return currency != REFERENCE_CURRENCY and currency not in fixed_rates and currency not in FIAT_CURRENCIES
+
+
+def anchor_symbols(markets, fixed_rates=None):
+    """Currencies of the markets whose USD value has to come from the price providers"""
+    currencies = {currency for market in markets for currency in split_market(market)}
+    return sorted(c for c in currencies if needs_quote(c, fixed_rates))
+
+
+class ConversionMatrix:
+    """Every pairwise rate between a set of currencies, built from their USD values.
+
+    rates[i, j] is the price of one unit of currency i in currency j. An
+    extra NaN row and column stand in for currencies without a USD value,
+    so lookups are plain fancy indexing and unknown pairs come back as NaN.
+    """
+
+    def __init__(self, anchors):
+        import numpy as np
+
+        anchors = {c: float(v) for c, v in anchors.items() if v is not None and math.isfinite(v) and v > 0}
+        self.currencies = sorted(anchors)
+        self.index = {currency: i for i, currency in enumerate(self.currencies)}
+        values = np.array([anchors[c] for c in self.currencies] + [np.nan])
+        self.rates = np.divide.outer(values, values)
+
+    def __contains__(self, currency):
+        return currency in self.index
+
+    def rate(self, source, target):
+        """Units of `target` per unit of `source`, or None if either has no USD value"""
+        value = self.lookup([source], [target])[0]
+        return None if math.isnan(value) else float(value)
+
+    def lookup(self, sources, targets):
+        """Rates for parallel lists of source and target currencies, NaN where unknown"""
+        import numpy as np
+
+        missing = len(self.currencies)
+        rows = np.fromiter((self.index.get(c, missing) for c in sources), dtype=np.intp, count=len(sources))
+        columns = np.fromiter((self.index.get(c, missing) for c in targets), dtype=np.intp, count=len(targets))
+        return self.rates[rows, columns]
+
+    def market_prices(self, markets):
+        """{market: price of its base in its quote currency}, for the markets that can be priced"""
+        pairs = [split_market(market) for market in markets]
+        prices = self.lookup([base for base, _ in pairs], [quote for _, quote in pairs])
+        return {market: float(price) for market, price in zip(markets, prices) if not math.isnan(price)}
+
+    def quote_rates(self, markets, currency):
+        """{market: rate from its quote currency into `currency`}, for the markets that can be converted"""
+        rates = self.lookup([split_market(market)[1] for market in markets], [currency] * len(markets))
+        return {market: float(rate) for market, rate in zip(markets, rates) if not math.isnan(rate)}
+
+
+class ConversionCache:
+    """Bounded cache of conversion matrices, keyed by the anchor rates they were built from"""
+
+    def __init__(self, max_size=None):
+        self.max_size = int(max_size if max_size is not None else os.getenv('FX_MATRIX_CACHE_SIZE', 64))
+        self._entries = OrderedDict()  # sorted anchor items -> ConversionMatrix
+        self._lock = threading.Lock()
+
+    def get(self, anchors):
+        """Matrix for the {currency: USD value} anchors, built only when they changed"""
+        key = tuple(sorted(anchors.items()))
+        with self._lock:
+            matrix = self._entries.get(key)
+            if matrix is not None:
+                self._entries.move_to_end(key)
+                return matrix
+
+        matrix = ConversionMatrix(anchors)
+        with self._lock:
+            self._entries[key] = matrix
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return matrix
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every TradeCalculator in the process
+conversion_cache = ConversionCache()
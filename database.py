@@ -0,0 +1,106 @@
+import os
+import sqlite3
+
+from sqlalchemy import create_engine, event, func, insert, inspect, select, text
+from sqlalchemy.engine import Engine
+
+DEFAULT_DATABASE_URL = 'sqlite:///investment_calculator.db'
+
+
+def database_url():
+    """Database URL from DATABASE_URL"""
+    return normalize_url(os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL))
+
+
+def normalize_url(url):
+    """Accept the legacy postgres:// scheme that SQLAlchemy no longer recognises"""
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    """SQLAlchemy engine options for the given URL, tuned from DB_* env vars"""
+    if url.startswith('sqlite'):
+        # SQLite waits on locks through busy_timeout (set in the connect hook), not the pool
+        return {'connect_args': {'check_same_thread': False}}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        # Connections idle longer than this are replaced before servers or proxies drop them
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+    }
+
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    """WAL lets readers run alongside a writer; busy_timeout makes writers queue instead of failing"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+    if os.getenv('SQLITE_WAL', '1') == '1':
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def copy_database(metadata, source_engine, target_url, chunk_size=5000, progress=None):
+    """Copy every table of `metadata` into an empty target database; returns {table: rows}"""
+    target_engine = create_engine(target_url, **engine_options(target_url))
+    metadata.create_all(target_engine)
+    copied = {}
+    try:
+        with source_engine.connect() as source, target_engine.begin() as target:
+            for table in metadata.sorted_tables:
+                if target.execute(select(func.count()).select_from(table)).scalar():
+                    raise ValueError(f"Target table {table.name} is not empty")
+                copied[table.name] = 0
+                result = source.execution_options(yield_per=chunk_size).execute(
+                    select(table).order_by(*table.primary_key.columns))
+                for rows in result.mappings().partitions():
+                    target.execute(insert(table), [dict(row) for row in rows])
+                    copied[table.name] += len(rows)
+                    if progress:
+                        progress(table.name, copied[table.name])
+            if target_engine.dialect.name == 'postgresql':
+                reset_sequences(target, metadata)
+    finally:
+        target_engine.dispose()
+    return copied
+
+
+def reset_sequences(connection, metadata):
+    """Move each serial id sequence past the copied ids so new rows don't collide"""
+    quote = connection.dialect.identifier_preparer.quote
+    for table in metadata.sorted_tables:
+        if 'id' not in table.columns:
+            continue
+        # "user" is reserved in PostgreSQL, so names are quoted
+        name = quote(table.name)
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {name}), 0) + 1, false)"
+        ))
+
+
+def add_missing_columns(engine, table):
+    """ALTER TABLE ADD COLUMN for nullable model columns the existing table lacks; returns their names"""
+    inspector = inspect(engine)
+    if not inspector.has_table(table.name):
+        return []
+    existing = {column['name'] for column in inspector.get_columns(table.name)}
+    missing = [column for column in table.columns if column.name not in existing]
+    for column in missing:
+        if not column.nullable or column.server_default is not None:
+            raise ValueError(f"Column {table.name}.{column.name} can't be added automatically")
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as connection:
+        for column in missing:
+            connection.execute(text(
+                f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+                f"{column.type.compile(dialect=engine.dialect)}"
+            ))
+    return [column.name for column in missing]
@@ -0,0 +1,169 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from models.user import db, Trade, Sale
+
+# Bucket sizes accepted by the API, as pandas offset aliases
+INTERVALS = {'hour': 'h', 'day': 'D'}
+DEFAULT_WIN_RATE_WINDOW = 20
+MAX_POINTS = int(os.getenv('EQUITY_MAX_POINTS', 50000))
+
+
+class _CurveState:
+    """Per-bucket aggregates of the sales seen so far, plus what is needed to extend them"""
+
+    def __init__(self, buckets, realized, win_rate, recent_wins, last_sale_id):
+        self.buckets = buckets  # DataFrame indexed by bucket start: sales, wins
+        # Realized P/L per bucket with a column per market, each in its quote currency, so the
+        # cached state stays valid while exchange rates move
+        self.realized = realized
+        self.win_rate = win_rate  # rolling win rate (%) at the end of each bucket
+        self.recent_wins = recent_wins  # win flags of the last `window` sales, oldest first
+        self.last_sale_id = last_sale_id
+
+
+class EquityCurveCache:
+    """Bounded LRU of curve states keyed by (user_id, market, interval, window)"""
+
+    def __init__(self, max_size=None):
+        self.max_size = int(max_size if max_size is not None else os.getenv('EQUITY_CACHE_MAX_SIZE', 256))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            state = self._entries.get(key)
+            if state is not None:
+                self._entries.move_to_end(key)
+            return state
+
+    def put(self, key, state):
+        with self._lock:
+            self._entries[key] = state
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+equity_cache = EquityCurveCache()
+
+
+def load_sales(user_id, market=None, after_id=0):
+    """The user's sales after `after_id` as a (id, date, market, pl) frame in date order, from one column query"""
+    statement = select(Sale.id, Sale.date, Trade.market, Sale.partial_pl).join(Trade, Sale.trade_id == Trade.id).where(
+        Trade.user_id == user_id, Sale.id > after_id
+    )
+    if market:
+        statement = statement.where(Trade.market == market)
+    rows = db.session.execute(statement.order_by(Sale.date, Sale.id)).all()
+    sales = pd.DataFrame.from_records(rows, columns=['id', 'date', 'market', 'pl'])
+    sales['date'] = pd.to_datetime(sales['date'])
+    return sales.dropna(subset=['date'])
+
+
+def _aggregate(sales, freq):
+    """(sales and wins per bucket, realized P/L per bucket and market)"""
+    grouped = sales.assign(win=(sales['pl'] > 0).astype(int)).set_index('date').resample(freq)
+    buckets = pd.DataFrame({'sales': grouped['pl'].count(), 'wins': grouped['win'].sum()})
+    realized = sales.pivot_table(index=pd.Grouper(key='date', freq=freq), columns='market', values='pl',
+                                 aggfunc='sum', fill_value=0.0)
+    return buckets, realized.reindex(buckets.index, fill_value=0.0)
+
+
+def _rolling_win_rate(sales, recent_wins, window, freq):
+    """Win rate over the last `window` sales, as of the end of each bucket touched by `sales`"""
+    flags = np.concatenate([recent_wins, (sales['pl'] > 0).to_numpy(dtype=float)])
+    rolling = pd.Series(flags).rolling(window, min_periods=1).mean().to_numpy()[len(recent_wins):] * 100
+    per_bucket = pd.Series(rolling, index=sales['date'].to_numpy()).resample(freq).last()
+    return per_bucket, flags[-window:]
+
+
+def _extend(state, sales, freq, window):
+    """New state with `sales` (all dated in or after the last bucket) folded in"""
+    buckets, realized = _aggregate(sales, freq)
+    win_rate, recent_wins = _rolling_win_rate(sales, state.recent_wins if state else np.empty(0), window, freq)
+    if state is not None and not state.buckets.empty:
+        buckets = pd.concat([state.buckets, buckets]).groupby(level=0).sum()
+        realized = pd.concat([state.realized, realized]).groupby(level=0).sum()
+        win_rate = pd.concat([state.win_rate, win_rate])
+        win_rate = win_rate[~win_rate.index.duplicated(keep='last')]
+    # Dense series: buckets without sales carry the equity and win rate forward
+    buckets = buckets.asfreq(freq, fill_value=0)
+    realized = realized.reindex(buckets.index).fillna(0.0)
+    win_rate = win_rate.reindex(buckets.index).ffill()
+    return _CurveState(buckets, realized, win_rate, recent_wins, int(sales['id'].max()))
+
+
+def equity_curve(user_id, market=None, interval='day', window=DEFAULT_WIN_RATE_WINDOW, cache=None, rates=None):
+    """Realized P/L time series for a user (optionally one market) with equity, drawdown and win rate.
+
+    Only sales newer than the cached state are read; a sale dated before
+    the last cached bucket (e.g. a backfilled import) rebuilds the series.
+    `rates` ({market: rate from its quote currency}) converts each market's
+    P/L into one currency and leaves out markets without a rate; without
+    it the P/L is summed as recorded.
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"Interval must be one of: {', '.join(INTERVALS)}")
+    if not 1 <= window <= 1000:
+        raise ValueError("Window must be between 1 and 1000 sales")
+    freq = INTERVALS[interval]
+    cache = cache if cache is not None else equity_cache
+    key = (user_id, market, interval, window)
+
+    state = cache.get(key)
+    sales = load_sales(user_id, market, after_id=state.last_sale_id if state else 0)
+    if state is not None and not sales.empty and sales['date'].min() < state.buckets.index[-1]:
+        state = None
+        sales = load_sales(user_id, market)
+    if not sales.empty:
+        state = _extend(state, sales, freq, window)
+        cache.put(key, state)
+
+    if state is None:
+        return _to_json(pd.DataFrame(columns=['sales', 'wins']), pd.Series(dtype=float), pd.Series(dtype=float),
+                        interval, market, window)
+    if len(state.buckets) > MAX_POINTS:
+        raise ValueError(f"Series has {len(state.buckets)} points; use a coarser interval")
+    if rates is None:
+        realized = state.realized.sum(axis=1)
+    else:
+        converted = [m for m in state.realized.columns if m in rates]
+        realized = state.realized[converted].mul(pd.Series({m: rates[m] for m in converted})).sum(axis=1)
+    return _to_json(state.buckets, realized, state.win_rate, interval, market, window)
+
+
+def _to_json(buckets, realized, win_rate, interval, market, window):
+    """Columnar JSON for charting; NaN win rates (no sales yet) become None"""
+    realized = realized.astype(float)
+    cumulative = realized.cumsum()
+    # Equity starts at zero, so the first peak is never below it
+    peak = cumulative.cummax().clip(lower=0)
+    drawdown = cumulative - peak
+    return {
+        'interval': interval,
+        'market': market,
+        'window': window,
+        'timestamps': [t.isoformat() for t in buckets.index],
+        'realized': realized.tolist(),
+        'cumulativeRealized': cumulative.tolist(),
+        'drawdown': drawdown.tolist(),
+        'sales': buckets['sales'].astype(int).tolist(),
+        'winRate': [None if np.isnan(v) else v for v in win_rate.astype(float).tolist()],
+        'totalRealized': float(cumulative.iloc[-1]) if len(cumulative) else 0.0,
+        'maxDrawdown': float(drawdown.min()) if len(drawdown) else 0.0,
+    }
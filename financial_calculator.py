@@ -1,56 +1,173 @@
-import pandas as pd
-import numpy as np
 from datetime import datetime
+import base64
+import hashlib
+import logging
+import math
 import os
-import requests
+from sqlalchemy import and_, insert, or_, select, update
 from models.user import db, Trade, Sale
+from flask import g, has_app_context
 from flask_login import current_user
+from quote_cache import quote_cache as shared_quote_cache
+from summary_cache import summary_cache as shared_summary_cache
+from alert_engine import alert_engine as shared_alert_engine
+from currency_conversion import conversion_cache as shared_conversion_cache
+from price_providers import build_price_engine
+import currency_conversion
+import portfolio_rollup
+import serializers
+from instrumentation import timed
 
-pd.set_option('display.float_format', lambda x: '%.2f' % x)
+logger = logging.getLogger(__name__)
+
+# NumPy is imported inside the vectorized helpers so that importing this
+# module (and the app) doesn't pay for it
+
+# Row-level error messages of calculate_position_sizes, indexed by error code
+POSITION_ERRORS = [
+    None,
+    "Invalid numerical values provided",
+    "Values must be greater than zero",
+    "Risk percentage must be between 0 and 100",
+    "Entry price cannot equal exit price",
+]
+
+BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', 500))
+
+
+class BatchValidationError(ValueError):
+    """A rejected batch, with an {'index', 'error'} entry for every failing operation"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        first = errors[0]
+        more = f" (and {len(errors) - 1} more)" if len(errors) > 1 else ""
+        super().__init__(f"Operation {first['index']}: {first['error']}{more}")
+
+
+def _to_float_array(values):
+    """Convert input values to a float array, turning unparseable entries into NaN"""
+    import numpy as np
+
+    try:
+        return np.asarray(values, dtype=float)
+    except (ValueError, TypeError):
+        def to_float(v):
+            try:
+                return float(v)
+            except (ValueError, TypeError):
+                return np.nan
+        return np.array([to_float(v) for v in np.ravel(np.asarray(values, dtype=object))], dtype=float)
+
+
+def calculate_position_sizes(capital_total, risk_percentage, entry_price, exit_price):
+    """Vectorized version of the /calculate position sizing for many scenarios at once.
+
+    Inputs are scalars or arrays that broadcast together. Returns a dict of
+    result arrays rounded to 2 decimals (NaN where the row is invalid) and an
+    'error' array of codes indexing POSITION_ERRORS (0 means valid).
+    """
+    import numpy as np
+
+    capital, risk, entry, exit_ = np.broadcast_arrays(*(_to_float_array(v) for v in (
+        capital_total, risk_percentage, entry_price, exit_price)))
+    capital, risk, entry, exit_ = (np.ravel(a) for a in (capital, risk, entry, exit_))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        capital_at_risk = capital * (risk / 100)
+        risk_per_unit = np.abs(entry - exit_)
+        position_size = capital_at_risk / risk_per_unit
+        total_position_value = position_size * entry
+
+        error = np.select([
+            np.isnan(capital) | np.isnan(risk) | np.isnan(entry) | np.isnan(exit_),
+            (capital <= 0) | (entry <= 0) | (exit_ <= 0),
+            (risk <= 0) | (risk > 100),
+            risk_per_unit == 0,
+        ], [1, 2, 3, 4], default=0).astype(np.int8)
+
+    invalid = error != 0
+    results = {}
+    for key, values in (('capitalAtRisk', capital_at_risk), ('riskPerUnit', risk_per_unit),
+                        ('positionSize', position_size), ('totalPositionValue', total_position_value)):
+        values = np.round(values, 2)
+        values[invalid] = np.nan
+        results[key] = values
+    results['error'] = error
+    return results
+
+
+def position_size_grid(capital_total, risk_percentage, entry_price, exit_price):
+    """Expand 1-D value lists into the flattened cartesian grid of scenarios (capital varies slowest)"""
+    import numpy as np
+
+    axes = [np.ravel(_to_float_array(v)) for v in (capital_total, risk_percentage, entry_price, exit_price)]
+    return [a.ravel() for a in np.meshgrid(*axes, indexing='ij')]
 
 class TradeCalculator:
-    def __init__(self):
-        self.api_key = os.getenv('COINMARKETCAP_API_KEY')
+    def __init__(self, quote_cache=None, price_engine=None, summary_cache=None, alert_engine=None,
+                 conversion_cache=None):
+        self.quote_cache = quote_cache or shared_quote_cache
+        self.summary_cache = summary_cache or shared_summary_cache
+        self.alert_engine = alert_engine or shared_alert_engine
+        self.conversion_cache = conversion_cache or shared_conversion_cache
+        self.price_engine = price_engine or build_price_engine()
+        # Set while a PriceRefreshWorker keeps the quote cache warm
+        self.local_prices_only = False
 
+    @timed('fetch_latest_prices')
     def fetch_latest_prices(self, symbols):
-        """Fetch latest prices from CoinMarketCap API"""
+        """Fetch latest prices for market symbols, each in its own quote currency"""
         if not symbols:
             return {}
-        
-        formatted_symbols = []
-        for symbol in symbols:
-            base_symbol = symbol.split('/')[0].upper()
-            formatted_symbols.append(base_symbol)
-        
-        symbol_string = ','.join(formatted_symbols)
-        
-        url = 'https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest'
-        parameters = {
-            'symbol': symbol_string,
-            'convert': 'USD'
-        }
-        headers = {
-            'X-CMC_PRO_API_KEY': self.api_key,
-            'Accept': 'application/json'
-        }
+
+        currencies = {currency for symbol in symbols for currency in currency_conversion.split_market(symbol)}
+        return self.conversion_matrix(currencies).market_prices(symbols)
+
+    def market_prices(self, markets, currency=None):
+        """Latest prices of the open markets in their quote currencies, and each market's rate into `currency`
+
+        Both come from one conversion matrix, so pricing in any reporting
+        currency costs at most the one quote cache lookup.
+        """
+        currency = (currency or currency_conversion.REPORTING_CURRENCY).upper()
+        open_symbols = [m['market'] for m in markets if m['open_trade_count']]
+        all_symbols = [m['market'] for m in markets]
+        currencies = {currency}
+        currencies.update(currency_conversion.split_market(symbol)[0] for symbol in open_symbols)
+        currencies.update(currency_conversion.split_market(symbol)[1] for symbol in all_symbols)
+        matrix = self.conversion_matrix(currencies)
+        if currency not in matrix:
+            raise ValueError(f"No exchange rate available for {currency}")
+        return matrix.market_prices(open_symbols), matrix.quote_rates(all_symbols, currency)
+
+    def conversion_matrix(self, currencies):
+        """ConversionMatrix over the currencies, from the fixed rates and the quote cache's USD quotes
+
+        Unpinned fiat currencies are never sent to the providers, so they
+        and their markets are left without a rate.
+        """
+        fixed = currency_conversion.FIXED_RATES
+        anchors = {currency_conversion.REFERENCE_CURRENCY: 1.0}
+        anchors.update({c: fixed[c] for c in currencies if c in fixed})
+        wanted = sorted(c for c in currencies if currency_conversion.needs_quote(c))
+        if wanted:
+            if self.local_prices_only:
+                anchors.update(self.quote_cache.peek_many(wanted))
+            else:
+                anchors.update(self.quote_cache.get_many(wanted, self.fetch_quotes))
+        return self.conversion_cache.get(anchors)
+
+    @timed('fetch_quotes')
+    def fetch_quotes(self, base_symbols):
+        """Fetch latest USD quotes for base symbols from the configured price providers"""
+        if not base_symbols:
+            return {}
 
         try:
-            response = requests.get(url, headers=headers, params=parameters)
-            data = response.json()
-            
-            if 'data' not in data:
-                return {}
-                
-            prices = {}
-            for symbol in formatted_symbols:
-                if symbol in data['data']:
-                    price = data['data'][symbol]['quote']['USD']['price']
-                    original_symbol = next(s for s in symbols if s.startswith(symbol))
-                    prices[original_symbol] = price
-                    
-            return prices
+            return self.price_engine.fetch(base_symbols)
         except Exception as e:
-            print(f"Error fetching prices: {str(e)}")
+            logger.error("Error fetching prices: %s", e, exc_info=True)
             return {}
 
     def validate_numeric(self, value, field_name):
@@ -59,7 +176,7 @@ class TradeCalculator:
             return None
         try:
             value = float(value)
-            if pd.isna(value):
+            if math.isnan(value):
                 return None
             if value < 0:
                 raise ValueError(f"{field_name} cannot be negative")
@@ -67,8 +184,8 @@ class TradeCalculator:
         except (ValueError, TypeError):
             raise ValueError(f"Invalid numeric value for {field_name}")
 
-    def add_trade(self, market, entry_price, units):
-        """Add a new trade with user association"""
+    def add_trade(self, market, entry_price, units, stop_price=None, target_price=None):
+        """Add a new trade with user association and optional alert levels"""
         try:
             if not market or not isinstance(market, str):
                 raise ValueError("Market symbol is required and must be a string")
@@ -82,6 +199,7 @@ class TradeCalculator:
             if units is None:
                 raise ValueError("Units is required and must be a positive number")
             
+            stop_price, target_price = self.validate_levels(stop_price, target_price, market)
             position_size = self.calculate_position_size(entry_price, units)
             
             trade = Trade(
@@ -90,13 +208,21 @@ class TradeCalculator:
                 units=units,
                 remaining_units=units,
                 position_size=position_size,
+                stop_price=stop_price,
+                target_price=target_price,
                 user_id=current_user.id
             )
             
             db.session.add(trade)
+            db.session.flush()
+            portfolio_rollup.apply_trade(trade)
+            result = self.clean_trade_data(self.trade_to_dict(trade))
             db.session.commit()
+            self.summary_cache.invalidate(trade.user_id)
+            if stop_price is not None or target_price is not None:
+                self.alert_engine.set_levels(result['id'], current_user.id, result['Market'], stop_price, target_price)
             
-            return self.clean_trade_data(self.trade_to_dict(trade))
+            return result
             
         except Exception as e:
             db.session.rollback()
@@ -105,7 +231,8 @@ class TradeCalculator:
     def sell_units(self, trade_id, units_to_sell, exit_price):
         """Record a partial sale of units"""
         try:
-            trade = Trade.query.filter_by(id=trade_id, user_id=current_user.id).first()
+            user_id = current_user.id
+            trade = self.get_user_trade(trade_id)
             if not trade:
                 raise ValueError("Trade not found")
             
@@ -126,21 +253,241 @@ class TradeCalculator:
                 trade_id=trade.id
             )
             
+            old_remaining = trade.remaining_units
+            old_position = trade.position_size
             trade.remaining_units -= units_to_sell
             trade.position_size = self.calculate_position_size(trade.entry_price, trade.remaining_units)
             
             db.session.add(sale)
-            db.session.commit()
-            
-            return {
+            portfolio_rollup.apply_sale(trade, sale, old_remaining, old_position)
+            # Built before commit expires the objects, so they aren't reloaded
+            result = {
                 'sale': self.clean_trade_data(self.sale_to_dict(sale)),
                 'updated_trade': self.clean_trade_data(self.trade_to_dict(trade))
             }
+            closed = result['updated_trade']['Remaining Units'] == 0
+            db.session.commit()
+            self.summary_cache.invalidate(user_id)
+            if closed:
+                self.alert_engine.remove(trade_id)
+            
+            return result
             
         except Exception as e:
             db.session.rollback()
             raise ValueError(f"Error processing sale: {str(e)}")
 
+    def set_trade_levels(self, trade_id, stop_price=None, target_price=None):
+        """Set or clear (with None) the stop and target levels watched for an open trade"""
+        try:
+            trade = self.get_user_trade(trade_id)
+            if not trade:
+                raise ValueError("Trade not found")
+            if trade.remaining_units == 0:
+                raise ValueError("Trade is closed")
+
+            stop_price, target_price = self.validate_levels(stop_price, target_price, trade.market)
+            trade.stop_price = stop_price
+            trade.target_price = target_price
+            result = self.clean_trade_data(self.trade_to_dict(trade))
+            db.session.commit()
+            self.summary_cache.invalidate(current_user.id)
+            self.alert_engine.set_levels(trade_id, current_user.id, result['Market'], stop_price, target_price)
+
+            return result
+
+        except Exception as e:
+            db.session.rollback()
+            raise ValueError(f"Error setting alert levels: {str(e)}")
+
+    def validate_levels(self, stop_price, target_price, market):
+        """Optional stop and target prices, which must be positive with the stop below the target.
+
+        Alerts compare levels with USD quotes, so they can only be set on
+        markets quoted in USD or a pinned currency.
+        """
+        stop_price = self.validate_numeric(stop_price, "Stop price")
+        target_price = self.validate_numeric(target_price, "Target price")
+        if stop_price == 0 or target_price == 0:
+            raise ValueError("Stop and target prices must be greater than zero")
+        if stop_price is not None and target_price is not None and stop_price >= target_price:
+            raise ValueError("Stop price must be below the target price")
+        if (stop_price is not None or target_price is not None) and \
+                currency_conversion.fixed_usd_rate(currency_conversion.split_market(market)[1]) is None:
+            raise ValueError(f"Stop and target prices are not supported on {market.upper()}: "
+                             "it is not quoted in USD or a pinned currency")
+        return stop_price, target_price
+
+    def apply_batch(self, operations):
+        """Apply buy and sell operations all-or-nothing, in one transaction; returns the rows they touched.
+
+        Every operation is validated before anything is written. The sold
+        trades are locked with a single SELECT ... FOR UPDATE, new trades and
+        sales are bulk inserted, sold trades are bulk updated and the
+        rollups of the affected markets are recomputed once.
+        """
+        try:
+            user_id = current_user.id
+            buys, sells = self.validate_batch(operations)
+            now = datetime.utcnow()
+
+            # Lock the sold trades and check the sells against their remaining units. SQLite
+            # ignores FOR UPDATE, but a write after a concurrent commit fails there instead
+            sold_ids = sorted({sell['trade_id'] for _, sell in sells})
+            locked = {}
+            if sold_ids:
+                rows = db.session.execute(
+                    select(Trade.id, Trade.market, Trade.entry_price, Trade.remaining_units)
+                    .where(Trade.id.in_(sold_ids), Trade.user_id == user_id)
+                    .with_for_update()
+                ).all()
+                locked = {trade_id: (market, entry_price, remaining)
+                          for trade_id, market, entry_price, remaining in rows}
+
+            errors = []
+            remaining = {trade_id: entry[2] for trade_id, entry in locked.items()}
+            sale_rows = []
+            for index, sell in sells:
+                trade_id = sell['trade_id']
+                if trade_id not in locked:
+                    errors.append({'index': index, 'error': "Trade not found"})
+                    continue
+                if sell['units'] > remaining[trade_id]:
+                    errors.append({'index': index, 'error': "Cannot sell more units than remaining"})
+                    continue
+                entry_price = locked[trade_id][1]
+                remaining[trade_id] -= sell['units']
+                sale_rows.append({
+                    'trade_id': trade_id,
+                    'date': now,
+                    'units_sold': sell['units'],
+                    'exit_price': sell['exit_price'],
+                    'partial_pl': self.calculate_profit_loss(entry_price, sell['exit_price'], sell['units']),
+                    'partial_pl_percentage': self.calculate_win_loss_percentage(entry_price, sell['exit_price'])
+                })
+            if errors:
+                raise BatchValidationError(errors)
+
+            trade_rows = [dict(buy, user_id=user_id, date=now) for _, buy in buys]
+            new_ids = self.insert_trades(trade_rows) if trade_rows else []
+            if sale_rows:
+                db.session.execute(insert(Sale.__table__), sale_rows)
+            updated_ids = [trade_id for trade_id in sold_ids if remaining[trade_id] != locked[trade_id][2]]
+            if updated_ids:
+                db.session.execute(update(Trade), [{
+                    'id': trade_id,
+                    'remaining_units': remaining[trade_id],
+                    'position_size': self.calculate_position_size(locked[trade_id][1], remaining[trade_id])
+                } for trade_id in updated_ids])
+
+            markets = {row['market'] for row in trade_rows} | {locked[trade_id][0] for trade_id in updated_ids}
+            portfolio_rollup.refresh_markets(user_id, sorted(markets))
+
+            # One read of the touched trades; populate_existing replaces any stale copies in the session
+            affected = Trade.query.filter(Trade.id.in_(new_ids + updated_ids)).populate_existing().all()
+            by_id = {trade.id: self.clean_trade_data(self.trade_to_dict(trade)) for trade in affected}
+            result = {
+                'newTrades': [by_id[trade_id] for trade_id in new_ids],
+                'updatedTrades': [by_id[trade_id] for trade_id in updated_ids],
+                'sales': [self.clean_trade_data(self.sale_to_dict(Sale(**row))) for row in sale_rows]
+            }
+            db.session.commit()
+            self.summary_cache.invalidate(user_id)
+
+            for trade_id, row in zip(new_ids, trade_rows):
+                if row['stop_price'] is not None or row['target_price'] is not None:
+                    self.alert_engine.set_levels(trade_id, user_id, row['market'], row['stop_price'], row['target_price'])
+            for trade_id in updated_ids:
+                if remaining[trade_id] == 0:
+                    self.alert_engine.remove(trade_id)
+
+            return result
+
+        except BatchValidationError:
+            db.session.rollback()
+            raise
+        except Exception as e:
+            db.session.rollback()
+            raise ValueError(f"Error processing batch: {str(e)}")
+
+    def validate_batch(self, operations):
+        """Split a batch into (index, buy) and (index, sell) lists of validated rows, or raise with every error"""
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("Operations must be a non-empty list")
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            raise ValueError(f"A batch can hold at most {BATCH_MAX_OPERATIONS} operations")
+
+        buys, sells, errors = [], [], []
+        for index, operation in enumerate(operations):
+            try:
+                if not isinstance(operation, dict):
+                    raise ValueError("Operation must be an object")
+                kind = operation.get('type')
+                if kind == 'buy':
+                    buys.append((index, self.validate_buy(operation)))
+                elif kind == 'sell':
+                    sells.append((index, self.validate_sell(operation)))
+                else:
+                    raise ValueError("Operation type must be 'buy' or 'sell'")
+            except ValueError as e:
+                errors.append({'index': index, 'error': str(e)})
+        if errors:
+            raise BatchValidationError(errors)
+        return buys, sells
+
+    def validate_buy(self, operation):
+        """Trade row for a buy operation with the /add_trade fields"""
+        market = operation.get('market')
+        if not market or not isinstance(market, str):
+            raise ValueError("Market symbol is required and must be a string")
+        entry_price = self.validate_numeric(operation.get('entryPrice'), "Entry price")
+        units = self.validate_numeric(operation.get('units'), "Units")
+        if entry_price is None or entry_price <= 0:
+            raise ValueError("Entry price is required and must be a positive number")
+        if units is None or units <= 0:
+            raise ValueError("Units is required and must be a positive number")
+        stop_price, target_price = self.validate_levels(operation.get('stopPrice'), operation.get('targetPrice'),
+                                                     market)
+        return {
+            'market': market.upper(),
+            'entry_price': entry_price,
+            'units': units,
+            'remaining_units': units,
+            'position_size': self.calculate_position_size(entry_price, units),
+            'stop_price': stop_price,
+            'target_price': target_price
+        }
+
+    def validate_sell(self, operation):
+        """Sale fields of a sell operation with the /sell_units fields plus tradeId"""
+        trade_id = operation.get('tradeId')
+        if not isinstance(trade_id, int) or isinstance(trade_id, bool):
+            raise ValueError("Trade id is required and must be an integer")
+        units = self.validate_numeric(operation.get('units'), "Units to sell")
+        exit_price = self.validate_numeric(operation.get('exitPrice'), "Exit price")
+        if units is None or units <= 0:
+            raise ValueError("Units to sell is required and must be a positive number")
+        if exit_price is None or exit_price <= 0:
+            raise ValueError("Exit price is required and must be a positive number")
+        return {'trade_id': trade_id, 'units': units, 'exit_price': exit_price}
+
+    @staticmethod
+    def insert_trades(trades):
+        """Bulk insert trade rows and return their ids in input order"""
+        if db.session.get_bind().dialect.name != 'sqlite':
+            return db.session.scalars(
+                insert(Trade.__table__).returning(Trade.id, sort_by_parameter_order=True), trades
+            ).all()
+
+        # SQLite cannot return ids in parameter order from a batched insert, but it
+        # holds the write lock for the whole transaction, so the new rows are this
+        # user's highest ids in insertion order
+        db.session.execute(insert(Trade.__table__), trades)
+        trade_ids = db.session.scalars(
+            select(Trade.id).where(Trade.user_id == trades[0]['user_id']).order_by(Trade.id.desc()).limit(len(trades))
+        ).all()
+        return trade_ids[::-1]
+
     @staticmethod
     def calculate_position_size(entry_price, units):
         """Calculate position size based on entry price and units"""
@@ -158,20 +505,152 @@ class TradeCalculator:
 
     def get_trade_sales_history(self, trade_id):
         """Get sales history for a specific trade"""
-        trade = Trade.query.filter_by(id=trade_id, user_id=current_user.id).first()
-        if not trade:
-            return []
-        return [self.clean_trade_data(self.sale_to_dict(sale)) for sale in trade.sales]
+        statement = select(*serializers.SALE_COLUMNS)
+        if self._memoized_trades().get((current_user.id, trade_id)) is not None:
+            # Ownership was already checked earlier in this request
+            statement = statement.where(Sale.trade_id == trade_id)
+        else:
+            statement = statement.join(Trade, Sale.trade_id == Trade.id).where(
+                Trade.id == trade_id, Trade.user_id == current_user.id
+            )
+        return serializers.sale_rows(db.session.execute(statement))
 
+    def get_user_trade(self, trade_id):
+        """The current user's trade by id, loaded at most once per request"""
+        memo = self._memoized_trades()
+        key = (current_user.id, trade_id)
+        trade = memo.get(key)
+        if trade is None:
+            trade = Trade.query.filter_by(id=trade_id, user_id=current_user.id).first()
+            if trade is not None:
+                memo[key] = trade
+        return trade
+
+    @staticmethod
+    def _memoized_trades():
+        """Request-scoped {(user_id, trade_id): Trade}; flask.g lives for one request's app context"""
+        if not has_app_context():
+            return {}
+        if 'user_trades' not in g:
+            g.user_trades = {}
+        return g.user_trades
+
+    @timed('get_trades_json')
     def get_trades_json(self):
         """Get trades data in JSON-serializable format"""
-        trades = Trade.query.filter_by(user_id=current_user.id).all()
-        return [self.clean_trade_data(self.trade_to_dict(trade)) for trade in trades]
+        rows = db.session.execute(select(*serializers.TRADE_COLUMNS).where(Trade.user_id == current_user.id))
+        return serializers.trade_rows(rows)
+
+    def get_trades_page(self, cursor=None, limit=50, market=None, status=None, date_from=None, date_to=None):
+        """Get one page of trades, newest first, using keyset pagination on (date, id)"""
+        query = select(*serializers.TRADE_COLUMNS).where(Trade.user_id == current_user.id)
+        if market:
+            query = query.where(Trade.market == market.upper())
+        if status == 'open':
+            query = query.where(Trade.remaining_units > 0)
+        elif status == 'closed':
+            query = query.where(Trade.remaining_units == 0)
+        elif status:
+            raise ValueError("Status must be 'open' or 'closed'")
+        if date_from:
+            query = query.where(Trade.date >= self.parse_date(date_from, "date_from"))
+        if date_to:
+            query = query.where(Trade.date < self.parse_date(date_to, "date_to"))
+        if cursor:
+            cursor_date, cursor_id = self.decode_cursor(cursor)
+            query = query.where(or_(
+                Trade.date < cursor_date,
+                and_(Trade.date == cursor_date, Trade.id < cursor_id)
+            ))
+
+        rows = db.session.execute(query.order_by(Trade.date.desc(), Trade.id.desc()).limit(limit + 1)).all()
+        next_cursor = self.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return serializers.trade_rows(rows[:limit]), next_cursor
 
-    def get_summary(self):
-        """Get comprehensive trading summary"""
-        trades = Trade.query.filter_by(user_id=current_user.id).all()
-        if not trades:
+    @staticmethod
+    def encode_cursor(trade):
+        """Opaque pagination cursor for the position after a trade (or a TRADE_COLUMNS row)"""
+        raw = f"{trade.date.isoformat()}|{trade.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            date_str, trade_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(date_str), int(trade_id)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    def parse_date(value, field_name):
+        try:
+            return datetime.fromisoformat(value)
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid date for {field_name}")
+
+    @timed('get_summary')
+    def get_summary(self, currency=None):
+        """Get comprehensive trading summary from the per-market rollups"""
+        user_id = current_user.id
+        markets = portfolio_rollup.load_markets(user_id)
+        return self._summary_for(user_id, markets, currency=currency)
+
+    def _summary_for(self, user_id, markets, latest_prices=None, rates=None, currency=None, trades=None):
+        recent_trades, best_trade, worst_trade = trades or self.summary_trades(user_id, markets)
+        return self.build_summary(
+            markets,
+            recent_trades=recent_trades,
+            best_trade=best_trade,
+            worst_trade=worst_trade,
+            latest_prices=latest_prices,
+            rates=rates,
+            currency=currency
+        )
+
+    def summary_trades(self, user_id, markets):
+        """(recent trades, best trade, worst trade) shown in the summary"""
+        best_trade_id, worst_trade_id = portfolio_rollup.extreme_trade_ids(markets)
+        return (
+            self.recent_trades(user_id),
+            db.session.get(Trade, best_trade_id) if best_trade_id else None,
+            db.session.get(Trade, worst_trade_id) if worst_trade_id else None
+        )
+
+    def get_versioned_summary(self, currency=None):
+        """Return (etag, summary), reusing the cached summary while neither the data nor the prices moved"""
+        user_id = current_user.id
+        currency = (currency or currency_conversion.REPORTING_CURRENCY).upper()
+        markets = portfolio_rollup.load_markets(user_id)
+        latest_prices, rates = self.market_prices(markets, currency)
+        trades = self.summary_trades(user_id, markets)
+        etag = self.summary_etag(markets, latest_prices, rates, currency, trades)
+        summary = self.summary_cache.get(user_id, etag)
+        if summary is None:
+            summary = self._summary_for(user_id, markets, latest_prices, rates, currency, trades)
+            self.summary_cache.put(user_id, etag, summary)
+        return etag, summary
+
+    @staticmethod
+    def summary_etag(markets, latest_prices, rates=None, currency=None, trades=None):
+        """Strong validator over the user's data version, the price snapshot and the reporting currency.
+
+        Stop and target levels can change without a trade or sale being
+        written, so the levels of the trades the summary shows are part of it.
+        """
+        recent_trades, best_trade, worst_trade = trades or ([], None, None)
+        levels = sorted({(t.id, t.stop_price, t.target_price)
+                         for t in [*recent_trades, best_trade, worst_trade] if t is not None})
+        raw = repr((portfolio_rollup.data_version(markets), sorted(latest_prices.items()),
+                    currency, sorted((rates or {}).items()), levels))
+        return 'v1-' + hashlib.sha1(raw.encode()).hexdigest()
+
+    @timed('build_summary')
+    def build_summary(self, markets, recent_trades, best_trade, worst_trade, latest_prices=None, rates=None,
+                      currency=None):
+        """Assemble the summary dict from per-market aggregates, with money totals in the reporting currency"""
+        currency = (currency or currency_conversion.REPORTING_CURRENCY).upper()
+        total_trades = sum(m['trade_count'] for m in markets)
+        if not total_trades:
             return {
                 'total_trades': 0,
                 'open_trades': 0,
@@ -186,77 +665,126 @@ class TradeCalculator:
                 'trades_by_market': [],
                 'recent_trades': [],
                 'best_performing': None,
-                'worst_performing': None
+                'worst_performing': None,
+                'currency': currency,
+                'unconverted_markets': []
             }
 
-        open_trades = [t for t in trades if t.remaining_units > 0]
-        closed_trades = [t for t in trades if t.remaining_units == 0]
-        
-        open_market_symbols = list(set(t.market for t in open_trades))
-        latest_prices = self.fetch_latest_prices(open_market_symbols)
-        
-        total_pl = sum(sale.partial_pl for trade in trades for sale in trade.sales)
-        
-        for trade in open_trades:
-            if trade.market in latest_prices:
-                current_price = latest_prices[trade.market]
-                unrealized_pl = self.calculate_profit_loss(
-                    trade.entry_price,
-                    current_price,
-                    trade.remaining_units
-                )
-                total_pl += unrealized_pl
-
-        all_sales = [sale for trade in trades for sale in trade.sales]
-        profitable_sales = [sale for sale in all_sales if sale.partial_pl > 0]
-        win_rate = (len(profitable_sales) / len(all_sales) * 100) if all_sales else 0
-        
-        trades_by_market = {}
-        for trade in trades:
-            if trade.market not in trades_by_market:
-                trades_by_market[trade.market] = {
-                    'Market': trade.market,
-                    'Count': 0,
-                    'Total Position': 0
-                }
-            trades_by_market[trade.market]['Count'] += 1
-            trades_by_market[trade.market]['Total Position'] += trade.position_size
-            if trade.market in latest_prices:
-                trades_by_market[trade.market]['Latest Price'] = latest_prices[trade.market]
-
-        trades_by_market = list(trades_by_market.values())
-        
-        best_sale = None
-        worst_sale = None
-        if all_sales:
-            best_sale = max(all_sales, key=lambda x: x.partial_pl_percentage)
-            worst_sale = min(all_sales, key=lambda x: x.partial_pl_percentage)
+        if latest_prices is None or rates is None:
+            latest_prices, rates = self.market_prices(markets, currency)
+
+        # Money totals only cover markets whose quote currency converts into the reporting one
+        converted = [m for m in markets if m['market'] in rates]
+        unrealized = self.unrealized_by_market(markets, latest_prices)
+        total_pl = self.total_profit_loss(markets, unrealized, rates)
+
+        sale_count = sum(m['sale_count'] for m in markets)
+        win_rate = (sum(m['win_count'] for m in markets) / sale_count * 100) if sale_count else 0
+        total_invested = sum(m['total_position'] * rates[m['market']] for m in converted)
+        converted_trades = sum(m['trade_count'] for m in converted)
+
+        trades_by_market = []
+        for m in markets:
+            row = {
+                'Market': m['market'],
+                'Count': m['trade_count'],
+                'Total Position': m['total_position']
+            }
+            if m['market'] in latest_prices:
+                row['Latest Price'] = latest_prices[m['market']]
+            trades_by_market.append(row)
 
         return {
-            'total_trades': len(trades),
-            'open_trades': len(open_trades),
-            'closed_trades': len(closed_trades),
+            'total_trades': total_trades,
+            'open_trades': sum(m['open_trade_count'] for m in markets),
+            'closed_trades': sum(m['closed_trade_count'] for m in markets),
             'total_profit_loss': float(total_pl),
-            'avg_profit_loss_percent': float(sum(s.partial_pl_percentage for s in all_sales) / len(all_sales)) if all_sales else 0,
-            'total_invested': float(sum(t.position_size for t in trades)),
-            'current_positions_value': float(sum(t.position_size for t in open_trades)),
-            'largest_position': float(max(t.position_size for t in trades)) if trades else 0,
-            'avg_position_size': float(sum(t.position_size for t in trades) / len(trades)) if trades else 0,
+            'avg_profit_loss_percent': float(sum(m['pl_pct_sum'] for m in markets) / sale_count) if sale_count else 0,
+            'total_invested': float(total_invested),
+            'current_positions_value': float(sum(m['open_position'] * rates[m['market']] for m in converted)),
+            'largest_position': float(max((m['largest_position'] * rates[m['market']] for m in converted), default=0)),
+            'avg_position_size': float(total_invested / converted_trades) if converted_trades else 0,
             'win_rate': float(win_rate),
             'trades_by_market': trades_by_market,
-            'recent_trades': [self.clean_trade_data(self.trade_to_dict(t)) for t in sorted(trades, key=lambda x: x.date, reverse=True)[:5]],
-            'best_performing': self.clean_trade_data(self.trade_to_dict(best_sale.trade)) if best_sale else None,
-            'worst_performing': self.clean_trade_data(self.trade_to_dict(worst_sale.trade)) if worst_sale else None
+            'recent_trades': [self.clean_trade_data(self.trade_to_dict(t)) for t in recent_trades],
+            'best_performing': self.clean_trade_data(self.trade_to_dict(best_trade)) if best_trade else None,
+            'worst_performing': self.clean_trade_data(self.trade_to_dict(worst_trade)) if worst_trade else None,
+            'currency': currency,
+            'unconverted_markets': [m['market'] for m in markets if m['market'] not in rates]
+        }
+
+    @staticmethod
+    def unrealized_by_market(markets, latest_prices):
+        """Unrealized P/L of the open units in each market rollup that has a price, in its quote currency"""
+        return {
+            m['market']: latest_prices[m['market']] * m['open_units'] - m['open_cost']
+            for m in markets if m['open_trade_count'] and m['market'] in latest_prices
         }
 
+    @staticmethod
+    def total_profit_loss(markets, unrealized, rates):
+        """Realized plus unrealized P/L over the markets with a rate into the reporting currency"""
+        return sum((m['realized_pl'] + unrealized.get(m['market'], 0.0)) * rates[m['market']]
+                   for m in markets if m['market'] in rates)
+
+    @timed('get_equity_curve')
+    def get_equity_curve(self, interval='day', market=None, window=None, currency=None):
+        """Realized P/L series for the current user, with today's unrealized P/L on the open units.
+
+        Money is converted into `currency` with the same rates as the
+        summary; markets without a rate are left out and listed.
+        """
+        # pandas is only needed here; keep it out of app startup
+        import equity_curve
+
+        user_id = current_user.id
+        market = market.upper() if market else None
+        currency = (currency or currency_conversion.REPORTING_CURRENCY).upper()
+        window = window if window is not None else equity_curve.DEFAULT_WIN_RATE_WINDOW
+        markets = [m for m in portfolio_rollup.load_markets(user_id) if not market or m['market'] == market]
+        latest_prices, rates = self.market_prices(markets, currency)
+        curve = equity_curve.equity_curve(user_id, market, interval, window, rates=rates)
+        unrealized = self.unrealized_by_market(markets, latest_prices)
+        curve['unrealized'] = float(sum(pl * rates[m] for m, pl in unrealized.items() if m in rates))
+        curve['equity'] = curve['totalRealized'] + curve['unrealized']
+        curve['currency'] = currency
+        curve['unconvertedMarkets'] = [m['market'] for m in markets if m['market'] not in rates]
+        return curve
+
+    @staticmethod
+    def sale_return_percentages(user_id):
+        """Partial P/L % of every sale of the user, the sample the risk simulator draws from"""
+        return db.session.execute(
+            select(Sale.partial_pl_percentage).join(Trade, Sale.trade_id == Trade.id).where(
+                Trade.user_id == user_id, Sale.partial_pl_percentage.is_not(None))
+        ).scalars().all()
+
+    def price_update(self, user_id, previous=None, currency=None):
+        """Latest quotes and total P/L for a user's open markets, keeping only what changed since `previous`"""
+        markets = portfolio_rollup.load_markets(user_id)
+        latest_prices, rates = self.market_prices(markets, currency)
+        unrealized = self.unrealized_by_market(markets, latest_prices)
+        total_pl = self.total_profit_loss(markets, unrealized, rates)
+
+        previous = previous or {'quotes': {}, 'totalProfitLoss': None}
+        current = {'quotes': latest_prices, 'totalProfitLoss': float(total_pl)}
+        changes = {'quotes': {k: v for k, v in latest_prices.items() if previous['quotes'].get(k) != v}}
+        if current['totalProfitLoss'] != previous['totalProfitLoss']:
+            changes['totalProfitLoss'] = current['totalProfitLoss']
+        return current, changes
+
+    @staticmethod
+    def recent_trades(user_id, limit=5):
+        """Most recent trades, newest first"""
+        return Trade.query.filter_by(user_id=user_id).order_by(Trade.date.desc(), Trade.id).limit(limit).all()
+
     @staticmethod
     def clean_trade_data(data):
         """Clean data for JSON serialization"""
         if isinstance(data, (list, tuple)):
             return [TradeCalculator.clean_trade_data(item) for item in data]
         elif isinstance(data, dict):
-            return {k: (v.isoformat() if isinstance(v, datetime) else None if pd.isna(v) else v) 
-                   for k, v in data.items()}
+            return {k: serializers.clean_value(v) for k, v in data.items()}
         return data
 
     @staticmethod
@@ -269,7 +797,9 @@ class TradeCalculator:
             'Entry Price': trade.entry_price,
             'Units': trade.units,
             'Remaining Units': trade.remaining_units,
-            'Position Size': trade.position_size
+            'Position Size': trade.position_size,
+            'Stop Price': trade.stop_price,
+            'Target Price': trade.target_price
         }
 
     @staticmethod
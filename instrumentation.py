@@ -0,0 +1,226 @@
+import bisect
+import cProfile
+import functools
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Named under this module so it can't collide with the requests HTTP library's logger
+request_logger = logging.getLogger(__name__ + '.access')
+
+# Incoming X-Request-ID values are reused only if they look like ids
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,128}$')
+
+# Latency buckets in seconds, Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """Thread-safe Prometheus-style histogram keyed by label values"""
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.snapshot().items()):
+            labels = [f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, label_values)]
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(labels, bound)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(labels, '+Inf')} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(labels)} {series[-1]}")
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, le=None):
+    if le is not None:
+        labels = labels + [f'le="{le}"']
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+request_duration = Histogram('http_request_duration_seconds', 'Request latency by route',
+                             ('method', 'route', 'status'))
+request_queries = Histogram('http_request_db_queries', 'SQL statements executed per request',
+                            ('route',), QUERY_COUNT_BUCKETS)
+request_query_duration = Histogram('http_request_db_duration_seconds', 'Time spent in SQL per request', ('route',))
+operation_duration = Histogram('hot_path_duration_seconds', 'Latency of instrumented hot-path operations',
+                               ('operation',))
+
+HISTOGRAMS = [request_duration, request_queries, request_query_duration, operation_duration]
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    return '\n'.join(h.render() for h in HISTOGRAMS) + '\n'
+
+
+@contextmanager
+def timer(operation):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        operation_duration.observe(time.perf_counter() - started, operation)
+
+
+def timed(operation):
+    """Decorator recording the wrapped call's latency under `operation`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'db_queries' in g:
+        context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is not None and has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += time.perf_counter() - started
+
+
+def token_matches(supplied, expected):
+    """Constant-time comparison; nothing matches an unset token"""
+    return bool(expected) and hmac.compare_digest(supplied.encode(), expected.encode())
+
+
+def bearer_token():
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else ''
+
+
+def profiling_requested(token):
+    """The request asks for a profile and carries the shared profiling token"""
+    asked = request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+    return asked and token_matches(request.headers.get('X-Profile-Token', ''), token)
+
+
+def request_id():
+    """The caller's X-Request-ID if it is usable, else a new one"""
+    incoming = request.headers.get('X-Request-ID', '')
+    return incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex
+
+
+def init_app(app):
+    """Register request ids, timing, per-request SQL accounting, an access log, opt-in profiling and /metrics.
+
+    Profiling needs PROFILING_ENABLED=1 and the PROFILING_TOKEN in an
+    X-Profile-Token header. /metrics needs METRICS_TOKEN as a bearer token,
+    or METRICS_PUBLIC=1 when it is only reachable from a private network;
+    otherwise it is not served.
+    """
+    profiling_token = os.getenv('PROFILING_TOKEN', '') if os.getenv('PROFILING_ENABLED', '0') == '1' else ''
+    metrics_token = os.getenv('METRICS_TOKEN', '')
+    metrics_public = os.getenv('METRICS_PUBLIC', '0') == '1'
+    access_log = os.getenv('ACCESS_LOG', '1') == '1'
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_id = request_id()
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        g.db_seconds = 0.0
+        if profiling_token and profiling_requested(profiling_token):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _record_request(response):
+        if 'request_started' not in g:
+            return response
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        elapsed = time.perf_counter() - g.pop('request_started')
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_duration.observe(elapsed, request.method, route, str(response.status_code))
+        request_queries.observe(g.db_queries, route)
+        request_query_duration.observe(g.db_seconds, route)
+        response.headers['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, db;dur={g.db_seconds * 1000:.1f};desc="{g.db_queries} queries"'
+        )
+        if access_log:
+            request_logger.info('%s %s %s %.1fms', request.method, request.path, response.status_code,
+                                elapsed * 1000, extra={
+                                    'method': request.method, 'route': route, 'status': response.status_code,
+                                    'duration_ms': round(elapsed * 1000, 2), 'db_queries': g.db_queries,
+                                    'db_ms': round(g.db_seconds * 1000, 2)})
+        if profiler is not None:
+            response = profile_response(profiler)
+        response.headers['X-Request-ID'] = g.request_id
+        return response
+
+    @app.teardown_request
+    def _record_failed_request(exc):
+        # Unhandled exceptions skip after_request
+        if exc is not None and 'request_started' in g:
+            profiler = g.pop('profiler', None)
+            if profiler is not None:
+                profiler.disable()
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            request_duration.observe(time.perf_counter() - g.pop('request_started'), request.method, route, '500')
+
+    @app.route('/metrics')
+    def metrics():
+        if not metrics_public and not token_matches(bearer_token(), metrics_token):
+            abort(401 if metrics_token else 404)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def profile_response(profiler, limit=60):
+    """Plain-text cProfile report sorted by cumulative time"""
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return Response(out.getvalue(), mimetype='text/plain')
@@ -1,4 +1,4 @@
-from app import app
+from app import app, init_db, start_background_services
 import os
 
 if __name__ == "__main__":
@@ -6,4 +6,7 @@ if __name__ == "__main__":
     app.debug = False
     # Get port from environment or default to 5000
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
+    init_db()
+    start_background_services()
+    # Summary streams each hold a thread while open
+    app.run(host="0.0.0.0", port=port, threaded=True)
@@ -0,0 +1,122 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Upstream responses worth retrying; other 4xx answers are returned to the caller
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MarketDataError(Exception):
+    """Raised when a market-data request fails after retries"""
+
+
+class CircuitOpenError(MarketDataError):
+    """Raised without touching the network while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets a single probe through once the reset timeout passes"""
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = int(failure_threshold if failure_threshold is not None
+                                     else os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+        self.reset_timeout = float(reset_timeout if reset_timeout is not None
+                                   else os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class MarketDataClient:
+    """Pooled keep-alive HTTP client with strict timeouts, jittered retries and a circuit breaker.
+
+    The worst-case time spent in get_json is bounded by `deadline` seconds
+    (plus at most one connect/read timeout for the attempt in flight).
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, retries=None, backoff=None,
+                 deadline=None, pool_size=None, breaker=None):
+        self.connect_timeout = float(connect_timeout if connect_timeout is not None
+                                     else os.getenv('MARKET_DATA_CONNECT_TIMEOUT', 3.05))
+        self.read_timeout = float(read_timeout if read_timeout is not None
+                                  else os.getenv('MARKET_DATA_READ_TIMEOUT', 5))
+        self.retries = int(retries if retries is not None else os.getenv('MARKET_DATA_RETRIES', 2))
+        self.backoff = float(backoff if backoff is not None else os.getenv('MARKET_DATA_BACKOFF', 0.25))
+        self.deadline = float(deadline if deadline is not None else os.getenv('MARKET_DATA_DEADLINE', 10))
+        pool_size = int(pool_size if pool_size is not None else os.getenv('MARKET_DATA_POOL_SIZE', 10))
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get_json(self, url, params=None, headers=None):
+        """GET a JSON document, retrying transient failures within the deadline"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for market data requests to {url}")
+
+        started = time.monotonic()
+        last_error = None
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, params=params, headers=headers,
+                                            timeout=(self.connect_timeout, self.read_timeout))
+                if response.status_code in RETRY_STATUSES:
+                    raise MarketDataError(f"Upstream returned HTTP {response.status_code}")
+                data = response.json()
+                self.breaker.record_success()
+                return data
+            except (requests.RequestException, ValueError, MarketDataError) as e:
+                last_error = e
+
+            if attempt == self.retries:
+                break
+            # Full jitter: sleep a random slice of the exponential backoff window
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            if time.monotonic() - started + delay >= self.deadline:
+                break
+            time.sleep(delay)
+
+        self.breaker.record_failure()
+        logger.warning("Market data request to %s failed: %s", url, last_error)
+        raise MarketDataError(str(last_error))
@@ -22,6 +22,11 @@ class User(UserMixin, db.Model):
         return f'<User {self.email}>'
 
 class Trade(db.Model):
+    __table_args__ = (
+        db.Index('ix_trade_user_date_id', 'user_id', 'date', 'id'),
+        db.Index('ix_trade_user_market', 'user_id', 'market'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     market = db.Column(db.String(50), nullable=False)
@@ -29,10 +34,17 @@ class Trade(db.Model):
     units = db.Column(db.Float, nullable=False)
     remaining_units = db.Column(db.Float, nullable=False)
     position_size = db.Column(db.Float, nullable=False)
+    # Optional alert levels: stop fires at or below, target at or above
+    stop_price = db.Column(db.Float)
+    target_price = db.Column(db.Float)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     sales = db.relationship('Sale', backref='trade', lazy=True)
 
 class Sale(db.Model):
+    __table_args__ = (
+        db.Index('ix_sale_trade_date', 'trade_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     units_sold = db.Column(db.Float, nullable=False)
@@ -40,3 +52,34 @@ class Sale(db.Model):
     partial_pl = db.Column(db.Float, nullable=False)
     partial_pl_percentage = db.Column(db.Float, nullable=False)
     trade_id = db.Column(db.Integer, db.ForeignKey('trade.id'), nullable=False)
+
+class PortfolioStats(db.Model):
+    """Per-user, per-market rollup kept in step with Trade and Sale writes"""
+    __tablename__ = 'portfolio_stats'
+    __table_args__ = (db.UniqueConstraint('user_id', 'market', name='uq_portfolio_stats_user_market'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    market = db.Column(db.String(50), nullable=False)
+    first_trade_id = db.Column(db.Integer, nullable=False)
+    last_trade_id = db.Column(db.Integer, nullable=False)
+    last_sale_id = db.Column(db.Integer)
+    trade_count = db.Column(db.Integer, nullable=False, default=0)
+    open_trade_count = db.Column(db.Integer, nullable=False, default=0)
+    closed_trade_count = db.Column(db.Integer, nullable=False, default=0)
+    total_position = db.Column(db.Float, nullable=False, default=0.0)
+    open_position = db.Column(db.Float, nullable=False, default=0.0)
+    largest_position = db.Column(db.Float, nullable=False, default=0.0)
+    open_units = db.Column(db.Float, nullable=False, default=0.0)
+    open_cost = db.Column(db.Float, nullable=False, default=0.0)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    realized_pl = db.Column(db.Float, nullable=False, default=0.0)
+    win_count = db.Column(db.Integer, nullable=False, default=0)
+    loss_count = db.Column(db.Integer, nullable=False, default=0)
+    pl_pct_sum = db.Column(db.Float, nullable=False, default=0.0)
+    best_sale_pct = db.Column(db.Float)
+    best_trade_id = db.Column(db.Integer)
+    best_sale_id = db.Column(db.Integer)
+    worst_sale_pct = db.Column(db.Float)
+    worst_trade_id = db.Column(db.Integer)
+    worst_sale_id = db.Column(db.Integer)
@@ -0,0 +1,186 @@
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+MAX_PATHS = int(os.getenv('MONTE_CARLO_MAX_PATHS', 5_000_000))
+MAX_TRADES = 10_000
+DEFAULT_TIME_BUDGET = float(os.getenv('MONTE_CARLO_TIME_BUDGET', 10))
+MAX_TIME_BUDGET = float(os.getenv('MONTE_CARLO_MAX_TIME_BUDGET', 60))
+# Paths x trades simulated per shard (about 0.1s of work); bounds worker memory and how far a
+# run can overrun its budget, since a shard that has started runs to completion
+SHARD_CELLS = 2_000_000
+MIN_HISTORY_SAMPLES = 10
+PERCENTILES = [5, 25, 50, 75, 95]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    """Shared process pool, started on first use; spawned so workers don't inherit app state"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def simulate_shard(seed, paths, trades, risk_fraction, ruin_level, model):
+    """Simulate `paths` equity paths of `trades` fixed-fractional trades.
+
+    `model` is ('history', r_multiples) to bootstrap from past outcomes or
+    ('parametric', win_rate, payoff) for a win/loss coin with the given odds.
+    Returns per-path max drawdown and final equity (as float32 fractions of
+    the starting capital) and the number of paths that hit `ruin_level`.
+    """
+    rng = np.random.default_rng(seed)
+    if model[0] == 'history':
+        r_multiples = rng.choice(model[1], size=(paths, trades))
+    else:
+        _, win_rate, payoff = model
+        r_multiples = np.where(rng.random((paths, trades)) < win_rate, payoff, -1.0)
+
+    # Each trade risks risk_fraction of current equity per R; a loss can't take more than everything
+    equity = np.cumprod(np.maximum(1 + risk_fraction * r_multiples, 0), axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+    max_drawdown = (1 - equity / peak).max(axis=1)
+    ruined = int((equity.min(axis=1) <= ruin_level).sum())
+    return max_drawdown.astype(np.float32), equity[:, -1].astype(np.float32), ruined
+
+
+def history_model(returns, stop_percentage):
+    """R-multiples from past trade returns (%), with losses stopped out at -1R"""
+    returns = np.asarray(returns, dtype=float)
+    returns = returns[np.isfinite(returns)]
+    if len(returns) < MIN_HISTORY_SAMPLES:
+        raise ValueError(f"At least {MIN_HISTORY_SAMPLES} sales are needed to sample from history; "
+                         "provide winRate and payoff instead")
+    if not stop_percentage or stop_percentage <= 0:
+        raise ValueError("Stop distance must be greater than zero")
+    return ('history', np.maximum(returns, -stop_percentage) / stop_percentage)
+
+
+def parametric_model(win_rate, payoff):
+    """Win/loss model from a win rate (%) and the average win as a multiple of the average loss"""
+    if not 0 <= win_rate <= 100:
+        raise ValueError("Win rate must be between 0 and 100")
+    if payoff <= 0:
+        raise ValueError("Payoff must be greater than zero")
+    return ('parametric', win_rate / 100, float(payoff))
+
+
+def simulate(model, risk_percentage, trades=100, paths=100_000, ruin_threshold=50.0, capital_total=1.0,
+             seed=None, time_budget=None, workers=None):
+    """Outcome distribution of risking `risk_percentage` of equity on each of `trades` trades.
+
+    Paths are split into shards seeded from one SeedSequence, so a run with
+    a seed is reproducible whatever the worker count. Shards not yet started
+    when `time_budget` seconds have passed are dropped and the summary
+    covers the completed paths; the shards already running finish in the
+    background, so the pool stays busy for at most one shard per worker.
+    """
+    if not 0 < risk_percentage <= 100:
+        raise ValueError("Risk percentage must be between 0 and 100")
+    if not 1 <= trades <= MAX_TRADES:
+        raise ValueError(f"Trades must be between 1 and {MAX_TRADES}")
+    if not 1 <= paths <= MAX_PATHS:
+        raise ValueError(f"Paths must be between 1 and {MAX_PATHS}")
+    if not 0 < ruin_threshold <= 100:
+        raise ValueError("Ruin threshold must be between 0 and 100")
+    if time_budget is None:
+        time_budget = DEFAULT_TIME_BUDGET
+    elif not time_budget > 0:
+        raise ValueError("Time budget must be greater than zero")
+    time_budget = min(time_budget, MAX_TIME_BUDGET)
+    workers = workers if workers is not None else int(os.getenv('MONTE_CARLO_WORKERS', os.cpu_count() or 1))
+
+    started = time.perf_counter()
+    deadline = started + time_budget
+    shard_paths = max(1, SHARD_CELLS // trades)
+    sizes = [min(shard_paths, paths - start) for start in range(0, paths, shard_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(s, n, trades, risk_percentage / 100, 1 - ruin_threshold / 100, model) for s, n in zip(seeds, sizes)]
+
+    results = {}
+    if workers <= 1 or len(sizes) == 1:
+        for i, shard in enumerate(args):
+            if i and time.perf_counter() >= deadline:
+                break
+            results[i] = simulate_shard(*shard)
+    else:
+        # Running shards can't be cancelled, so only `workers` are in flight at a time and
+        # none is submitted after the deadline: an overrun is at most one shard per worker
+        executor = _get_executor(workers)
+        queued = iter(enumerate(args))
+        futures = {}
+        for i, shard in itertools.islice(queued, workers):
+            futures[executor.submit(simulate_shard, *shard)] = i
+        while futures:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[futures.pop(future)] = future.result()
+                if time.perf_counter() < deadline:
+                    for i, shard in itertools.islice(queued, 1):
+                        futures[executor.submit(simulate_shard, *shard)] = i
+
+    return summarize([results[i] for i in sorted(results)], model, risk_percentage, trades, paths,
+                     ruin_threshold, capital_total, time.perf_counter() - started)
+
+
+def summarize(shards, model, risk_percentage, trades, paths, ruin_threshold, capital_total, elapsed):
+    completed = sum(len(final) for _, final, _ in shards)
+    summary = {
+        'model': model[0],
+        'riskPercentage': risk_percentage,
+        'trades': trades,
+        'pathsRequested': paths,
+        'paths': completed,
+        'truncated': completed < paths,
+        'elapsedSeconds': round(elapsed, 3),
+        'ruinThreshold': ruin_threshold,
+    }
+    if model[0] == 'history':
+        r_multiples = model[1]
+        wins, losses = r_multiples[r_multiples > 0], r_multiples[r_multiples <= 0]
+        summary['samples'] = len(r_multiples)
+        summary['winRate'] = float(len(wins) / len(r_multiples) * 100)
+        summary['payoff'] = float(wins.mean() / -losses.mean()) if len(wins) and losses.mean() < 0 else None
+    else:
+        summary['winRate'] = model[1] * 100
+        summary['payoff'] = model[2]
+    if not completed:
+        return summary
+
+    max_drawdown = np.concatenate([dd for dd, _, _ in shards]).astype(float)
+    final = np.concatenate([f for _, f, _ in shards]).astype(float)
+    # Paths past the ruin threshold keep trading to the end; only a path wiped out to zero
+    # equity (100% risk on a full loss) has log growth -inf, which makes the expectation -100%
+    with np.errstate(divide='ignore'):
+        log_growth = np.log(final).mean() / trades
+    summary.update({
+        'riskOfRuin': float(sum(r for _, _, r in shards) / completed * 100),
+        'maxDrawdownPercentiles': {f'p{q}': float(v) * 100 for q, v in zip(
+            PERCENTILES, np.percentile(max_drawdown, PERCENTILES))},
+        'finalEquityPercentiles': {f'p{q}': float(v) * capital_total for q, v in zip(
+            PERCENTILES, np.percentile(final, PERCENTILES))},
+        'meanFinalEquity': float(final.mean()) * capital_total,
+        'expectedGrowthPerTrade': float(math.expm1(log_growth) * 100),
+    })
+    return summary
@@ -0,0 +1,289 @@
+import math
+
+from sqlalchemy import and_, case, func, inspect, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models.user import db, Trade, Sale, PortfolioStats
+
+STAT_FIELDS = [
+    'first_trade_id', 'last_trade_id', 'last_sale_id',
+    'trade_count', 'open_trade_count', 'closed_trade_count',
+    'total_position', 'open_position', 'largest_position', 'open_units', 'open_cost',
+    'sale_count', 'realized_pl', 'win_count', 'loss_count', 'pl_pct_sum',
+    'best_sale_pct', 'best_trade_id', 'best_sale_id',
+    'worst_sale_pct', 'worst_trade_id', 'worst_sale_id',
+]
+
+
+def aggregate_markets(user_id, markets=None):
+    """Per-market rollup rows recomputed from the raw trade and sale tables, in first-trade order"""
+    is_open = Trade.remaining_units > 0
+    scope = [Trade.user_id == user_id]
+    if markets is not None:
+        scope.append(Trade.market.in_(markets))
+    trade_rows = db.session.query(
+        Trade.market,
+        func.min(Trade.id),
+        func.max(Trade.id),
+        func.count(Trade.id),
+        func.sum(case((is_open, 1), else_=0)),
+        func.sum(case((Trade.remaining_units == 0, 1), else_=0)),
+        func.sum(Trade.position_size),
+        func.sum(case((is_open, Trade.position_size), else_=0.0)),
+        func.max(Trade.position_size),
+        func.sum(case((is_open, Trade.remaining_units), else_=0.0)),
+        func.sum(case((is_open, Trade.entry_price * Trade.remaining_units), else_=0.0)),
+    ).filter(*scope).group_by(Trade.market).order_by(func.min(Trade.id)).all()
+
+    sale_rows = db.session.query(
+        Trade.market,
+        func.max(Sale.id),
+        func.count(Sale.id),
+        func.sum(Sale.partial_pl),
+        func.sum(case((Sale.partial_pl > 0, 1), else_=0)),
+        func.sum(case((Sale.partial_pl < 0, 1), else_=0)),
+        func.sum(Sale.partial_pl_percentage),
+    ).join(Trade, Sale.trade_id == Trade.id).filter(*scope).group_by(Trade.market).all()
+    sales_by_market = {row[0]: row[1:] for row in sale_rows}
+    extremes = extreme_sales(user_id, markets)
+
+    markets = []
+    for (market, first_trade_id, last_trade_id, trade_count, open_count, closed_count, total_position,
+         open_position, largest_position, open_units, open_cost) in trade_rows:
+        last_sale_id, sale_count, realized_pl, win_count, loss_count, pl_pct_sum = sales_by_market.get(
+            market, (None, 0, 0.0, 0, 0, 0.0))
+        row = {
+            'market': market,
+            'first_trade_id': first_trade_id,
+            'last_trade_id': last_trade_id,
+            'last_sale_id': last_sale_id,
+            'trade_count': trade_count,
+            'open_trade_count': open_count,
+            'closed_trade_count': closed_count,
+            'total_position': float(total_position or 0),
+            'open_position': float(open_position or 0),
+            'largest_position': float(largest_position or 0),
+            'open_units': float(open_units or 0),
+            'open_cost': float(open_cost or 0),
+            'sale_count': sale_count,
+            'realized_pl': float(realized_pl or 0),
+            'win_count': win_count or 0,
+            'loss_count': loss_count or 0,
+            'pl_pct_sum': float(pl_pct_sum or 0),
+            'best_sale_pct': None, 'best_trade_id': None, 'best_sale_id': None,
+            'worst_sale_pct': None, 'worst_trade_id': None, 'worst_sale_id': None,
+        }
+        row.update(extremes.get(market, {}))
+        markets.append(row)
+    return markets
+
+
+def extreme_sales(user_id, markets=None):
+    """Best and worst sale per market by P/L %, ties going to the earliest trade and sale"""
+    order = (Trade.id, Sale.id)
+    scope = [Trade.user_id == user_id]
+    if markets is not None:
+        scope.append(Trade.market.in_(markets))
+    ranked = db.session.query(
+        Trade.market.label('market'),
+        Sale.partial_pl_percentage.label('pct'),
+        Trade.id.label('trade_id'),
+        Sale.id.label('sale_id'),
+        func.row_number().over(partition_by=Trade.market,
+                               order_by=(Sale.partial_pl_percentage.desc(),) + order).label('best_rank'),
+        func.row_number().over(partition_by=Trade.market,
+                               order_by=(Sale.partial_pl_percentage.asc(),) + order).label('worst_rank'),
+    ).join(Trade, Sale.trade_id == Trade.id).filter(*scope).subquery()
+
+    extremes = {}
+    rows = db.session.query(ranked).filter(or_(ranked.c.best_rank == 1, ranked.c.worst_rank == 1)).all()
+    for row in rows:
+        entry = extremes.setdefault(row.market, {})
+        if row.best_rank == 1:
+            entry.update(best_sale_pct=row.pct, best_trade_id=row.trade_id, best_sale_id=row.sale_id)
+        if row.worst_rank == 1:
+            entry.update(worst_sale_pct=row.pct, worst_trade_id=row.trade_id, worst_sale_id=row.sale_id)
+    return extremes
+
+
+def apply_trade(trade):
+    """Fold a newly added trade into its market rollup, in the caller's transaction"""
+    is_open = 1 if trade.remaining_units > 0 else 0
+    position = trade.position_size
+    values = {
+        'trade_count': PortfolioStats.trade_count + 1,
+        'last_trade_id': case((PortfolioStats.last_trade_id < trade.id, trade.id),
+                              else_=PortfolioStats.last_trade_id),
+        'open_trade_count': PortfolioStats.open_trade_count + is_open,
+        'closed_trade_count': PortfolioStats.closed_trade_count + (1 - is_open),
+        'total_position': PortfolioStats.total_position + position,
+        'open_position': PortfolioStats.open_position + position * is_open,
+        'largest_position': case((PortfolioStats.largest_position < position, position),
+                                 else_=PortfolioStats.largest_position),
+        'open_units': PortfolioStats.open_units + trade.remaining_units * is_open,
+        'open_cost': PortfolioStats.open_cost + trade.entry_price * trade.remaining_units * is_open,
+    }
+    if _update_stats(trade.user_id, trade.market, values):
+        return
+
+    stats = PortfolioStats(
+        user_id=trade.user_id, market=trade.market, first_trade_id=trade.id, last_trade_id=trade.id,
+        trade_count=1, open_trade_count=is_open, closed_trade_count=1 - is_open,
+        total_position=position, open_position=position * is_open, largest_position=position,
+        open_units=trade.remaining_units * is_open, open_cost=trade.entry_price * trade.remaining_units * is_open,
+        sale_count=0, realized_pl=0.0, win_count=0, loss_count=0, pl_pct_sum=0.0
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(stats)
+    except IntegrityError:
+        # Another writer created the row first
+        _update_stats(trade.user_id, trade.market, values)
+
+
+def apply_sale(trade, sale, old_remaining, old_position):
+    """Fold a sale into its market rollup, in the caller's transaction"""
+    db.session.flush()
+    sold = sale.units_sold
+    pct = sale.partial_pl_percentage
+    closed = 1 if old_remaining > 0 and not trade.remaining_units > 0 else 0
+    delta_position = trade.position_size - old_position
+    now_empty = PortfolioStats.open_trade_count - closed == 0
+    market_max = select(func.max(Trade.position_size)).where(
+        Trade.user_id == trade.user_id, Trade.market == trade.market
+    ).scalar_subquery()
+    beats_best = or_(PortfolioStats.best_sale_pct.is_(None), PortfolioStats.best_sale_pct < pct,
+                     and_(PortfolioStats.best_sale_pct == pct, PortfolioStats.best_trade_id > trade.id))
+    beats_worst = or_(PortfolioStats.worst_sale_pct.is_(None), PortfolioStats.worst_sale_pct > pct,
+                      and_(PortfolioStats.worst_sale_pct == pct, PortfolioStats.worst_trade_id > trade.id))
+
+    _update_stats(trade.user_id, trade.market, {
+        'open_trade_count': PortfolioStats.open_trade_count - closed,
+        'closed_trade_count': PortfolioStats.closed_trade_count + closed,
+        'total_position': PortfolioStats.total_position + delta_position,
+        'open_position': case((now_empty, 0.0), else_=PortfolioStats.open_position + delta_position),
+        'open_units': case((now_empty, 0.0), else_=PortfolioStats.open_units - sold),
+        'open_cost': case((now_empty, 0.0), else_=PortfolioStats.open_cost - trade.entry_price * sold),
+        'largest_position': case((PortfolioStats.largest_position > old_position, PortfolioStats.largest_position),
+                                 else_=market_max),
+        'sale_count': PortfolioStats.sale_count + 1,
+        'last_sale_id': case((or_(PortfolioStats.last_sale_id.is_(None), PortfolioStats.last_sale_id < sale.id), sale.id),
+                             else_=PortfolioStats.last_sale_id),
+        'realized_pl': PortfolioStats.realized_pl + sale.partial_pl,
+        'win_count': PortfolioStats.win_count + (1 if sale.partial_pl > 0 else 0),
+        'loss_count': PortfolioStats.loss_count + (1 if sale.partial_pl < 0 else 0),
+        'pl_pct_sum': PortfolioStats.pl_pct_sum + pct,
+        'best_sale_pct': case((beats_best, pct), else_=PortfolioStats.best_sale_pct),
+        'best_trade_id': case((beats_best, trade.id), else_=PortfolioStats.best_trade_id),
+        'best_sale_id': case((beats_best, sale.id), else_=PortfolioStats.best_sale_id),
+        'worst_sale_pct': case((beats_worst, pct), else_=PortfolioStats.worst_sale_pct),
+        'worst_trade_id': case((beats_worst, trade.id), else_=PortfolioStats.worst_trade_id),
+        'worst_sale_id': case((beats_worst, sale.id), else_=PortfolioStats.worst_sale_id),
+    })
+
+
+def refresh_markets(user_id, markets):
+    """Recompute the rollups of some markets from the raw tables, in the caller's transaction.
+
+    Used after bulk writes, where one aggregate per market is cheaper than
+    folding in every row. Rows are updated in place rather than replaced, so
+    concurrent apply_trade/apply_sale deltas still land on them.
+    """
+    for row in aggregate_markets(user_id, markets):
+        values = {field: row[field] for field in STAT_FIELDS}
+        if _update_stats(user_id, row['market'], values):
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(PortfolioStats(user_id=user_id, market=row['market'], **values))
+        except IntegrityError:
+            _update_stats(user_id, row['market'], values)
+
+
+def _update_stats(user_id, market, values):
+    result = db.session.execute(
+        update(PortfolioStats)
+        .where(PortfolioStats.user_id == user_id, PortfolioStats.market == market)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def ensure_schema():
+    """Drop portfolio_stats if its columns are out of date; it is rebuilt from the raw tables on demand"""
+    inspector = inspect(db.engine)
+    table = PortfolioStats.__table__
+    if inspector.has_table(table.name):
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        if existing != set(table.columns.keys()):
+            table.drop(db.engine)
+
+
+def data_version(markets):
+    """Changes whenever a trade or sale is written for any of the markets"""
+    return (
+        max((m['last_trade_id'] or 0 for m in markets), default=0),
+        max((m['last_sale_id'] or 0 for m in markets), default=0),
+        sum(m['trade_count'] for m in markets),
+        sum(m['sale_count'] for m in markets),
+    )
+
+
+def load_markets(user_id):
+    """Rollup rows for a user as dicts, rebuilding them first if they are missing"""
+    rows = PortfolioStats.query.filter_by(user_id=user_id).order_by(PortfolioStats.first_trade_id).all()
+    if not rows and db.session.query(Trade.id).filter_by(user_id=user_id).first():
+        rebuild(user_id)
+        rows = PortfolioStats.query.filter_by(user_id=user_id).order_by(PortfolioStats.first_trade_id).all()
+    return [stats_to_dict(row) for row in rows]
+
+
+def extreme_trade_ids(markets):
+    """Trade ids owning the overall best and worst sale across market rollups"""
+    with_sales = [m for m in markets if m['best_sale_pct'] is not None]
+    if not with_sales:
+        return None, None
+    best = min(with_sales, key=lambda m: (-m['best_sale_pct'], m['best_trade_id'], m['best_sale_id']))
+    worst = min(with_sales, key=lambda m: (m['worst_sale_pct'], m['worst_trade_id'], m['worst_sale_id']))
+    return best['best_trade_id'], worst['worst_trade_id']
+
+
+def rebuild(user_id=None):
+    """Recompute rollups from the raw tables; returns the number of market rows that had drifted"""
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = sorted({uid for (uid,) in db.session.query(Trade.user_id).distinct()} |
+                          {uid for (uid,) in db.session.query(PortfolioStats.user_id).distinct()})
+
+    drifted = 0
+    for uid in user_ids:
+        fresh = {m['market']: m for m in aggregate_markets(uid)}
+        current = {row.market: stats_to_dict(row) for row in PortfolioStats.query.filter_by(user_id=uid)}
+        drifted += sum(1 for market in fresh.keys() | current.keys()
+                       if not _stats_match(fresh.get(market), current.get(market)))
+
+        PortfolioStats.query.filter_by(user_id=uid).delete()
+        db.session.add_all(PortfolioStats(user_id=uid, **m) for m in fresh.values())
+    db.session.commit()
+    return drifted
+
+
+def stats_to_dict(stats):
+    row = {'market': stats.market}
+    row.update({field: getattr(stats, field) for field in STAT_FIELDS})
+    return row
+
+
+def _stats_match(a, b):
+    if a is None or b is None:
+        return a is b
+    for field in STAT_FIELDS:
+        x, y = a[field], b[field]
+        if isinstance(x, float) and isinstance(y, float):
+            if not math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-6):
+                return False
+        elif x != y:
+            return False
+    return True
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import statistics
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+from market_data import MarketDataClient, MarketDataError
+
+logger = logging.getLogger(__name__)
+
+
+class PriceProvider:
+    """Source of latest USD-ish quotes keyed by base symbol"""
+    name = 'base'
+
+    def fetch(self, base_symbols):
+        """Return {base_symbol: price}; raise MarketDataError on failure"""
+        raise NotImplementedError
+
+
+class CoinMarketCapProvider(PriceProvider):
+    name = 'coinmarketcap'
+
+    def __init__(self, client=None, api_key=None, api_url=None):
+        # Each provider gets its own pool and circuit breaker
+        self.client = client or MarketDataClient()
+        self.api_key = api_key or os.getenv('COINMARKETCAP_API_KEY')
+        self.api_url = api_url or os.getenv('COINMARKETCAP_API_URL', 'https://pro-api.coinmarketcap.com')
+
+    def fetch(self, base_symbols):
+        url = f"{self.api_url}/v1/cryptocurrency/quotes/latest"
+        parameters = {
+            'symbol': ','.join(base_symbols),
+            'convert': 'USD',
+            # Unknown symbols are dropped from the answer instead of failing the whole request
+            'skip_invalid': 'true'
+        }
+        headers = {
+            'X-CMC_PRO_API_KEY': self.api_key,
+            'Accept': 'application/json'
+        }
+        data = self.client.get_json(url, params=parameters, headers=headers)
+        if 'data' not in data:
+            raise MarketDataError(f"CoinMarketCap error: {data.get('status', {}).get('error_message')}")
+
+        quotes = data['data']
+        prices = {}
+        for symbol in base_symbols:
+            try:
+                price = quotes[symbol]['quote']['USD']['price']
+            except (KeyError, TypeError):
+                continue
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+
+class BinanceProvider(PriceProvider):
+    """Binance public REST ticker; prices are in the configured quote asset (USDT by default)"""
+    name = 'binance'
+
+    def __init__(self, client=None, api_url=None, quote_asset=None):
+        self.client = client or MarketDataClient()
+        self.api_url = api_url or os.getenv('BINANCE_API_URL', 'https://api.binance.com')
+        self.quote_asset = (quote_asset or os.getenv('BINANCE_QUOTE_ASSET', 'USDT')).upper()
+
+    def fetch(self, base_symbols):
+        # Precomputed pair -> base index, e.g. 'ETHUSDT' -> 'ETH'
+        pairs = {f"{symbol}{self.quote_asset}": symbol for symbol in base_symbols}
+        url = f"{self.api_url}/api/v3/ticker/price"
+        data = self.client.get_json(url, params={'symbols': json.dumps(sorted(pairs), separators=(',', ':'))})
+        if not isinstance(data, list):
+            # One unknown pair rejects the whole batch, so fall back to the full ticker list
+            data = self.client.get_json(url)
+            if not isinstance(data, list):
+                raise MarketDataError(f"Binance error: {data}")
+
+        return {pairs[t['symbol']]: float(t['price']) for t in data if t.get('symbol') in pairs}
+
+
+class StubProvider(PriceProvider):
+    """Fixed prices from a dict or a JSON fixture file, for offline runs and tests"""
+    name = 'stub'
+
+    def __init__(self, prices=None, path=None):
+        path = path or os.getenv('PRICE_STUB_FILE')
+        if prices is None and path:
+            with open(path) as f:
+                prices = json.load(f)
+        self.prices = {k.upper(): float(v) for k, v in (prices or {}).items()}
+
+    def fetch(self, base_symbols):
+        return {symbol: self.prices[symbol] for symbol in base_symbols if symbol in self.prices}
+
+
+PROVIDERS = {
+    'coinmarketcap': CoinMarketCapProvider,
+    'binance': BinanceProvider,
+    'stub': StubProvider,
+}
+
+
+class PriceEngine:
+    """Fans a quote request out to every provider concurrently and aggregates the answers.
+
+    'first' keeps, per symbol, the first successful answer and returns as soon
+    as every symbol is priced; 'median' waits for all providers (within the
+    timeout) and takes the per-symbol median.
+    """
+
+    def __init__(self, providers, strategy='first', timeout=None):
+        if strategy not in ('first', 'median'):
+            raise ValueError("Aggregation strategy must be 'first' or 'median'")
+        self.providers = list(providers)
+        self.strategy = strategy
+        self.timeout = float(timeout if timeout is not None else os.getenv('PRICE_ENGINE_TIMEOUT', 10))
+        self._executor = ThreadPoolExecutor(max_workers=max(4, len(self.providers) * 4),
+                                            thread_name_prefix='price-provider')
+
+    def fetch(self, base_symbols):
+        symbols = list(dict.fromkeys(base_symbols))
+        if not symbols or not self.providers:
+            return {}
+
+        futures = {self._executor.submit(provider.fetch, symbols): provider for provider in self.providers}
+        first = {}
+        answers = {}
+        try:
+            for future in as_completed(futures, timeout=self.timeout):
+                provider = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning("Price provider %s failed: %s", provider.name, e)
+                    continue
+                for symbol, price in result.items():
+                    first.setdefault(symbol, price)
+                    answers.setdefault(symbol, []).append(price)
+                if self.strategy == 'first' and len(first) == len(symbols):
+                    break
+        except TimeoutError:
+            logger.warning("Price providers timed out after %ss", self.timeout)
+
+        if self.strategy == 'median':
+            return {symbol: statistics.median(prices) for symbol, prices in answers.items()}
+        return first
+
+
+def build_price_engine():
+    """PriceEngine configured from PRICE_PROVIDERS and PRICE_AGGREGATION"""
+    names = [n.strip().lower() for n in os.getenv('PRICE_PROVIDERS', 'coinmarketcap,binance').split(',') if n.strip()]
+    unknown = [n for n in names if n not in PROVIDERS]
+    if unknown:
+        raise ValueError(f"Unknown price providers: {', '.join(unknown)}")
+    return PriceEngine([PROVIDERS[n]() for n in names], strategy=os.getenv('PRICE_AGGREGATION', 'first'))
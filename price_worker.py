@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+
+import currency_conversion
+from models.user import db, Trade
+
+logger = logging.getLogger(__name__)
+
+
+class PriceRefreshWorker:
+    """Background thread that keeps the quote cache warm for every open market.
+
+    Each tick collects the distinct markets with remaining units across all
+    users and fetches them in as few batched upstream calls as the symbol
+    limit allows, so request handlers never do network I/O for prices.
+    """
+
+    def __init__(self, app, calculator, interval=None, batch_size=None):
+        self.app = app
+        self.calculator = calculator
+        self.interval = float(interval if interval is not None else os.getenv('PRICE_REFRESH_INTERVAL', 30))
+        self.batch_size = int(batch_size if batch_size is not None else os.getenv('PRICE_BATCH_SIZE', 100))
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the refresh loop and serve summaries from the local price table"""
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='price-refresh-worker', daemon=True)
+        self._thread.start()
+        self.calculator.local_prices_only = True
+        logger.info("Price refresh worker started (interval=%ss, batch size=%d)", self.interval, self.batch_size)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        self.calculator.local_prices_only = False
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def request_refresh(self):
+        """Wake the worker early, e.g. after a trade in a new market"""
+        self._wake.set()
+
+    def collect_symbols(self):
+        """Distinct base and quote currencies of all markets with open positions, less the fixed-rate ones"""
+        with self.app.app_context():
+            try:
+                markets = db.session.query(Trade.market).filter(Trade.remaining_units > 0).distinct().all()
+            finally:
+                db.session.remove()
+        return currency_conversion.anchor_symbols(market for (market,) in markets)
+
+    def refresh_once(self):
+        """Fetch and publish quotes for every open market; returns the number of upstream calls"""
+        symbols = self.collect_symbols()
+        calls = 0
+        for i in range(0, len(symbols), self.batch_size):
+            batch = symbols[i:i + self.batch_size]
+            prices = self.calculator.fetch_quotes(batch)
+            calls += 1
+            if prices:
+                self.calculator.quote_cache.put_many(prices)
+        return calls
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                logger.error("Price refresh failed: %s", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
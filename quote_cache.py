@@ -0,0 +1,153 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteCache:
+    """Process-wide TTL cache of latest quotes keyed by base symbol.
+
+    Concurrent misses for the same symbol are coalesced into a single call to
+    the fetcher, and expired entries keep being served while a background
+    refresh is in flight.
+    """
+
+    def __init__(self, ttl=None, max_size=None, wait_timeout=None):
+        self.ttl = float(ttl if ttl is not None else os.getenv('QUOTE_CACHE_TTL', 60))
+        self.max_size = int(max_size if max_size is not None else os.getenv('QUOTE_CACHE_MAX_SIZE', 1024))
+        self.wait_timeout = float(wait_timeout if wait_timeout is not None else os.getenv('QUOTE_CACHE_WAIT_TIMEOUT', 15))
+        self._entries = OrderedDict()  # symbol -> (price, fetched_at)
+        self._inflight = {}  # symbol -> threading.Event
+        self._lock = threading.Lock()
+        # Bumped whenever new prices are stored, so streams can wait for ticks
+        self._version = 0
+        self._updated = threading.Condition(self._lock)
+        self._listeners = []
+
+    def get_many(self, symbols, fetcher):
+        """Return {symbol: price} for the given base symbols.
+
+        `fetcher` is called with the list of symbols that are missing and not
+        already being fetched by another thread, and must return {symbol: price}.
+        """
+        now = time.monotonic()
+        result = {}
+        fetch_now = []
+        refresh_later = []
+        waiting = {}
+
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                entry = self._entries.get(symbol)
+                if entry is not None:
+                    price, fetched_at = entry
+                    self._entries.move_to_end(symbol)
+                    result[symbol] = price
+                    if now - fetched_at >= self.ttl and symbol not in self._inflight:
+                        self._inflight[symbol] = threading.Event()
+                        refresh_later.append(symbol)
+                elif symbol in self._inflight:
+                    waiting[symbol] = self._inflight[symbol]
+                else:
+                    self._inflight[symbol] = threading.Event()
+                    fetch_now.append(symbol)
+
+        if refresh_later:
+            threading.Thread(
+                target=self._refresh, args=(refresh_later, fetcher),
+                name='quote-cache-refresh', daemon=True
+            ).start()
+
+        if fetch_now:
+            result.update(self._refresh(fetch_now, fetcher))
+
+        if waiting:
+            deadline = time.monotonic() + self.wait_timeout
+            for event in set(waiting.values()):
+                event.wait(max(0.0, deadline - time.monotonic()))
+            with self._lock:
+                for symbol in waiting:
+                    entry = self._entries.get(symbol)
+                    if entry is not None:
+                        result[symbol] = entry[0]
+
+        return result
+
+    def peek_many(self, symbols):
+        """Return cached prices without fetching, whatever their age"""
+        with self._lock:
+            return {s: self._entries[s][0] for s in symbols if s in self._entries}
+
+    def put_many(self, prices):
+        """Store freshly fetched prices"""
+        fetched_at = time.monotonic()
+        with self._lock:
+            for symbol, price in prices.items():
+                self._store(symbol, price, fetched_at)
+            self._bump_version(prices)
+        self._notify(prices)
+
+    def add_listener(self, callback):
+        """Call `callback({symbol: price})` with every batch of newly stored quotes"""
+        self._listeners.append(callback)
+
+    @property
+    def version(self):
+        return self._version
+
+    def wait_for_update(self, version, timeout=None):
+        """Block until the cache version differs from `version` or the timeout expires; returns the current version"""
+        with self._updated:
+            self._updated.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _refresh(self, symbols, fetcher):
+        prices = {}
+        try:
+            prices = {s: p for s, p in (fetcher(symbols) or {}).items() if s in symbols}
+        except Exception as e:
+            logger.error("Error refreshing quotes: %s", e, exc_info=True)
+        finally:
+            fetched_at = time.monotonic()
+            with self._lock:
+                for symbol, price in prices.items():
+                    self._store(symbol, price, fetched_at)
+                self._bump_version(prices)
+                for symbol in symbols:
+                    event = self._inflight.pop(symbol, None)
+                    if event is not None:
+                        event.set()
+            self._notify(prices)
+        return prices
+
+    def _bump_version(self, prices):
+        if prices:
+            self._version += 1
+            self._updated.notify_all()
+
+    def _notify(self, prices):
+        # Called outside the lock so listeners can read the cache
+        if not prices:
+            return
+        for callback in self._listeners:
+            try:
+                callback(prices)
+            except Exception as e:
+                logger.error("Error in quote listener: %s", e, exc_info=True)
+
+    def _store(self, symbol, price, fetched_at):
+        self._entries[symbol] = (price, fetched_at)
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+# Shared by every TradeCalculator in the process
+quote_cache = QuoteCache()
@@ -0,0 +1,136 @@
+import re
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+from models.user import Trade, Sale
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+# UI key -> model column, in the order of TradeCalculator.trade_to_dict / sale_to_dict
+TRADE_FIELDS = [
+    ('id', Trade.id),
+    ('Date', Trade.date),
+    ('Market', Trade.market),
+    ('Entry Price', Trade.entry_price),
+    ('Units', Trade.units),
+    ('Remaining Units', Trade.remaining_units),
+    ('Position Size', Trade.position_size),
+    ('Stop Price', Trade.stop_price),
+    ('Target Price', Trade.target_price),
+]
+SALE_FIELDS = [
+    ('trade_id', Sale.trade_id),
+    ('Date', Sale.date),
+    ('Units Sold', Sale.units_sold),
+    ('Exit Price', Sale.exit_price),
+    ('Partial P/L', Sale.partial_pl),
+    ('Partial P/L %', Sale.partial_pl_percentage),
+]
+TRADE_KEYS = [key for key, _ in TRADE_FIELDS]
+SALE_KEYS = [key for key, _ in SALE_FIELDS]
+TRADE_COLUMNS = [column for _, column in TRADE_FIELDS]
+SALE_COLUMNS = [column for _, column in SALE_FIELDS]
+
+
+def clean_value(value):
+    """ISO string for datetimes, None for NaN, anything else unchanged"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # NaN is the only value not equal to itself
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+# The row builders below are the cleaned trade_to_dict / sale_to_dict
+# spelled out per column: a datetime becomes its ISO string and a float
+# NaN (the only value not equal to itself) becomes None, without a
+# per-value function call.
+
+def trade_rows(rows):
+    """Cleaned UI trade dicts from rows selected as TRADE_COLUMNS"""
+    return [
+        {
+            'id': trade_id,
+            'Date': date.isoformat() if date is not None else None,
+            'Market': market,
+            'Entry Price': entry_price if entry_price == entry_price else None,
+            'Units': units if units == units else None,
+            'Remaining Units': remaining_units if remaining_units == remaining_units else None,
+            'Position Size': position_size if position_size == position_size else None,
+            'Stop Price': stop_price if stop_price == stop_price else None,
+            'Target Price': target_price if target_price == target_price else None,
+        }
+        for trade_id, date, market, entry_price, units, remaining_units, position_size, stop_price, target_price
+        in rows
+    ]
+
+
+def sale_rows(rows):
+    """Cleaned UI sale dicts from rows selected as SALE_COLUMNS"""
+    return [
+        {
+            'trade_id': trade_id,
+            'Date': date.isoformat() if date is not None else None,
+            'Units Sold': units_sold if units_sold == units_sold else None,
+            'Exit Price': exit_price if exit_price == exit_price else None,
+            'Partial P/L': partial_pl if partial_pl == partial_pl else None,
+            'Partial P/L %': pl_percentage if pl_percentage == pl_percentage else None,
+        }
+        for trade_id, date, units_sold, exit_price, partial_pl, pl_percentage in rows
+    ]
+
+
+# Numbers orjson formats differently from json.dumps: exponent notation
+# (1e16 vs 1e+16) and values below 1e-4, which Python writes in exponent
+# form. A match inside a string only costs a stdlib fallback.
+_DIVERGENT_NUMBER = re.compile(rb'[0-9]e|(?<![0-9])0\.0000')
+# Above this size a regex scan costs more than the encoding; use NumPy instead
+_VECTOR_SCAN_BYTES = 64 * 1024
+
+
+def _has_divergent_number(data):
+    if len(data) < _VECTOR_SCAN_BYTES:
+        return _DIVERGENT_NUMBER.search(data) is not None
+
+    import numpy as np
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    digits = (buf >= ord('0')) & (buf <= ord('9'))
+    if (digits[:-1] & (buf[1:] == ord('e'))).any():
+        return True
+    start = data.find(b'0.0000')
+    while start != -1:
+        if start == 0 or not digits[start - 1]:
+            return True
+        start = data.find(b'0.0000', start + 1)
+    return False
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """orjson-backed provider whose output is byte-identical to Flask's default.
+
+    Only the compact response path is accelerated; pretty-printed output,
+    non-ASCII text, exponent-form floats and types orjson does not handle
+    natively go through the stdlib encoder. The one difference is NaN and
+    infinity, which become null instead of invalid JSON tokens; cleaned
+    payloads never contain them.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs != {'separators': (',', ':')} or not self.sort_keys or not self.ensure_ascii:
+            return super().dumps(obj, **kwargs)
+        try:
+            data = orjson.dumps(obj, default=self.default, option=(
+                orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+            ))
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+        if not data.isascii() or _has_divergent_number(data):
+            return super().dumps(obj, **kwargs)
+        return data.decode()
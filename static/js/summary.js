@@ -101,8 +101,46 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Auto-refresh prices every 60 seconds
-    setInterval(() => {
-        window.location.reload();
-    }, 60000);
+    function setColorValue(element, value) {
+        element.dataset.colorValue = value;
+        element.classList.remove('text-success', 'text-danger');
+        if (value > 0) {
+            element.classList.add('text-success');
+        } else if (value < 0) {
+            element.classList.add('text-danger');
+        }
+    }
+
+    // Patch prices and P/L in place as the server pushes changes
+    function applyPriceUpdate(update) {
+        Object.entries(update.quotes || {}).forEach(([market, price]) => {
+            const row = document.querySelector(`tr[data-market="${CSS.escape(market)}"]`);
+            const cell = row && row.querySelector('[data-field="latest-price"]');
+            if (cell) cell.textContent = formatCurrency(price);
+        });
+
+        if (update.totalProfitLoss !== undefined) {
+            const totalElement = document.getElementById('totalProfitLoss');
+            if (totalElement) {
+                totalElement.textContent = formatCurrency(update.totalProfitLoss);
+                setColorValue(totalElement, update.totalProfitLoss);
+            }
+        }
+    }
+
+    if (window.EventSource) {
+        const priceStream = new EventSource('/summary/stream');
+        priceStream.addEventListener('prices', event => {
+            try {
+                applyPriceUpdate(JSON.parse(event.data));
+            } catch (error) {
+                console.warn('Error applying price update:', error);
+            }
+        });
+    } else {
+        // Fall back to reloading the page every 60 seconds
+        setInterval(() => {
+            window.location.reload();
+        }, 60000);
+    }
 });
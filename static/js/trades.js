@@ -6,7 +6,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const partialSaleModal = new bootstrap.Modal(document.getElementById('partialSaleModal'));
     const partialSaleForm = document.getElementById('partial-sale-form');
     const salesHistoryBody = document.getElementById('salesHistoryBody');
+    const loadMoreBtn = document.getElementById('loadMoreTrades');
     let trades = [];
+    let nextCursor = null;
     let currentSort = { column: 'Date', direction: 'desc' };
 
     class NumberFormatter {
@@ -155,7 +157,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error(result.error || 'Failed to add trade');
             }
 
-            trades = result.trades;
+            trades.unshift(result.newTrade);
             updateTradesTable();
             tradeForm.reset();
             showAlert('Trade added successfully!', 'success');
@@ -206,7 +208,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error(result.error || 'Failed to process sale');
             }
 
-            trades = result.trades;
+            replaceTrade(result.updatedTrade);
             updateTradesTable();
             updateSalesHistory(result.salesHistory);
             partialSaleForm.reset();
@@ -224,6 +226,41 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    function replaceTrade(updatedTrade) {
+        const index = trades.findIndex(t => t.id === updatedTrade.id);
+        if (index === -1) {
+            trades.unshift(updatedTrade);
+        } else {
+            trades[index] = updatedTrade;
+        }
+    }
+
+    // Load trades one page at a time
+    async function loadTrades() {
+        try {
+            const params = new URLSearchParams({ limit: 100 });
+            if (nextCursor) params.set('cursor', nextCursor);
+
+            const response = await fetch(`/api/trades?${params}`);
+            const result = await response.json();
+
+            if (!response.ok) {
+                throw new Error(result.error || 'Failed to load trades');
+            }
+
+            trades = trades.concat(result.trades);
+            nextCursor = result.nextCursor;
+            loadMoreBtn.classList.toggle('d-none', !nextCursor);
+            updateTradesTable();
+
+        } catch (error) {
+            console.error('Error loading trades:', error);
+            showAlert(error.message || 'Failed to load trades', 'danger');
+        }
+    }
+
+    loadMoreBtn.addEventListener('click', loadTrades);
+
     function showAlert(message, type, location = 'page') {
         const alertDiv = document.createElement('div');
         alertDiv.className = `alert alert-${type} alert-dismissible fade show`;
@@ -419,4 +456,6 @@ document.addEventListener('DOMContentLoaded', function() {
         if (value === null || value === undefined) return '';
         return value > 0 ? 'text-success' : value < 0 ? 'text-danger' : '';
     }
+
+    loadTrades();
 });
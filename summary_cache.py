@@ -0,0 +1,35 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class SummaryCache:
+    """Bounded per-user cache of built summaries, keyed by the summary ETag"""
+
+    def __init__(self, max_size=None):
+        self.max_size = int(max_size if max_size is not None else os.getenv('SUMMARY_CACHE_MAX_SIZE', 1024))
+        self._entries = OrderedDict()  # user_id -> (etag, summary)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, etag):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != etag:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, etag, summary):
+        with self._lock:
+            self._entries[user_id] = (etag, summary)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+# Shared by every TradeCalculator in the process
+summary_cache = SummaryCache()
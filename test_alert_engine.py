@@ -0,0 +1,224 @@
+import random
+import time
+
+import pytest
+
+import alert_engine
+from alert_engine import AlertEngine, TriggerBook
+from models.user import db, Trade
+from quote_cache import QuoteCache
+from test_summary import StubCalculator
+
+SYMBOLS = ['BTC', 'ETH', 'SOL']
+
+
+def random_levels(rng, n):
+    """(trade_id, user_id, market, stop, target) rows around a price of 100"""
+    rows = []
+    for trade_id in range(1, n + 1):
+        stop = round(rng.uniform(50, 100), 2) if rng.random() < 0.8 else None
+        target = round(rng.uniform(100, 150), 2) if rng.random() < 0.8 else None
+        rows.append((trade_id, trade_id % 7, f"{rng.choice(SYMBOLS)}/USDT", stop, target))
+    return rows
+
+
+def write_tick_file(path, rng, n_ticks):
+    prices = dict.fromkeys(SYMBOLS, 100.0)
+    with open(path, 'w') as stream:
+        stream.write('timestamp,symbol,price\n')
+        for i in range(n_ticks):
+            symbol = rng.choice(SYMBOLS)
+            prices[symbol] = round(max(1.0, prices[symbol] * rng.uniform(0.97, 1.03)), 2)
+            stream.write(f"{i},{symbol}/USDT,{prices[symbol]}\n")
+
+
+def naive_replay(rows, ticks):
+    """Reference: scan every armed level on every tick"""
+    armed = {(trade_id, 'stop'): (market.split('/')[0], stop) for trade_id, _, market, stop, _ in rows
+             if stop is not None}
+    armed.update({(trade_id, 'target'): (market.split('/')[0], target) for trade_id, _, market, _, target in rows
+                  if target is not None})
+    fired = []
+    for symbol, price in ticks:
+        for (trade_id, kind), (market_symbol, level) in list(armed.items()):
+            if market_symbol == symbol and (price <= level if kind == 'stop' else price >= level):
+                fired.append((trade_id, kind, level, price))
+                del armed[(trade_id, kind)]
+    return fired
+
+
+def test_trigger_book_fires_only_crossed_levels():
+    book = TriggerBook()
+    book.add(1, stop=90.0, target=120.0)
+    book.add(2, stop=95.0)
+    book.extend([(80.0, 3)], [(110.0, 3)])
+
+    assert book.cross(100.0) == []
+    assert book.cross(95.0) == [('stop', 2, 95.0)]
+    assert sorted(book.cross(125.0)) == [('target', 1, 120.0), ('target', 3, 110.0)]
+    book.remove(1, stop=90.0)
+    assert book.cross(50.0) == [('stop', 3, 80.0)]
+    assert len(book) == 0
+
+
+def test_replayed_tick_file_matches_naive_scan(tmp_path):
+    rng = random.Random(21)
+    rows = random_levels(rng, 5000)
+    path = tmp_path / 'ticks.csv'
+    write_tick_file(path, rng, 3000)
+
+    engine = AlertEngine(queue_size=0)
+    engine.load(rows)
+    alerts = alert_engine.replay(engine, alert_engine.read_ticks(path))
+
+    expected = naive_replay(rows, list(alert_engine.read_ticks(path)))
+    assert sorted((a['tradeId'], a['kind'], a['level'], a['price']) for a in alerts) == sorted(expected)
+    assert len(engine.drain()) == len(alerts)
+    assert len(engine) == sum((s is not None) + (t is not None) for *_, s, t in rows) - len(alerts)
+
+
+def test_levels_fire_once_and_other_level_stays_armed():
+    engine = AlertEngine()
+    engine.load([])
+    engine.set_levels(1, 7, 'BTC/USDT', stop=90.0, target=110.0)
+
+    [alert] = engine.on_quotes({'BTC': 89.0})
+    assert (alert['tradeId'], alert['userId'], alert['kind'], alert['level'], alert['price']) == \
+        (1, 7, 'stop', 90.0, 89.0)
+    assert engine.on_quotes({'BTC': 80.0}) == []
+    assert [a['kind'] for a in engine.on_quotes({'BTC': 111.0})] == ['target']
+
+    engine.set_levels(2, 7, 'ETH/USDT', stop=10.0)
+    engine.set_levels(2, 7, 'ETH/USDT', stop=5.0)
+    assert engine.on_quotes({'ETH': 8.0}) == []
+    engine.remove(2)
+    assert engine.on_quotes({'ETH': 1.0}) == [] and len(engine) == 0
+
+
+def test_levels_are_in_the_markets_quote_currency(monkeypatch):
+    monkeypatch.setattr(alert_engine.currency_conversion, 'FIXED_RATES', {'USDT': 1.0, 'EUR': 1.25})
+    engine = AlertEngine()
+    engine.load([(1, 7, 'SOL/EUR', 100.0, None), (2, 7, 'SOL/ETH', 0.05, None)])
+    engine.set_levels(3, 7, 'SOL/EUR', target=140.0)
+    engine.set_levels(4, 7, 'ETH/BTC', target=0.1)
+    assert len(engine) == 2
+
+    # A 120 USD quote is 96 EUR: below the EUR stop, short of the EUR target
+    [alert] = engine.on_quotes({'SOL': 120.0})
+    assert (alert['tradeId'], alert['level'], alert['price']) == (1, 100.0, 96.0)
+    [alert] = engine.on_quotes({'SOL': 176.0})
+    assert (alert['tradeId'], alert['level'], alert['price']) == (3, 140.0, 140.8)
+    assert engine.on_quotes({'SOL': 0.01, 'ETH': 1e9}) == []
+
+
+def test_full_queue_drops_alerts():
+    engine = AlertEngine(queue_size=2)
+    engine.load([(i, 1, 'BTC/USDT', 90.0, None) for i in range(5)])
+    assert len(engine.on_quotes({'BTC': 50.0})) == 5
+    assert len(engine.drain()) == 2 and engine.dropped == 3
+
+
+def test_changes_during_load_are_kept():
+    engine = AlertEngine()
+    engine._pending = {}
+    # Written by a request while the open trades were being read
+    engine.set_levels(1, 1, 'BTC/USDT', stop=95.0)
+    engine.remove(2)
+    engine.load([(1, 1, 'BTC/USDT', 80.0, None), (2, 1, 'BTC/USDT', 80.0, None)])
+
+    assert [(a['tradeId'], a['level']) for a in engine.on_quotes({'BTC': 70.0})] == [(1, 95.0)]
+
+
+def test_large_book_scales(tmp_path):
+    rng = random.Random(5)
+    rows = random_levels(rng, 100_000)
+    engine = AlertEngine(queue_size=0)
+    engine.load(rows)
+    path = tmp_path / 'ticks.csv'
+    write_tick_file(path, rng, 2000)
+
+    ticks = list(alert_engine.read_ticks(path))
+    alerts = alert_engine.replay(engine, ticks)
+    lowest = {s: min(p for t, p in ticks if t == s) for s in SYMBOLS}
+    highest = {s: max(p for t, p in ticks if t == s) for s in SYMBOLS}
+    expected = sum((s is not None and lowest[m[:3]] <= s) + (t is not None and highest[m[:3]] >= t)
+                   for _, _, m, s, t in rows)
+    assert len(alerts) == expected
+
+
+def test_calculator_keeps_engine_in_step(user_context):
+    engine = AlertEngine()
+    calc = StubCalculator()
+    calc.alert_engine = engine
+    first = calc.add_trade('BTC/USDT', 100.0, 2.0, stop_price=90.0, target_price=130.0)
+    engine.load_open_trades()
+    assert len(engine) == 2
+
+    second = calc.add_trade('BTC/USDT', 100.0, 1.0, stop_price='95')
+    assert second['Stop Price'] == 95.0 and second['Target Price'] is None
+    calc.sell_units(second['id'], 1.0, 101.0)
+    calc.set_trade_levels(first['id'], stop_price=92.0)
+    assert db.session.get(Trade, first['id']).target_price is None
+
+    assert [(a['tradeId'], a['kind'], a['level']) for a in engine.on_quotes({'BTC': 91.0})] == \
+        [(first['id'], 'stop', 92.0)]
+
+    for stop, target in [(-1, None), (0, None), (120.0, 110.0)]:
+        with pytest.raises(ValueError):
+            calc.set_trade_levels(first['id'], stop_price=stop, target_price=target)
+    with pytest.raises(ValueError):
+        calc.set_trade_levels(second['id'], stop_price=90.0)
+
+    with pytest.raises(ValueError, match='ETH/BTC'):
+        calc.add_trade('eth/btc', 0.05, 1.0, target_price=0.06)
+    assert calc.add_trade('ETH/BTC', 0.05, 1.0)['Stop Price'] is None
+
+
+def test_engine_attached_to_quote_cache_loads_lazily(app, user_context):
+    calc = StubCalculator()
+    engine = AlertEngine()
+    calc.alert_engine = engine
+    calc.add_trade('ETH/USDT', 2000.0, 1.0, target_price=2400.0)
+    cache = QuoteCache(ttl=60, max_size=10)
+    engine.attach(app, cache)
+
+    cache.put_many({'ETH': 2500.0})
+    assert engine.loaded
+    assert [a['market'] for a in engine.drain()] == ['ETH/USDT']
+
+
+def test_fired_levels_are_claimed_once_across_engines(app, user_context):
+    calc = StubCalculator()
+    calc.alert_engine = AlertEngine()
+    trade = calc.add_trade('BTC/USDT', 100.0, 2.0, stop_price=90.0, target_price=130.0)
+    # Two processes' engines watching the same trade
+    engines = [AlertEngine(), AlertEngine()]
+    for engine in engines:
+        engine.load_open_trades()
+    fired = [alert for engine in engines for alert in engine.on_quotes({'BTC': 85.0})]
+    assert len(fired) == 2
+
+    delivered = []
+    dispatchers = [alert_engine.AlertDispatcher(engine, handlers=[delivered.append], app=app) for engine in engines]
+    for dispatcher in dispatchers:
+        dispatcher.start()
+    try:
+        deadline = time.monotonic() + 5
+        while any(not engine.queue.empty() for engine in engines) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Let the last alert taken off a queue finish its claim
+        time.sleep(0.1)
+    finally:
+        for dispatcher in dispatchers:
+            dispatcher.stop()
+
+    assert [(a['tradeId'], a['kind']) for a in delivered] == [(trade['id'], 'stop')]
+    db.session.expire_all()
+    stored = db.session.get(Trade, trade['id'])
+    assert stored.stop_price is None and stored.target_price == 130.0
+
+    # After a restart only the target is armed
+    restarted = AlertEngine()
+    restarted.load_open_trades()
+    assert restarted.on_quotes({'BTC': 80.0}) == []
+    assert len(restarted.on_quotes({'BTC': 131.0})) == 1
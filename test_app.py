@@ -0,0 +1,167 @@
+import json
+
+
+def add_trade(client, market='BTC/USDT', entry_price=60000.0, units=1.0, **levels):
+    response = client.post('/add_trade', json={'market': market, 'entryPrice': entry_price, 'units': units, **levels})
+    assert response.status_code == 200, response.json
+    return response.json['newTrade']
+
+
+def test_summary_etag_and_level_changes(client):
+    trade = add_trade(client)
+    first = client.get('/api/summary')
+    assert first.status_code == 200 and first.json['total_profit_loss'] == 5000.0
+    assert client.get('/api/summary', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    response = client.post(f"/trades/{trade['id']}/levels", json={'stopPrice': 55000, 'targetPrice': 70000})
+    assert response.status_code == 200
+    assert response.json['updatedTrade']['Stop Price'] == 55000.0
+
+    # Levels change no trade or sale counts, but the summary shows them
+    changed = client.get('/api/summary', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
+    assert changed.json['recent_trades'][0]['Stop Price'] == 55000.0
+
+    assert client.post(f"/trades/{trade['id']}/levels", json={'stopPrice': 80000, 'targetPrice': 70000}).status_code == 400
+    assert client.post('/trades/999/levels', json={'stopPrice': 1}).status_code == 400
+
+
+def test_equity_curve(client):
+    trade = add_trade(client, units=2.0)
+    assert client.post(f"/sell_units/{trade['id']}", json={'units': 1.0, 'exitPrice': 61000.0}).status_code == 200
+
+    response = client.get('/api/equity?interval=hour&window=5')
+    assert response.status_code == 200
+    assert (response.json['totalRealized'], response.json['unrealized']) == (1000.0, 5000.0)
+    assert response.json['window'] == 5
+
+    assert response.json['currency'] == 'USD' and response.json['unconvertedMarkets'] == []
+    for query in ('window=0', 'window=-3', 'window=1001', 'interval=minute', 'currency=XYZ'):
+        assert client.get(f'/api/equity?{query}').status_code == 400, query
+
+
+def test_batch_calculation_grid_and_scenarios(client):
+    scenarios = {'capitalTotal': 10000, 'riskPercentage': [1, 2], 'entryPrice': 100, 'exitPrice': [95, 90]}
+    grid = client.post('/calculate/batch', json={'grid': scenarios})
+    assert grid.status_code == 200 and grid.json['count'] == 4
+
+    # An empty grid next to scenarios is not a grid
+    for extra in ({}, {'grid': None}, {'grid': {}}):
+        response = client.post('/calculate/batch', json={'scenarios': scenarios, **extra})
+        assert response.status_code == 200 and response.json['count'] == 2
+        assert response.json['positionSize'] == [20.0, 20.0]
+
+    assert client.post('/calculate/batch', json={'grid': None}).status_code == 400
+
+
+def test_trades_listing_pages_and_filters(client):
+    markets = ['BTC/USDT', 'ETH/USDT', 'BTC/USDT', 'SOL/USDT', 'BTC/USDT']
+    ids = [add_trade(client, market=market)['id'] for market in markets]
+    assert client.post(f'/sell_units/{ids[0]}', json={'units': 1.0, 'exitPrice': 61000.0}).status_code == 200
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/trades', query_string={'limit': 2, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200 and len(response.json['trades']) <= 2
+        seen += [t['id'] for t in response.json['trades']]
+        cursor = response.json['nextCursor']
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(ids) and len(seen) == len(set(seen))
+
+    btc = client.get('/api/trades?market=btc/usdt&status=open').json['trades']
+    assert sorted(t['id'] for t in btc) == sorted(ids[2::2])
+    assert [t['id'] for t in client.get('/api/trades?status=closed').json['trades']] == [ids[0]]
+    assert client.get('/api/trades?from=2000-01-01&to=2000-01-02').json == {'trades': [], 'nextCursor': None}
+
+    for query in ('status=pending', 'cursor=not-a-cursor', 'from=yesterday'):
+        assert client.get(f'/api/trades?{query}').status_code == 400, query
+
+
+def test_summary_stream_pushes_only_changes(web, client, monkeypatch):
+    monkeypatch.setattr(web, 'SUMMARY_STREAM_MAX_SECONDS', 0.3)
+    monkeypatch.setattr(web, 'SUMMARY_STREAM_KEEPALIVE_SECONDS', 0.05)
+    add_trade(client)
+
+    response = client.get('/summary/stream')
+    assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    events = response.get_data(as_text=True).split('\n\n')
+    assert events[0] == 'retry: 5000'
+
+    # The first tick carries the prices, later ones only keep the connection alive
+    prices = [json.loads(e.split('data: ', 1)[1]) for e in events if e.startswith('event: prices')]
+    assert prices == [{'quotes': {'BTC/USDT': 65000.0}, 'totalProfitLoss': 5000.0}]
+    assert ': keepalive' in events
+
+
+def test_risk_simulation(client, monkeypatch):
+    monkeypatch.setenv('MONTE_CARLO_WORKERS', '1')
+    request = {'riskPercentage': 2, 'winRate': 50, 'payoff': 2, 'trades': 20, 'paths': 2000, 'seed': 7}
+    first = client.post('/simulate/risk', json=request)
+    assert first.status_code == 200
+    assert (first.json['model'], first.json['paths'], first.json['truncated']) == ('parametric', 2000, False)
+    second = client.post('/simulate/risk', json=request).json
+    assert {k: v for k, v in second.items() if k != 'elapsedSeconds'} == \
+        {k: v for k, v in first.json.items() if k != 'elapsedSeconds'}
+
+    for bad in ({'winRate': 50, 'payoff': 2}, {**request, 'payoff': None}, {**request, 'timeBudget': 0},
+                {'riskPercentage': 2, 'entryPrice': 0, 'exitPrice': 95},
+                {'riskPercentage': 2, 'stopPercentage': 5}):
+        assert client.post('/simulate/risk', json=bad).status_code == 400, bad
+
+
+def test_backtest_on_stored_candles(client, monkeypatch, tmp_path):
+    import backtest
+    from candle_store import CandleStore, generate_candles
+
+    monkeypatch.setenv('CANDLE_STORE_DIR', str(tmp_path))
+    candles = generate_candles(5000, seed=3)
+    CandleStore().append('BTC/USDT', candles)
+
+    request = {'market': 'btc/usdt', 'capitalTotal': 10000, 'riskPercentage': 1, 'stopPercentage': 0.5}
+    response = client.post('/backtest', json=request)
+    assert response.status_code == 200
+    result, expected = response.json, backtest.backtest(candles, 10000, 1, 0.5)
+    for key in ('elapsedSeconds', 'barsPerSecond'):
+        result.pop(key), expected.pop(key)
+    assert result == expected
+
+    assert client.post('/backtest', json={**request, 'market': 'ETH/USDT'}).status_code == 404
+    for bad in ({**request, 'timeframe': '7m'}, {**request, 'riskPercentage': 0},
+                {'market': 'BTC/USDT', 'capitalTotal': 10000},
+                {**request, 'from': 1577836800.5}, {**request, 'to': True}, {**request, 'from': ['2020-01-01']},
+                {**request, 'from': 'yesterday'}, {**request, 'maxHoldBars': 10 ** 12},
+                {**request, 'slowPeriod': 5001}, {**request, 'to': 1577836800 + 60 * 100, 'fastPeriod': 101}):
+        response = client.post('/backtest', json=bad)
+        assert response.status_code == 400 and 'error' in response.json, bad
+
+    ranged = client.post('/backtest', json={**request, 'from': 1577836800, 'to': '2020-01-01T01:40:00'})
+    assert ranged.status_code == 200 and ranged.json['bars'] == 100
+
+
+def test_trades_batch(client):
+    held = add_trade(client, units=2.0)
+    response = client.post('/api/trades/batch', json={'operations': [
+        {'type': 'buy', 'market': 'eth/usdt', 'entryPrice': 2000, 'units': 1.5, 'stopPrice': 1800},
+        {'type': 'sell', 'tradeId': held['id'], 'units': 0.5, 'exitPrice': 62000},
+        {'type': 'sell', 'tradeId': held['id'], 'units': 1.5, 'exitPrice': 63000},
+    ]})
+    assert response.status_code == 200
+    [new] = response.json['newTrades']
+    assert (new['Market'], new['Stop Price']) == ('ETH/USDT', 1800.0)
+    assert [t['Remaining Units'] for t in response.json['updatedTrades']] == [0.0]
+    assert len(response.json['sales']) == 2
+    assert client.get('/api/summary').json['total_profit_loss'] == 5500.0 + 750.0
+
+    buy = {'type': 'buy', 'market': 'SOL/USDT', 'entryPrice': 150, 'units': 1}
+    for bad, error in [({'type': 'sell', 'tradeId': held['id'], 'units': 1, 'exitPrice': 65000}, 'remaining'),
+                       ({**buy, 'market': 'ETH/BTC', 'targetPrice': 200}, 'ETH/BTC')]:
+        rejected = client.post('/api/trades/batch', json={'operations': [buy, bad]})
+        assert rejected.status_code == 400
+        [row] = rejected.json['errors']
+        assert row['index'] == 1 and error in row['error']
+    assert len(client.get('/api/trades').json['trades']) == 2
+
+    assert client.post('/api/trades/batch', json={'operations': []}).status_code == 400
+    assert client.post('/api/trades/batch', json={}).status_code == 400
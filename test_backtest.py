@@ -0,0 +1,87 @@
+import pytest
+
+import backtest
+from candle_store import CandleStore, generate_candles
+
+
+def naive_backtest(candles, capital, risk, stop_pct, reward, fast, slow, max_hold):
+    """Reference: walk the bars one at a time, sizing each position like /calculate"""
+    close = candles['close'].tolist()
+    opens, highs, lows = candles['open'].tolist(), candles['high'].tolist(), candles['low'].tolist()
+
+    def sma(i, period):
+        return sum(close[i - period + 1:i + 1]) / period
+
+    trades, i = [], slow
+    while i < len(close) - 1:
+        if not (sma(i, fast) > sma(i, slow) and sma(i - 1, fast) <= sma(i - 1, slow)):
+            i += 1
+            continue
+        entry = close[i]
+        stop, target = entry * (1 - stop_pct / 100), entry * (1 + reward * stop_pct / 100)
+        units = capital * (risk / 100) / abs(entry - stop)
+        last = min(i + max_hold, len(close) - 1)
+        exit_price, j = close[last], last
+        for j in range(i + 1, last + 1):
+            if lows[j] <= stop:
+                exit_price = min(opens[j], stop)
+                break
+            if highs[j] >= target:
+                exit_price = max(opens[j], target)
+                break
+        else:
+            j = last
+        capital += units * (exit_price - entry)
+        trades.append(exit_price > entry)
+        i = j + 1
+    return capital, trades
+
+
+@pytest.mark.parametrize('seed,max_hold', [(1, 60), (2, 400)])
+def test_matches_bar_by_bar_replay(seed, max_hold):
+    candles = generate_candles(20000, seed=seed, volatility=0.002)
+    result = backtest.backtest(candles, 10000, 1.5, 1.0, reward_ratio=2, fast=10, slow=30, max_hold=max_hold)
+    capital, trades = naive_backtest(candles, 10000, 1.5, 1.0, 2, 10, 30, max_hold)
+
+    assert result['trades'] == len(trades) > 10
+    assert result['wins'] == sum(trades)
+    assert result['finalCapital'] == pytest.approx(capital, rel=1e-9)
+    assert result['stops'] + result['targets'] + result['timeExits'] == result['trades']
+
+
+def test_small_exit_blocks_give_same_result(monkeypatch):
+    candles = generate_candles(5000, seed=3, volatility=0.002)
+    expected = backtest.backtest(candles, 1000, 1, 1, fast=5, slow=20, max_hold=100)
+    monkeypatch.setattr(backtest, 'EXIT_SEARCH_CELLS', 250)
+    result = backtest.backtest(candles, 1000, 1, 1, fast=5, slow=20, max_hold=100)
+    for key in ('elapsedSeconds', 'barsPerSecond'):
+        expected.pop(key), result.pop(key)
+    assert result == expected
+
+
+def test_runs_on_memory_mapped_store(tmp_path):
+    store = CandleStore(str(tmp_path))
+    candles = generate_candles(50000, seed=5)
+    store.append('BTC/USDT', candles)
+
+    stored = backtest.backtest(store.read('BTC/USDT'), 10000, 1, 0.5)
+    in_memory = backtest.backtest(candles, 10000, 1, 0.5)
+    assert stored['finalCapital'] == in_memory['finalCapital']
+    assert stored['start'] == '2020-01-01T00:00:00'
+
+
+def test_no_signals_and_invalid_parameters():
+    result = backtest.backtest(generate_candles(30), 1000, 1, 1)
+    assert result['trades'] == 0 and result['finalCapital'] == 1000
+
+    candles = generate_candles(100)
+    # Holding longer than the data is the same as holding to the last bar
+    assert {k: v for k, v in backtest.backtest(candles, 1000, 1, 1, fast=2, slow=5, max_hold=10 ** 12).items()
+            if k not in ('elapsedSeconds', 'barsPerSecond')} == \
+        {k: v for k, v in backtest.backtest(candles, 1000, 1, 1, fast=2, slow=5, max_hold=100).items()
+         if k not in ('elapsedSeconds', 'barsPerSecond')}
+    for args in [(0, 1, 1), (1000, 0, 1), (1000, 101, 1), (1000, 1, 0), (1000, 1, 100)]:
+        with pytest.raises(ValueError):
+            backtest.backtest(candles, *args)
+    with pytest.raises(ValueError):
+        backtest.backtest(candles, 1000, 1, 1, fast=50, slow=20)
@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+import benchmark
+
+
+def test_benchmark_reports_every_operation(tmp_path):
+    output = tmp_path / 'report.json'
+    # Separate process: the benchmark points app.py at its own temp database before importing it
+    subprocess.run([sys.executable, 'benchmark.py', '--users', '1', '--trades', '40', '--iterations', '2',
+                    '--warmup', '0', '--payload-rows', '200', '--output', str(output)], check=True, cwd=os.path.dirname(os.path.abspath(benchmark.__file__)))
+
+    report = json.loads(output.read_text())
+    assert report['meta']['seed'] == 42
+    assert {'get_summary', 'get_trades_json', 'add_trade', 'sell_units',
+            'POST /calculate', 'GET /summary', 'trades_payload', 'trades_payload_legacy'} <= report['results'].keys()
+    for result in report['results'].values():
+        assert result['n'] >= 2
+        assert 0 < result['p50_ms'] <= result['p95_ms']
+
+
+def test_compare_flags_p50_regressions():
+    baseline = {'results': {'get_summary': {'p50_ms': 10.0}, 'add_trade': {'p50_ms': 5.0}}}
+    report = {'results': {'get_summary': {'p50_ms': 13.0}, 'add_trade': {'p50_ms': 5.5}, 'new_op': {'p50_ms': 1.0}}}
+
+    assert benchmark.compare(report, baseline, threshold=0.2) == ['get_summary: p50 10.0ms -> 13.0ms']
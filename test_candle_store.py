@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from candle_store import CANDLE_DTYPE, CandleRecorder, CandleStore, generate_candles
+
+
+def test_append_is_incremental_and_reads_are_memory_mapped(tmp_path):
+    store = CandleStore(str(tmp_path))
+    candles = generate_candles(1000, seed=1)
+
+    assert store.append('BTC/USDT', candles[:600]) == 600
+    # Overlapping and duplicate bars are skipped; only newer ones are written
+    assert store.append('BTC/USDT', candles[500:]) == 400
+    assert store.append('BTC/USDT', candles) == 0
+
+    stored = store.read('btc/usdt')
+    assert isinstance(stored.base, np.memmap) or isinstance(stored, np.memmap)
+    np.testing.assert_array_equal(np.asarray(stored), candles)
+    assert store.markets() == [('BTC-USDT', '1m')]
+    assert store.last_time('BTC/USDT') == candles['time'][-1]
+
+
+def test_range_reads(tmp_path):
+    store = CandleStore(str(tmp_path))
+    candles = generate_candles(1440 * 3, seed=2, timeframe='1m')
+    store.append('ETH/USDT', candles)
+
+    day = store.read('ETH/USDT', start='2020-01-02', end='2020-01-03')
+    assert len(day) == 1440
+    assert day['time'][0] == candles['time'][1440]
+    assert len(store.read('ETH/USDT', start=int(candles['time'][-1]) + 1)) == 0
+    assert len(store.read('SOL/USDT')) == 0
+    with pytest.raises(ValueError):
+        store.read('ETH/USDT', timeframe='2m')
+    with pytest.raises(TypeError):
+        store.read('ETH/USDT', start=1577836800.5)
+
+
+def test_partial_record_is_ignored_and_overwritten(tmp_path):
+    store = CandleStore(str(tmp_path))
+    candles = generate_candles(10, seed=3)
+    store.append('BTC/USDT', candles[:5])
+    with open(store.path('BTC/USDT'), 'ab') as stream:
+        stream.write(b'\x01' * 7)
+
+    assert len(store.read('BTC/USDT')) == 5
+    store.append('BTC/USDT', candles[5:])
+    np.testing.assert_array_equal(np.asarray(store.read('BTC/USDT')), candles)
+
+
+def test_import_csv(tmp_path):
+    path = tmp_path / 'bars.csv'
+    path.write_text("Time,Open,High,Low,Close\n"
+                    "2024-01-01T00:01:00Z,2,3,1,2.5\n"
+                    "2024-01-01T00:00:00Z,1,2,0.5,2\n")
+    store = CandleStore(str(tmp_path / 'store'))
+    assert store.import_file('SOL/USDT', path) == 2
+
+    bars = store.read('SOL/USDT')
+    assert bars['time'].tolist() == [1704067200, 1704067260]
+    assert bars['close'].tolist() == [2.0, 2.5] and bars['volume'].tolist() == [0.0, 0.0]
+
+    (tmp_path / 'bad.csv').write_text("time,open,close\n1,1,1\n")
+    with pytest.raises(ValueError):
+        store.import_file('SOL/USDT', tmp_path / 'bad.csv')
+
+
+def test_recorder_builds_bars_from_quotes(tmp_path):
+    store = CandleStore(str(tmp_path))
+    recorder = CandleRecorder(store, timeframe='1m')
+    for now, price in [(120, 10.0), (130, 12.0), (150, 9.0), (170, 11.0), (185, 11.5)]:
+        recorder.on_quotes({'BTC': price}, now=now)
+
+    bars = store.read('BTC/USD')
+    assert bars.tolist() == [(120, 10.0, 12.0, 9.0, 11.0, 0.0)]
+    recorder.flush()
+    assert store.read('BTC/USD')['close'].tolist() == [11.0, 11.5]
+
+
+def test_generated_fixture_is_consistent():
+    candles = generate_candles(10000, seed=4)
+    assert candles.dtype == CANDLE_DTYPE
+    assert (candles['high'] >= np.maximum(candles['open'], candles['close'])).all()
+    assert (candles['low'] <= np.minimum(candles['open'], candles['close'])).all()
+    assert (np.diff(candles['time']) == 60).all()
@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+
+import currency_conversion
+from currency_conversion import ConversionCache, ConversionMatrix, anchor_symbols, split_market
+from test_summary import PRICES, StubCalculator
+
+FIXED = {'USDT': 1.0, 'EUR': 1.25}
+
+
+class CountingCalculator(StubCalculator):
+    def __init__(self):
+        super().__init__()
+        self.conversion_cache = ConversionCache()
+        self.calls = []
+
+    def fetch_quotes(self, base_symbols):
+        self.calls.append(sorted(base_symbols))
+        return super().fetch_quotes(base_symbols)
+
+
+@pytest.fixture
+def fixed_rates(monkeypatch):
+    monkeypatch.setattr(currency_conversion, 'FIXED_RATES', FIXED)
+
+
+def test_matrix_rates_and_unknown_currencies():
+    anchors = {'USD': 1.0, 'BTC': 65000.0, 'ETH': 2500.0, 'EUR': 1.25, 'BAD': float('nan'), 'ZERO': 0.0}
+    matrix = ConversionMatrix(anchors)
+
+    assert matrix.currencies == ['BTC', 'ETH', 'EUR', 'USD']
+    assert matrix.rate('BTC', 'ETH') == pytest.approx(26.0)
+    assert matrix.rate('USD', 'EUR') == pytest.approx(0.8)
+    assert matrix.rate('ETH', 'ETH') == 1.0
+    assert matrix.rate('BTC', 'BAD') is None and matrix.rate('XRP', 'USD') is None
+
+    sources, targets = ['BTC', 'XRP', 'EUR', 'ETH'], ['EUR', 'USD', 'BTC', 'ZERO']
+    expected = [anchors[s] / anchors[t] if s in matrix and t in matrix else np.nan for s, t in zip(sources, targets)]
+    np.testing.assert_allclose(matrix.lookup(sources, targets), expected)
+
+    assert matrix.market_prices(['BTC/ETH', 'SOL/USDT', 'ETH']) == {'BTC/ETH': pytest.approx(26.0),
+                                                                    'ETH': 2500.0}
+    assert matrix.quote_rates(['BTC/ETH', 'SOL/EUR', 'SOL/XRP'], 'USD') == {'BTC/ETH': 2500.0, 'SOL/EUR': 1.25}
+
+
+def test_cache_reuses_matrices_until_anchors_move():
+    cache = ConversionCache(max_size=2)
+    first = cache.get({'USD': 1.0, 'BTC': 100.0})
+    assert cache.get({'BTC': 100.0, 'USD': 1.0}) is first
+    assert cache.get({'USD': 1.0, 'BTC': 101.0}) is not first
+    cache.get({'USD': 1.0})
+    assert cache.get({'USD': 1.0, 'BTC': 100.0}) is not first
+
+
+def test_markets_split_into_anchors(fixed_rates):
+    assert split_market('btc/eth') == ('BTC', 'ETH')
+    assert split_market('BTC') == ('BTC', 'USD')
+    assert anchor_symbols(['BTC/USDT', 'SOL/EUR', 'ETHW/ETH', 'ADA', 'XRP/GBP'], FIXED) == \
+        ['ADA', 'BTC', 'ETH', 'ETHW', 'SOL', 'XRP']
+
+
+def test_prices_are_in_each_markets_quote_currency(app, fixed_rates):
+    calc = CountingCalculator()
+    with app.app_context():
+        prices = calc.fetch_latest_prices(['BTC/USDT', 'BTC/ETH', 'SOL/EUR', 'ADA/USDT'])
+
+    assert prices == {
+        'BTC/USDT': PRICES['BTC'],
+        'BTC/ETH': pytest.approx(PRICES['BTC'] / PRICES['ETH']),
+        'SOL/EUR': pytest.approx(PRICES['SOL'] / 1.25),
+    }
+    # Bases and quote currencies are fetched together, pinned currencies not at all
+    assert calc.calls == [['ADA', 'BTC', 'ETH', 'SOL']]
+
+
+def test_summary_in_any_currency_costs_no_extra_fetches(user_context, fixed_rates):
+    calc = CountingCalculator()
+    calc.add_trade('BTC/ETH', 20.0, 1.0)
+    calc.add_trade('SOL/EUR', 100.0, 4.0)
+    sol = calc.add_trade('SOL/USDT', 140.0, 2.0)
+    calc.sell_units(sol['id'], 2.0, 150.0)
+
+    usd = calc.get_summary()
+    assert len(calc.calls) == 1
+    eur = calc.get_summary(currency='eur')
+    eth = calc.get_summary(currency='ETH')
+    assert len(calc.calls) == 1
+
+    btc_eth = PRICES['BTC'] / PRICES['ETH']
+    sol_eur = PRICES['SOL'] / 1.25
+    expected_pl = (btc_eth - 20.0) * PRICES['ETH'] + (sol_eur - 100.0) * 4.0 * 1.25 + 20.0
+    assert usd['currency'] == 'USD' and usd['unconverted_markets'] == []
+    assert usd['total_profit_loss'] == pytest.approx(expected_pl)
+    assert usd['total_invested'] == pytest.approx(20.0 * PRICES['ETH'] + 400.0 * 1.25)
+    assert usd['largest_position'] == pytest.approx(20.0 * PRICES['ETH'])
+    assert eur['total_profit_loss'] == pytest.approx(expected_pl / 1.25)
+    assert eth['current_positions_value'] == pytest.approx(20.0 + 500.0 / PRICES['ETH'])
+    assert {row['Market']: row['Latest Price'] for row in usd['trades_by_market'] if 'Latest Price' in row} == \
+        {'BTC/ETH': pytest.approx(btc_eth), 'SOL/EUR': pytest.approx(sol_eur)}
+
+    etag, _ = calc.get_versioned_summary()
+    assert calc.get_versioned_summary(currency='EUR')[0] != etag
+    with pytest.raises(ValueError):
+        calc.get_versioned_summary(currency='XYZ')
+
+
+def test_markets_without_a_rate_are_left_out_of_totals(user_context, fixed_rates):
+    calc = CountingCalculator()
+    calc.add_trade('BTC/USDT', 60000.0, 1.0)
+    calc.add_trade('ETH/GBP', 2000.0, 1.0)
+
+    summary = calc.get_summary()
+    assert summary['unconverted_markets'] == ['ETH/GBP']
+    assert summary['total_invested'] == 60000.0 and summary['avg_position_size'] == 60000.0
+    assert summary['total_profit_loss'] == pytest.approx(PRICES['BTC'] - 60000.0)
+    # Unpinned fiat is never sent to the crypto providers
+    assert calc.calls == [['BTC', 'ETH']]
+
+
+def test_equity_curve_converts_each_markets_quote_currency(user_context, fixed_rates):
+    calc = CountingCalculator()
+    btc = calc.add_trade('BTC/USDT', 60000.0, 2.0)
+    calc.sell_units(btc['id'], 1.0, 70500.0)
+    eth_btc = calc.add_trade('ETH/BTC', 0.04, 1.0)
+    calc.sell_units(eth_btc['id'], 0.5, 0.05)
+    eth_gbp = calc.add_trade('ETH/GBP', 2000.0, 1.0)
+    calc.sell_units(eth_gbp['id'], 1.0, 2100.0)
+
+    realized = 10500.0 + 0.005 * PRICES['BTC']
+    unrealized = (PRICES['BTC'] - 60000.0) + (PRICES['ETH'] / PRICES['BTC'] - 0.04) * 0.5 * PRICES['BTC']
+    usd = calc.get_equity_curve()
+    assert usd['currency'] == 'USD' and usd['unconvertedMarkets'] == ['ETH/GBP']
+    assert usd['totalRealized'] == pytest.approx(realized)
+    assert sum(usd['realized']) == pytest.approx(realized)
+    assert usd['unrealized'] == pytest.approx(unrealized)
+    assert usd['equity'] == pytest.approx(realized + unrealized)
+
+    eur = calc.get_equity_curve(currency='eur')
+    assert eur['totalRealized'] == pytest.approx(realized / 1.25)
+    assert eur['equity'] == pytest.approx((realized + unrealized) / 1.25)
+    assert calc.get_equity_curve(market='ETH/BTC', currency='BTC')['totalRealized'] == pytest.approx(0.005)
+    with pytest.raises(ValueError):
+        calc.get_equity_curve(currency='XYZ')
@@ -0,0 +1,66 @@
+from sqlalchemy import create_engine, text
+
+import database
+from conftest import make_user
+from models.user import db, Trade, Sale
+
+
+def test_url_and_engine_options(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'postgres://u:p@db/trades')
+    monkeypatch.setenv('DB_POOL_SIZE', '12')
+    url = database.database_url()
+
+    assert url == 'postgresql://u:p@db/trades'
+    options = database.engine_options(url)
+    assert options['pool_size'] == 12
+    assert options['pool_pre_ping'] is True
+    assert options['pool_recycle'] == 1800
+    assert 'pool_size' not in database.engine_options('sqlite:///x.db')
+
+
+def test_sqlite_connections_use_wal_and_busy_timeout(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+    engine.dispose()
+
+
+def test_copy_database(app, tmp_path):
+    with app.app_context():
+        user = make_user('copy@example.com')
+        trade = Trade(market='BTC/USDT', entry_price=100.0, units=2.0, remaining_units=1.0,
+                      position_size=100.0, user_id=user.id)
+        db.session.add(trade)
+        db.session.flush()
+        db.session.add(Sale(units_sold=1.0, exit_price=120.0, partial_pl=20.0, partial_pl_percentage=20.0,
+                            trade_id=trade.id))
+        db.session.commit()
+
+        target_url = f"sqlite:///{tmp_path / 'copy.db'}"
+        copied = database.copy_database(db.metadata, db.engine, target_url, chunk_size=1)
+
+    assert copied['user'] == 1 and copied['trade'] == 1 and copied['sale'] == 1
+    target = create_engine(target_url)
+    with target.connect() as conn:
+        assert conn.execute(text('SELECT market, remaining_units FROM trade')).one() == ('BTC/USDT', 1.0)
+    target.dispose()
+
+
+def test_add_missing_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        # The trade table as created before stop and target levels existed
+        conn.execute(text(
+            "CREATE TABLE trade (id INTEGER PRIMARY KEY, date DATETIME, market VARCHAR(50) NOT NULL, "
+            "entry_price FLOAT NOT NULL, units FLOAT NOT NULL, remaining_units FLOAT NOT NULL, "
+            "position_size FLOAT NOT NULL, user_id INTEGER NOT NULL)"
+        ))
+        conn.execute(text("INSERT INTO trade VALUES (1, NULL, 'BTC/USDT', 1, 1, 1, 1, 1)"))
+
+    assert database.add_missing_columns(engine, Trade.__table__) == ['stop_price', 'target_price']
+    assert database.add_missing_columns(engine, Trade.__table__) == []
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT stop_price, target_price FROM trade")).one() == (None, None)
+    engine.dispose()
@@ -0,0 +1,133 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import equity_curve
+from models.user import db, Trade, Sale
+from test_summary import StubCalculator
+
+START = datetime(2024, 3, 1)
+
+
+def add_sales(user, rng, n_sales, start=START, market='BTC/USDT', hours=2000):
+    trade = Trade(market=market, entry_price=100.0, units=1e6, remaining_units=1e6, position_size=1e8,
+                  user_id=user.id, date=start)
+    db.session.add(trade)
+    db.session.flush()
+    for _ in range(n_sales):
+        pl = round(rng.uniform(-50, 60), 2)
+        db.session.add(Sale(units_sold=1.0, exit_price=100.0 + pl, partial_pl=pl, partial_pl_percentage=pl,
+                            trade_id=trade.id, date=start + timedelta(minutes=rng.randint(0, hours * 60))))
+    db.session.commit()
+
+
+def naive_curve(user_id, interval, window, market=None):
+    """Reference: loop over the sales in date order, one bucket at a time"""
+    query = Sale.query.join(Trade).filter(Trade.user_id == user_id)
+    if market:
+        query = query.filter(Trade.market == market)
+    sales = sorted(query.all(), key=lambda s: (s.date, s.id))
+    step = timedelta(hours=1) if interval == 'hour' else timedelta(days=1)
+
+    def bucket(date):
+        return date.replace(minute=0, second=0, microsecond=0) if interval == 'hour' else \
+            date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    points, cumulative, peak, flags, i = [], 0.0, 0.0, [], 0
+    current = bucket(sales[0].date)
+    while i < len(sales):
+        realized = 0.0
+        count = 0
+        while i < len(sales) and bucket(sales[i].date) == current:
+            realized += sales[i].partial_pl
+            flags.append(sales[i].partial_pl > 0)
+            count += 1
+            i += 1
+        cumulative += realized
+        peak = max(peak, cumulative)
+        recent = flags[-window:]
+        points.append((current.isoformat(), realized, cumulative, cumulative - peak, count,
+                       sum(recent) / len(recent) * 100 if recent else None))
+        current += step
+    return points
+
+
+def assert_curve_matches(curve, expected):
+    assert curve['timestamps'] == [p[0] for p in expected]
+    assert curve['realized'] == pytest.approx([p[1] for p in expected])
+    assert curve['cumulativeRealized'] == pytest.approx([p[2] for p in expected])
+    assert curve['drawdown'] == pytest.approx([p[3] for p in expected])
+    assert curve['sales'] == [p[4] for p in expected]
+    assert curve['winRate'] == pytest.approx([p[5] for p in expected])
+    assert curve['maxDrawdown'] == pytest.approx(min(p[3] for p in expected))
+
+
+def test_empty_history(user_context):
+    curve = equity_curve.equity_curve(user_context.id, cache=equity_curve.EquityCurveCache())
+    assert curve['timestamps'] == [] and curve['totalRealized'] == 0.0 and curve['maxDrawdown'] == 0.0
+
+
+@pytest.mark.parametrize('interval,window', [('day', 20), ('hour', 5)])
+def test_curve_matches_naive(user_context, interval, window):
+    add_sales(user_context, random.Random(3), 400)
+    curve = equity_curve.equity_curve(user_context.id, interval=interval, window=window,
+                                      cache=equity_curve.EquityCurveCache())
+    assert_curve_matches(curve, naive_curve(user_context.id, interval, window))
+
+
+def test_market_filter(user_context):
+    rng = random.Random(4)
+    add_sales(user_context, rng, 100, market='BTC/USDT')
+    add_sales(user_context, rng, 100, market='ETH/USDT')
+    curve = equity_curve.equity_curve(user_context.id, market='ETH/USDT', cache=equity_curve.EquityCurveCache())
+    assert_curve_matches(curve, naive_curve(user_context.id, 'day', 20, market='ETH/USDT'))
+
+
+def test_new_sales_extend_cached_series(user_context, monkeypatch):
+    rng = random.Random(5)
+    cache = equity_curve.EquityCurveCache()
+    add_sales(user_context, rng, 200, hours=500)
+    equity_curve.equity_curve(user_context.id, cache=cache)
+
+    loads = []
+    load_sales = equity_curve.load_sales
+    monkeypatch.setattr(equity_curve, 'load_sales', lambda *args, **kw: loads.append(kw) or load_sales(*args, **kw))
+    # Later sales, starting inside the last cached day
+    add_sales(user_context, rng, 50, start=START + timedelta(hours=499), hours=300)
+    curve = equity_curve.equity_curve(user_context.id, cache=cache)
+
+    assert len(loads) == 1 and loads[0]['after_id'] > 0
+    assert_curve_matches(curve, naive_curve(user_context.id, 'day', 20))
+
+
+def test_backdated_sales_rebuild_series(user_context):
+    rng = random.Random(6)
+    cache = equity_curve.EquityCurveCache()
+    add_sales(user_context, rng, 100, start=START + timedelta(days=30))
+    equity_curve.equity_curve(user_context.id, cache=cache)
+
+    add_sales(user_context, rng, 20, start=START, hours=24)
+    curve = equity_curve.equity_curve(user_context.id, cache=cache)
+    assert_curve_matches(curve, naive_curve(user_context.id, 'day', 20))
+
+
+def test_invalid_arguments(user_context):
+    with pytest.raises(ValueError):
+        equity_curve.equity_curve(user_context.id, interval='minute')
+    with pytest.raises(ValueError):
+        equity_curve.equity_curve(user_context.id, window=0)
+
+
+def test_calculator_adds_unrealized(user_context):
+    calc = StubCalculator()
+    trade = calc.add_trade('BTC/USDT', 60000.0, 2.0)
+    calc.sell_units(trade['id'], 1.0, 61000.0)
+
+    curve = calc.get_equity_curve()
+    assert curve['totalRealized'] == 1000.0
+    assert curve['unrealized'] == 5000.0
+    assert curve['equity'] == 6000.0
+    assert calc.get_equity_curve(market='eth/usdt')['equity'] == 0.0
+    with pytest.raises(ValueError):
+        calc.get_equity_curve(window=0)
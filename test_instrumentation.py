@@ -0,0 +1,77 @@
+import instrumentation
+from models.user import User
+
+
+def register_routes(app):
+    @app.route('/users/count')
+    def users_count():
+        User.query.count()
+        User.query.count()
+        return {'ok': True}
+
+
+def test_requests_are_timed_with_query_counts(app, monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 'scrape-secret')
+    for histogram in instrumentation.HISTOGRAMS:
+        histogram.clear()
+    instrumentation.init_app(app)
+    register_routes(app)
+    client = app.test_client()
+
+    response = client.get('/users/count')
+    assert '2 queries' in response.headers['Server-Timing']
+
+    series = instrumentation.request_queries.snapshot()[('/users/count',)]
+    assert series[-1] == 1 and series[-2] == 2
+    assert instrumentation.request_duration.snapshot()[('GET', '/users/count', '200')][-1] == 1
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    text = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/users/count",status="200",le="+Inf"} 1' in text
+    assert 'http_request_db_queries_count{route="/users/count"} 1' in text
+
+
+def test_metrics_are_not_served_unless_configured(app):
+    instrumentation.init_app(app)
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_profiling_is_opt_in(app, monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', '1')
+    monkeypatch.setenv('PROFILING_TOKEN', 'profile-secret')
+    instrumentation.init_app(app)
+    register_routes(app)
+    client = app.test_client()
+
+    assert client.get('/users/count').is_json
+    # Anonymous callers can't turn the profiler on
+    assert client.get('/users/count?profile=1').is_json
+    assert client.get('/users/count', headers={'X-Profile': '1', 'X-Profile-Token': 'guess'}).is_json
+    profiled = client.get('/users/count', headers={'X-Profile': '1', 'X-Profile-Token': 'profile-secret'})
+    assert profiled.mimetype == 'text/plain'
+    assert 'cumulative' in profiled.get_data(as_text=True)
+
+
+def test_timed_records_operations():
+    instrumentation.operation_duration.clear()
+
+    @instrumentation.timed('unit')
+    def work():
+        return 42
+
+    assert work() == 42
+    assert instrumentation.operation_duration.snapshot()[('unit',)][-1] == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = instrumentation.Histogram('h', 'help', ('k',), buckets=(1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value, 'a')
+
+    lines = histogram.render().splitlines()
+    assert 'h_bucket{k="a",le="1"} 2' in lines
+    assert 'h_bucket{k="a",le="5"} 3' in lines
+    assert 'h_bucket{k="a",le="+Inf"} 4' in lines
+    assert 'h_sum{k="a"} 14.5' in lines
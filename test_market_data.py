@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from financial_calculator import TradeCalculator
+from market_data import CircuitBreaker, CircuitOpenError, MarketDataClient, MarketDataError
+from price_providers import CoinMarketCapProvider, PriceEngine
+from quote_cache import QuoteCache
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves CMC-shaped quotes; behaviour is scripted through server.script"""
+
+    def do_GET(self):
+        self.server.requests += 1
+        action = self.server.script.pop(0) if self.server.script else 'ok'
+        if action == 'slow':
+            time.sleep(1)
+        if action == 'error':
+            self.send_response(503)
+            self.end_headers()
+            return
+        symbols = parse_qs(urlparse(self.path).query)['symbol'][0].split(',')
+        body = json.dumps({'data': {s: {'quote': {'USD': {'price': 100.0 + i}}} for i, s in enumerate(symbols)}})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.script = []
+    server.requests = 0
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(**kwargs):
+    options = dict(connect_timeout=0.5, read_timeout=0.2, retries=2, backoff=0.01, deadline=2,
+                   breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    options.update(kwargs)
+    return MarketDataClient(**options)
+
+
+def quotes_url(server):
+    return f"{server.url}/v1/cryptocurrency/quotes/latest"
+
+
+def test_retries_transient_errors(stub_server):
+    stub_server.script = ['error', 'slow']
+    data = make_client().get_json(quotes_url(stub_server), params={'symbol': 'BTC'})
+    assert data['data']['BTC']['quote']['USD']['price'] == 100.0
+    assert stub_server.requests == 3
+
+
+def test_read_timeout_bounds_latency(stub_server):
+    stub_server.script = ['slow'] * 3
+    client = make_client()
+    started = time.monotonic()
+    with pytest.raises(MarketDataError):
+        client.get_json(quotes_url(stub_server), params={'symbol': 'BTC'})
+    assert time.monotonic() - started < 1.5
+
+
+def test_circuit_opens_and_fails_fast(stub_server):
+    stub_server.script = ['error'] * 4
+    client = make_client(retries=1)
+    for _ in range(2):
+        with pytest.raises(MarketDataError):
+            client.get_json(quotes_url(stub_server), params={'symbol': 'BTC'})
+    requests_before = stub_server.requests
+
+    with pytest.raises(CircuitOpenError):
+        client.get_json(quotes_url(stub_server), params={'symbol': 'BTC'})
+    assert stub_server.requests == requests_before
+    assert client.breaker.state == 'open'
+
+
+def test_calculator_falls_back_to_last_known_price(stub_server):
+    provider = CoinMarketCapProvider(client=make_client(retries=0), api_key='test', api_url=stub_server.url)
+    calc = TradeCalculator(quote_cache=QuoteCache(ttl=0, max_size=10), price_engine=PriceEngine([provider]))
+
+    assert calc.fetch_latest_prices(['BTC/USDT']) == {'BTC/USDT': 100.0}
+    stub_server.script = ['error'] * 10
+    # Expired entry: the stale price is served while the refresh fails in the background
+    assert calc.fetch_latest_prices(['BTC/USDT']) == {'BTC/USDT': 100.0}
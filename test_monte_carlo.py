@@ -0,0 +1,121 @@
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import monte_carlo
+from financial_calculator import TradeCalculator
+from test_summary import StubCalculator
+
+
+def test_certain_outcomes_compound_risk():
+    wins = monte_carlo.simulate(monte_carlo.parametric_model(100, 2), 1, trades=50, paths=1000, seed=1, workers=1)
+    assert wins['finalEquityPercentiles']['p50'] == pytest.approx(1.02 ** 50, rel=1e-6)
+    assert wins['maxDrawdownPercentiles']['p95'] == 0
+    assert wins['riskOfRuin'] == 0
+
+    losses = monte_carlo.simulate(monte_carlo.parametric_model(0, 2), 2, trades=50, paths=1000, seed=1,
+                                  ruin_threshold=60, capital_total=1000, workers=1)
+    assert losses['finalEquityPercentiles']['p5'] == pytest.approx(1000 * 0.98 ** 50, rel=1e-6)
+    assert losses['maxDrawdownPercentiles']['p50'] == pytest.approx((1 - 0.98 ** 50) * 100, rel=1e-5)
+    assert losses['riskOfRuin'] == 100
+    assert losses['expectedGrowthPerTrade'] == pytest.approx(-2, rel=1e-5)
+
+
+def test_growth_matches_kelly_expectation():
+    # 55% winners paying 1.5R at 5% risk: E[log growth] = p*log(1+f*b) + (1-p)*log(1-f)
+    result = monte_carlo.simulate(monte_carlo.parametric_model(55, 1.5), 5, trades=200, paths=20000, seed=7, workers=1)
+    expected = math.expm1(0.55 * math.log(1.075) + 0.45 * math.log(0.95)) * 100
+    assert result['expectedGrowthPerTrade'] == pytest.approx(expected, abs=0.02)
+    assert result['paths'] == 20000 and not result['truncated']
+
+
+def test_history_losses_are_stopped_out():
+    model = monte_carlo.history_model([-40.0] * 5 + [10.0] * 5 + [float('nan')], stop_percentage=5)
+    assert sorted(set(model[1].tolist())) == [-1.0, 2.0]
+    result = monte_carlo.simulate(model, 1, trades=10, paths=100, seed=3, workers=1)
+    assert result['samples'] == 10 and result['winRate'] == 50 and result['payoff'] == 2
+
+    with pytest.raises(ValueError):
+        monte_carlo.history_model([1.0] * 3, stop_percentage=5)
+    with pytest.raises(ValueError):
+        monte_carlo.history_model([1.0] * 20, stop_percentage=0)
+
+
+def test_seeded_runs_are_reproducible_across_workers(monkeypatch):
+    monkeypatch.setattr(monte_carlo, 'SHARD_CELLS', 5000)
+    model = monte_carlo.history_model(np.random.default_rng(0).normal(1, 8, 200), stop_percentage=4)
+    try:
+        pooled = monte_carlo.simulate(model, 2, trades=50, paths=2000, seed=11, workers=2)
+    finally:
+        monte_carlo.shutdown()
+    inline = monte_carlo.simulate(model, 2, trades=50, paths=2000, seed=11, workers=1)
+    for result in (pooled, inline):
+        result.pop('elapsedSeconds')
+    assert pooled == inline
+
+
+def test_time_budget_truncates(monkeypatch):
+    monkeypatch.setattr(monte_carlo, 'SHARD_CELLS', 1000)
+    result = monte_carlo.simulate(monte_carlo.parametric_model(50, 1), 1, trades=100, paths=100_000,
+                                  time_budget=1e-6, workers=1)
+    assert result['truncated'] and 0 < result['paths'] < 100_000
+
+
+class InFlightExecutor(ThreadPoolExecutor):
+    """Records how many shards were submitted and the most ever outstanding at once"""
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self.lock:
+            self.submitted += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        future = super().submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+
+def test_pool_overrun_is_bounded_by_one_shard_per_worker(monkeypatch):
+    executor = InFlightExecutor()
+    monkeypatch.setattr(monte_carlo, 'SHARD_CELLS', 20_000)
+    monkeypatch.setattr(monte_carlo, '_get_executor', lambda workers: executor)
+    try:
+        result = monte_carlo.simulate(monte_carlo.parametric_model(50, 1), 1, trades=100, paths=1_000_000,
+                                      time_budget=0.05, workers=2)
+    finally:
+        executor.shutdown()
+    assert result['truncated']
+    assert executor.max_in_flight <= 2
+    # Shards left running at the deadline are the only ones not in the summary
+    assert executor.submitted - result['paths'] // 200 <= 2
+
+
+def test_invalid_parameters():
+    model = monte_carlo.parametric_model(50, 1)
+    for kwargs in ({'risk_percentage': 0}, {'risk_percentage': 1, 'trades': 0},
+                   {'risk_percentage': 1, 'paths': monte_carlo.MAX_PATHS + 1},
+                   {'risk_percentage': 1, 'time_budget': 0}, {'risk_percentage': 1, 'time_budget': -1}):
+        with pytest.raises(ValueError):
+            monte_carlo.simulate(model, **kwargs)
+    with pytest.raises(ValueError):
+        monte_carlo.parametric_model(120, 1)
+
+
+def test_sale_returns_are_the_users_sale_percentages(user_context):
+    calc = StubCalculator()
+    trade = calc.add_trade('BTC/USDT', 100.0, 4.0)
+    calc.sell_units(trade['id'], 1.0, 110.0)
+    calc.sell_units(trade['id'], 1.0, 95.0)
+    assert sorted(TradeCalculator.sale_return_percentages(user_context.id)) == [-5.0, 10.0]
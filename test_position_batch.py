@@ -0,0 +1,47 @@
+import time
+
+import numpy as np
+
+from financial_calculator import POSITION_ERRORS, calculate_position_sizes, position_size_grid
+
+
+def test_matches_scalar_calculate():
+    results = calculate_position_sizes([10000, 2500.5], [2, 1.5], [100, 64000], [95, 62000])
+
+    assert results['error'].tolist() == [0, 0]
+    assert results['capitalAtRisk'].tolist() == [200.0, round(2500.5 * 0.015, 2)]
+    assert results['riskPerUnit'].tolist() == [5.0, 2000.0]
+    assert results['positionSize'].tolist() == [40.0, round(2500.5 * 0.015 / 2000, 2)]
+    assert results['totalPositionValue'].tolist() == [4000.0, round(2500.5 * 0.015 / 2000 * 64000, 2)]
+
+
+def test_row_level_errors():
+    results = calculate_position_sizes(
+        [1000, 'abc', -5, 1000, 1000],
+        [1, 1, 1, 150, 1],
+        [10, 10, 10, 10, 10],
+        [9, 9, 9, 9, 10]
+    )
+
+    messages = [POSITION_ERRORS[code] for code in results['error']]
+    assert messages == [None, "Invalid numerical values provided", "Values must be greater than zero",
+                        "Risk percentage must be between 0 and 100", "Entry price cannot equal exit price"]
+    assert results['positionSize'][0] == 10.0
+    assert np.isnan(results['positionSize'][1:]).all()
+
+
+def test_grid_expansion():
+    inputs = position_size_grid([1000, 2000], [1, 2, 3], [10], [9, 8])
+    assert all(len(a) == 12 for a in inputs)
+    results = calculate_position_sizes(*inputs)
+    assert results['capitalAtRisk'][:6].tolist() == [10.0, 10.0, 20.0, 20.0, 30.0, 30.0]
+
+
+def test_million_scenarios_under_a_second():
+    rng = np.random.default_rng(0)
+    n = 1_000_000
+    start = time.perf_counter()
+    results = calculate_position_sizes(rng.uniform(1e3, 1e6, n), rng.uniform(0.1, 5, n),
+                                       rng.uniform(1, 100, n), rng.uniform(1, 100, n))
+    assert time.perf_counter() - start < 1.0
+    assert len(results['positionSize']) == n
@@ -0,0 +1,76 @@
+import json
+import time
+
+from market_data import MarketDataError
+from price_providers import BinanceProvider, CoinMarketCapProvider, PriceEngine, PriceProvider, StubProvider
+
+
+class SlowProvider(PriceProvider):
+    def __init__(self, name, prices, delay=0.0, fail=False):
+        self.name = name
+        self.prices = prices
+        self.delay = delay
+        self.fail = fail
+
+    def fetch(self, base_symbols):
+        time.sleep(self.delay)
+        if self.fail:
+            raise MarketDataError(f"{self.name} down")
+        return {s: self.prices[s] for s in base_symbols if s in self.prices}
+
+
+class FakeClient:
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def get_json(self, url, params=None, headers=None):
+        self.calls.append(params)
+        return self.responses.pop(0)
+
+
+def test_first_success_returns_without_waiting_for_slow_provider():
+    engine = PriceEngine([
+        SlowProvider('slow', {'BTC': 1.0}, delay=1.0),
+        SlowProvider('fast', {'BTC': 2.0, 'ETH': 3.0}),
+    ])
+    started = time.monotonic()
+    assert engine.fetch(['BTC', 'ETH']) == {'BTC': 2.0, 'ETH': 3.0}
+    assert time.monotonic() - started < 0.5
+
+
+def test_median_aggregation_skips_failed_providers():
+    engine = PriceEngine([
+        SlowProvider('a', {'BTC': 100.0, 'ETH': 10.0}),
+        SlowProvider('b', {'BTC': 102.0}),
+        SlowProvider('c', {'BTC': 130.0, 'ETH': 12.0}),
+        SlowProvider('down', {}, fail=True),
+    ], strategy='median')
+    assert engine.fetch(['BTC', 'ETH']) == {'BTC': 102.0, 'ETH': 11.0}
+
+
+def test_binance_maps_pairs_exactly():
+    client = FakeClient([[{'symbol': 'ETHUSDT', 'price': '2500.5'}, {'symbol': 'ETHWUSDT', 'price': '3.1'}]])
+    provider = BinanceProvider(client=client)
+    assert provider.fetch(['ETH', 'ETHW']) == {'ETH': 2500.5, 'ETHW': 3.1}
+    assert json.loads(client.calls[0]['symbols']) == ['ETHUSDT', 'ETHWUSDT']
+
+
+def test_binance_falls_back_to_full_ticker_on_invalid_symbol():
+    client = FakeClient([{'code': -1121, 'msg': 'Invalid symbol.'},
+                         [{'symbol': 'BTCUSDT', 'price': '65000'}, {'symbol': 'XRPUSDT', 'price': '0.5'}]])
+    assert BinanceProvider(client=client).fetch(['BTC', 'NOPE']) == {'BTC': 65000.0}
+
+
+def test_coinmarketcap_skips_invalid_symbols():
+    client = FakeClient([{'data': {'BTC': {'quote': {'USD': {'price': 65000.0}}},
+                                   'ETH': {'quote': {}},
+                                   'SOL': {'quote': {'USD': {'price': None}}}}}])
+    assert CoinMarketCapProvider(client=client).fetch(['BTC', 'ETH', 'SOL', 'NOPE']) == {'BTC': 65000.0}
+    assert client.calls[0]['skip_invalid'] == 'true'
+
+
+def test_stub_provider_fixture(tmp_path):
+    fixture = tmp_path / 'prices.json'
+    fixture.write_text(json.dumps({'btc': 1, 'ETH': 2.5}))
+    assert StubProvider(path=str(fixture)).fetch(['BTC', 'ETH', 'SOL']) == {'BTC': 1.0, 'ETH': 2.5}
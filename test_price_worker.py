@@ -0,0 +1,47 @@
+from conftest import make_user
+from financial_calculator import TradeCalculator
+from models.user import db, Trade
+from price_worker import PriceRefreshWorker
+from quote_cache import QuoteCache
+
+
+class RecordingCalculator(TradeCalculator):
+    def __init__(self):
+        super().__init__(quote_cache=QuoteCache(ttl=60, max_size=100))
+        self.calls = []
+
+    def fetch_quotes(self, base_symbols):
+        self.calls.append(list(base_symbols))
+        return {s: float(len(s)) for s in base_symbols}
+
+
+def add_trades(user, markets, remaining=1.0):
+    for market in markets:
+        db.session.add(Trade(market=market, entry_price=1.0, units=1.0, remaining_units=remaining,
+                             position_size=remaining, user_id=user.id))
+    db.session.commit()
+
+
+def test_refresh_batches_distinct_open_markets_across_users(app):
+    with app.app_context():
+        alice = make_user('alice@example.com')
+        bob = make_user('bob@example.com')
+        add_trades(alice, ['BTC/USDT', 'ETH/USDT', 'SOL/USDT'])
+        add_trades(bob, ['BTC/USDT', 'ETH/USDT', 'ADA/USDT'])
+        add_trades(bob, ['DOGE/USDT'], remaining=0.0)
+
+    calculator = RecordingCalculator()
+    worker = PriceRefreshWorker(app, calculator, interval=60, batch_size=3)
+
+    assert worker.refresh_once() == 2
+    assert calculator.calls == [['ADA', 'BTC', 'ETH'], ['SOL']]
+    assert calculator.quote_cache.peek_many(['BTC', 'SOL', 'DOGE']) == {'BTC': 3.0, 'SOL': 3.0}
+
+
+def test_local_prices_only_skips_network(app):
+    calculator = RecordingCalculator()
+    calculator.quote_cache.put_many({'BTC': 50000.0})
+    calculator.local_prices_only = True
+
+    assert calculator.fetch_latest_prices(['BTC/USDT', 'ETH/USDT']) == {'BTC/USDT': 50000.0}
+    assert calculator.calls == []
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from quote_cache import QuoteCache
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = QuoteCache(ttl=60, max_size=10)
+    calls = []
+    release = threading.Event()
+
+    def fetcher(symbols):
+        calls.append(list(symbols))
+        release.wait(2)
+        return {s: 100.0 for s in symbols}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_many(['BTC', 'ETH'], fetcher)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r == {'BTC': 100.0, 'ETH': 100.0} for r in results)
+
+
+def test_stale_value_served_while_refreshing():
+    cache = QuoteCache(ttl=0.01, max_size=10)
+    cache.put_many({'BTC': 1.0})
+    time.sleep(0.02)
+    refreshed = threading.Event()
+
+    def fetcher(symbols):
+        refreshed.set()
+        return {'BTC': 2.0}
+
+    assert cache.get_many(['BTC'], fetcher) == {'BTC': 1.0}
+    assert refreshed.wait(1)
+    time.sleep(0.05)
+    assert cache.get_many(['BTC'], lambda symbols: {}) == {'BTC': 2.0}
+
+
+def test_size_is_bounded():
+    cache = QuoteCache(ttl=60, max_size=2)
+    cache.put_many({'BTC': 1.0, 'ETH': 2.0, 'SOL': 3.0})
+    assert cache.get_many(['SOL', 'ETH'], lambda symbols: {}) == {'SOL': 3.0, 'ETH': 2.0}
+    assert cache.get_many(['BTC'], lambda symbols: {}) == {}
+
+
+def test_failed_fetch_returns_nothing(caplog):
+    cache = QuoteCache(ttl=60, max_size=10)
+
+    def fetcher(symbols):
+        raise RuntimeError('upstream down')
+
+    assert cache.get_many(['BTC'], fetcher) == {}
+    [record] = [r for r in caplog.records if r.name == 'quote_cache']
+    assert record.levelname == 'ERROR' and record.exc_info[0] is RuntimeError
+
+
+def test_wait_for_update_wakes_on_new_prices():
+    cache = QuoteCache(ttl=60, max_size=10)
+    version = cache.version
+    threading.Timer(0.05, cache.put_many, args=({'BTC': 1.0},)).start()
+
+    assert cache.wait_for_update(version, timeout=2) == version + 1
+    assert cache.wait_for_update(version + 1, timeout=0.01) == version + 1
+
+
+def test_listeners_see_stored_quotes():
+    cache = QuoteCache(ttl=60, max_size=10)
+    seen = []
+    cache.add_listener(seen.append)
+    cache.add_listener(lambda prices: 1 / 0)
+
+    cache.put_many({'BTC': 1.0})
+    cache.get_many(['ETH', 'BTC'], lambda symbols: {'ETH': 2.0})
+    cache.get_many(['SOL'], lambda symbols: {})
+    assert seen == [{'BTC': 1.0}, {'ETH': 2.0}]
@@ -0,0 +1,67 @@
+import json
+import math
+import random
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+import serializers
+from financial_calculator import TradeCalculator
+from models.user import db, Trade, Sale
+
+
+def legacy_clean(data):
+    import pandas as pd
+    return {k: (v.isoformat() if isinstance(v, datetime) else None if pd.isna(v) else v) for k, v in data.items()}
+
+
+def test_clean_trade_data_matches_pandas_behaviour():
+    row = {'a': 1, 'b': 2.5, 'c': float('nan'), 'd': None, 'e': 'BTC/USDT',
+           'f': datetime(2024, 1, 2, 3, 4, 5, 6), 'g': float('inf'), 'h': True}
+    assert TradeCalculator.clean_trade_data(row) == legacy_clean(row)
+
+
+def test_row_builders_match_model_dicts(user_context):
+    trade = Trade(market='ETH/USDT', entry_price=2000.5, units=3.0, remaining_units=1.5, position_size=3000.75,
+                  user_id=user_context.id, date=datetime(2024, 5, 1, 12, 30))
+    db.session.add(trade)
+    db.session.flush()
+    db.session.add(Sale(units_sold=1.5, exit_price=2100.0, partial_pl=149.25, partial_pl_percentage=4.97,
+                        trade_id=trade.id, date=datetime(2024, 5, 2, 8, 0, 0, 123456)))
+    db.session.commit()
+
+    trade_rows = serializers.trade_rows(db.session.execute(select(*serializers.TRADE_COLUMNS)))
+    assert trade_rows == [legacy_clean(TradeCalculator.trade_to_dict(trade))]
+    sale_rows = serializers.sale_rows(db.session.execute(select(*serializers.SALE_COLUMNS)))
+    assert sale_rows == [legacy_clean(TradeCalculator.sale_to_dict(trade.sales[0]))]
+    assert list(trade_rows[0]) == serializers.TRADE_KEYS
+    assert serializers.trade_rows([(1, None, 'X', math.nan, 1.0, 1.0, 1.0, None, None)])[0]['Entry Price'] is None
+
+
+@pytest.mark.skipif(serializers.orjson is None, reason='orjson not installed')
+def test_fast_provider_is_byte_compatible(app):
+    rng = random.Random(3)
+    floats = [rng.uniform(-1e6, 1e6) * 10 ** rng.randint(-8, 8) for _ in range(2000)]
+    payload = {
+        'floats': floats,
+        'edge': [1e16, 1.5e-7, 0.00001, 0.0001, 123456789012345.6, -0.0, 5e-324, 1e300],
+        'text': ['BTC/USDT', 'café', 'line\nbreak', '"quoted"', 'ee-1e5'],
+        'nested': {'b': [1, 2, {'z': None, 'a': True}], 'a': 'x', 'Partial P/L %': 1.25},
+        'when': datetime(2024, 1, 2, 3, 4, 5),
+        'amount': Decimal('1.10'),
+        'big': 2 ** 70,
+    }
+    fast = serializers.FastJSONProvider(app)
+    default = DefaultJSONProvider(app)
+    for obj in (payload, payload['floats'], payload['edge'], payload['nested'], {'plain': [1.5, 2, 'a']}):
+        assert fast.dumps(obj, separators=(',', ':')) == default.dumps(obj, separators=(',', ':'))
+    assert fast.dumps(payload) == default.dumps(payload)
+    assert fast.dumps(payload, indent=2) == default.dumps(payload, indent=2)
+
+    app.json = fast
+    with app.test_request_context():
+        response = app.json.response(payload)
+    assert json.loads(response.get_data()) == json.loads(default.dumps(payload))
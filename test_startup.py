@@ -0,0 +1,58 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_python(code, tmp_path, **env_overrides):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}", PRICE_WORKER_ENABLED='0')
+    env.update(env_overrides)
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                          cwd=ROOT, env=env).stdout.strip()
+
+
+def test_importing_app_skips_scientific_libraries_and_schema(tmp_path):
+    loaded = run_python("import sys, app; print(sorted(m for m in ('numpy', 'pandas') if m in sys.modules))",
+                        tmp_path)
+    assert loaded == '[]'
+    assert not (tmp_path / 'startup.db').exists() or not _tables(tmp_path / 'startup.db')
+
+
+def test_importing_app_starts_no_background_services(tmp_path):
+    # Spawned Monte Carlo workers re-import __main__; they must not start pollers of their own
+    code = ("import threading, app; names = lambda: sorted(t.name for t in threading.enumerate()); "
+            "print(names()); app.start_background_services(); print(names())")
+    before, after = run_python(code, tmp_path, PRICE_WORKER_ENABLED='1').splitlines()
+    assert 'price-refresh-worker' not in before and 'alert-dispatcher' not in before
+    assert 'price-refresh-worker' in after and 'alert-dispatcher' in after
+
+
+def test_light_routes_load_no_scientific_libraries(tmp_path):
+    code = """
+import json, sys, app
+app.init_db()
+client = app.app.test_client()
+form = {'email': 'lazy@example.com', 'password': 'secret', 'confirm_password': 'secret'}
+statuses = [client.get('/login').status_code,
+            client.post('/register', data=form).status_code,
+            client.post('/login', data=form).status_code,
+            client.post('/add_trade', json={'market': 'BTC/USDT', 'entryPrice': 100, 'units': 1}).status_code,
+            client.get('/api/trades').status_code]
+print(json.dumps([statuses, sorted(m for m in ('numpy', 'pandas') if m in sys.modules)]))
+"""
+    statuses, loaded = json.loads(run_python(code, tmp_path, PRICE_PROVIDERS='stub'))
+    assert statuses == [200, 302, 302, 200, 200]
+    assert loaded == []
+
+
+def test_init_db_creates_schema(tmp_path):
+    run_python("import app; app.init_db()", tmp_path)
+    assert {'user', 'trade', 'sale', 'portfolio_stats'} <= _tables(tmp_path / 'startup.db')
+
+
+def _tables(path):
+    with sqlite3.connect(path) as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
@@ -0,0 +1,97 @@
+import io
+import json
+import logging
+import threading
+
+import pytest
+
+import instrumentation
+import structured_logging
+
+
+@pytest.fixture
+def log_output(monkeypatch):
+    """Configure the queue pipeline into a buffer; yields a function returning the parsed lines so far"""
+    root = logging.getLogger()
+    saved = (list(root.handlers), root.level)
+    monkeypatch.setenv('LOG_SAMPLE_RATES', 'sampled=0,halved=0.5')
+    stream = io.StringIO()
+    structured_logging.configure_logging(level='DEBUG', fmt='json', stream=stream)
+
+    def lines():
+        structured_logging.stop_logging()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield lines
+    structured_logging.stop_logging()
+    root.handlers[:] = saved[0]
+    root.setLevel(saved[1])
+
+
+class Recorder:
+    """Remembers which thread turned it into text"""
+
+    def __init__(self):
+        self.thread = None
+
+    def __str__(self):
+        self.thread = threading.current_thread().name
+        return 'payload'
+
+
+def test_records_are_formatted_on_the_listener_thread(log_output):
+    payload = Recorder()
+    logging.getLogger('trades').info('Received %s', payload, extra={'trade_id': 7})
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logging.getLogger('trades').exception('Failed')
+
+    received, failed = log_output()
+    assert payload.thread not in (None, threading.current_thread().name)
+    assert received['message'] == 'Received payload' and received['trade_id'] == 7
+    assert received['level'] == 'INFO' and received['logger'] == 'trades' and 'request_id' not in received
+    assert failed['level'] == 'ERROR' and 'ZeroDivisionError' in failed['exception']
+
+
+def test_request_ids_and_sampling(app, log_output):
+    instrumentation.init_app(app)
+
+    @app.route('/sampled')
+    def sampled():
+        logging.getLogger('routes').debug('noisy %s', 'line')
+        logging.getLogger('routes').info('kept')
+        return 'ok'
+
+    @app.route('/plain')
+    def plain():
+        logging.getLogger('routes').debug('debug line')
+        return 'ok'
+
+    client = app.test_client()
+    response = client.get('/sampled', headers={'X-Request-ID': 'abc-123'})
+    assert response.headers['X-Request-ID'] == 'abc-123'
+    generated = client.get('/plain', headers={'X-Request-ID': 'not valid!'}).headers['X-Request-ID']
+    assert len(generated) == 32
+
+    entries = log_output()
+    routes = [(e['message'], e['request_id']) for e in entries if e['logger'] == 'routes']
+    assert routes == [('kept', 'abc-123'), ('debug line', generated)]
+    access = [e for e in entries if e['logger'] == 'instrumentation.access']
+    assert [(e['route'], e['status'], e['request_id']) for e in access] == \
+        [('/sampled', 200, 'abc-123'), ('/plain', 200, generated)]
+    assert all(e['duration_ms'] >= 0 and e['db_queries'] == 0 for e in access)
+
+
+def test_sampling_filter_rates(app, monkeypatch):
+    sampler = structured_logging.SamplingFilter({'halved': 0.5})
+    record = logging.makeLogRecord({'levelno': logging.DEBUG})
+    app.add_url_rule('/halved', 'halved', lambda: 'ok')
+    monkeypatch.setattr(structured_logging.random, 'random', lambda: 0.4)
+    with app.test_request_context('/halved'):
+        assert sampler.filter(record) and record.sample_rate == 0.5
+        monkeypatch.setattr(structured_logging.random, 'random', lambda: 0.6)
+        assert not sampler.filter(logging.makeLogRecord({'levelno': logging.DEBUG}))
+        assert sampler.filter(logging.makeLogRecord({'levelno': logging.INFO}))
+    assert structured_logging.parse_sample_rates(' calculate=0.01, add_trade=1 ,') == \
+        {'calculate': 0.01, 'add_trade': 1.0}
@@ -0,0 +1,193 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import portfolio_rollup
+from financial_calculator import TradeCalculator
+from models.user import db, Trade, Sale, PortfolioStats
+from quote_cache import QuoteCache
+from summary_cache import SummaryCache
+
+MARKETS = ['BTC/USDT', 'ETH/USDT', 'ETHW/USDT', 'SOL/USDT', 'ADA/USDT']
+PRICES = {'BTC': 65000.0, 'ETH': 2500.0, 'ETHW': 3.2, 'SOL': 150.0}
+
+
+class StubCalculator(TradeCalculator):
+    def __init__(self):
+        super().__init__(quote_cache=QuoteCache(ttl=60, max_size=100), summary_cache=SummaryCache())
+
+    def fetch_quotes(self, base_symbols):
+        return {s: PRICES[s] for s in base_symbols if s in PRICES}
+
+
+def legacy_summary(calc, user_id):
+    """Reference implementation: the original per-object Python summary, in insertion order"""
+    trades = Trade.query.filter_by(user_id=user_id).order_by(Trade.id).all()
+    if not trades:
+        return calc.build_summary([], [], None, None)
+
+    open_trades = [t for t in trades if t.remaining_units > 0]
+    closed_trades = [t for t in trades if t.remaining_units == 0]
+    latest_prices = calc.fetch_latest_prices(list(set(t.market for t in open_trades)))
+
+    total_pl = sum(sale.partial_pl for trade in trades for sale in trade.sales)
+    for trade in open_trades:
+        if trade.market in latest_prices:
+            total_pl += calc.calculate_profit_loss(trade.entry_price, latest_prices[trade.market], trade.remaining_units)
+
+    all_sales = [sale for trade in trades for sale in trade.sales]
+    profitable_sales = [sale for sale in all_sales if sale.partial_pl > 0]
+    win_rate = (len(profitable_sales) / len(all_sales) * 100) if all_sales else 0
+
+    trades_by_market = {}
+    for trade in trades:
+        if trade.market not in trades_by_market:
+            trades_by_market[trade.market] = {'Market': trade.market, 'Count': 0, 'Total Position': 0}
+        trades_by_market[trade.market]['Count'] += 1
+        trades_by_market[trade.market]['Total Position'] += trade.position_size
+        if trade.market in latest_prices:
+            trades_by_market[trade.market]['Latest Price'] = latest_prices[trade.market]
+
+    best_sale = max(all_sales, key=lambda x: x.partial_pl_percentage) if all_sales else None
+    worst_sale = min(all_sales, key=lambda x: x.partial_pl_percentage) if all_sales else None
+
+    return {
+        'total_trades': len(trades),
+        'open_trades': len(open_trades),
+        'closed_trades': len(closed_trades),
+        'total_profit_loss': float(total_pl),
+        'avg_profit_loss_percent': float(sum(s.partial_pl_percentage for s in all_sales) / len(all_sales)) if all_sales else 0,
+        'total_invested': float(sum(t.position_size for t in trades)),
+        'current_positions_value': float(sum(t.position_size for t in open_trades)),
+        'largest_position': float(max(t.position_size for t in trades)),
+        'avg_position_size': float(sum(t.position_size for t in trades) / len(trades)),
+        'win_rate': float(win_rate),
+        'trades_by_market': list(trades_by_market.values()),
+        'recent_trades': [calc.clean_trade_data(calc.trade_to_dict(t)) for t in sorted(trades, key=lambda x: x.date, reverse=True)[:5]],
+        'best_performing': calc.clean_trade_data(calc.trade_to_dict(best_sale.trade)) if best_sale else None,
+        'worst_performing': calc.clean_trade_data(calc.trade_to_dict(worst_sale.trade)) if worst_sale else None,
+        'currency': 'USD',
+        'unconverted_markets': []
+    }
+
+
+def generate_history(user, calc, rng, n_trades=300):
+    start = datetime(2023, 1, 1)
+    for i in range(n_trades):
+        entry_price = round(rng.uniform(1, 1000), 2)
+        units = round(rng.uniform(0.1, 10), 4)
+        trade = Trade(market=rng.choice(MARKETS), entry_price=entry_price, units=units, remaining_units=units,
+                      position_size=entry_price * units, user_id=user.id,
+                      date=start + timedelta(hours=rng.randint(0, 5000)))
+        db.session.add(trade)
+        db.session.flush()
+        for _ in range(rng.choice([0, 0, 1, 2, 3])):
+            if rng.random() < 0.3:
+                sold = trade.remaining_units
+            else:
+                sold = round(trade.remaining_units * rng.uniform(0.1, 0.6), 4)
+            exit_price = round(entry_price * rng.uniform(0.7, 1.4), 2)
+            db.session.add(Sale(units_sold=sold, exit_price=exit_price,
+                                partial_pl=calc.calculate_profit_loss(entry_price, exit_price, sold),
+                                partial_pl_percentage=calc.calculate_win_loss_percentage(entry_price, exit_price),
+                                trade_id=trade.id))
+            trade.remaining_units -= sold
+            trade.position_size = calc.calculate_position_size(entry_price, trade.remaining_units)
+            if trade.remaining_units == 0:
+                break
+    db.session.commit()
+
+
+def assert_summaries_match(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, float):
+            assert actual[key] == pytest.approx(value, rel=1e-9, abs=1e-6), key
+        elif key == 'trades_by_market':
+            assert [m['Market'] for m in actual[key]] == [m['Market'] for m in value]
+            for got, want in zip(actual[key], value):
+                assert got.keys() == want.keys()
+                assert got['Count'] == want['Count']
+                assert got['Total Position'] == pytest.approx(want['Total Position'], rel=1e-9, abs=1e-6)
+                assert got.get('Latest Price') == want.get('Latest Price')
+        else:
+            assert actual[key] == value, key
+
+
+def test_empty_summary(user_context):
+    calc = StubCalculator()
+    assert calc.get_summary() == legacy_summary(calc, user_context.id)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_sql_summary_matches_legacy(user_context, seed):
+    calc = StubCalculator()
+    generate_history(user_context, calc, random.Random(seed))
+
+    assert_summaries_match(calc.get_summary(), legacy_summary(calc, user_context.id))
+
+
+def test_rollup_maintained_by_writes_matches_legacy(user_context):
+    calc = StubCalculator()
+    rng = random.Random(7)
+    for _ in range(60):
+        trade = calc.add_trade(rng.choice(MARKETS), round(rng.uniform(1, 1000), 2), round(rng.uniform(0.1, 10), 4))
+        for _ in range(rng.choice([0, 1, 2])):
+            remaining = db.session.get(Trade, trade['id']).remaining_units
+            units = remaining if rng.random() < 0.4 else round(remaining * rng.uniform(0.1, 0.6), 4)
+            calc.sell_units(trade['id'], units, round(trade['Entry Price'] * rng.uniform(0.7, 1.4), 2))
+
+    assert_summaries_match(calc.get_summary(), legacy_summary(calc, user_context.id))
+    assert portfolio_rollup.rebuild(user_context.id) == 0
+
+
+def test_rebuild_reconciles_drift(user_context):
+    calc = StubCalculator()
+    calc.add_trade('BTC/USDT', 100.0, 2.0)
+    calc.add_trade('ETH/USDT', 10.0, 5.0)
+    PortfolioStats.query.filter_by(market='ETH/USDT').update({'trade_count': 9, 'realized_pl': 123.0})
+    db.session.commit()
+
+    assert portfolio_rollup.rebuild(user_context.id) == 1
+    assert_summaries_match(calc.get_summary(), legacy_summary(calc, user_context.id))
+
+
+def test_price_update_reports_only_changes(user_context):
+    calc = StubCalculator()
+    calc.add_trade('BTC/USDT', 60000.0, 1.0)
+    calc.add_trade('ETH/USDT', 2000.0, 2.0)
+
+    state, changes = calc.price_update(user_context.id)
+    assert changes['quotes'] == {'BTC/USDT': 65000.0, 'ETH/USDT': 2500.0}
+    assert changes['totalProfitLoss'] == 6000.0
+
+    calc.quote_cache.put_many({'ETH': 2600.0})
+    state, changes = calc.price_update(user_context.id, state)
+    assert changes == {'quotes': {'ETH/USDT': 2600.0}, 'totalProfitLoss': 6200.0}
+
+    state, changes = calc.price_update(user_context.id, state)
+    assert changes == {'quotes': {}}
+
+
+def test_summary_etag_tracks_writes_and_prices(user_context):
+    calc = StubCalculator()
+    trade = calc.add_trade('BTC/USDT', 60000.0, 1.0)
+    etag, summary = calc.get_versioned_summary()
+    assert_summaries_match(summary, legacy_summary(calc, user_context.id))
+
+    assert calc.get_versioned_summary() == (etag, summary)
+    assert calc.get_versioned_summary()[1] is summary
+
+    calc.quote_cache.put_many({'BTC': 66000.0})
+    price_etag, summary = calc.get_versioned_summary()
+    assert price_etag != etag
+    assert summary['total_profit_loss'] == 6000.0
+
+    calc.sell_units(trade['id'], 0.5, 70000.0)
+    sale_etag, summary = calc.get_versioned_summary()
+    assert sale_etag not in (etag, price_etag)
+    assert_summaries_match(summary, legacy_summary(calc, user_context.id))
+
+    calc.add_trade('ETH/USDT', 2000.0, 1.0)
+    assert calc.get_versioned_summary()[0] != sale_etag
@@ -0,0 +1,112 @@
+import random
+
+import pytest
+from sqlalchemy import event
+
+import portfolio_rollup
+from alert_engine import AlertEngine
+from financial_calculator import BatchValidationError
+from models.user import db, Trade, Sale, PortfolioStats
+from test_summary import MARKETS, StubCalculator, assert_summaries_match, legacy_summary
+
+
+class BatchCalculator(StubCalculator):
+    def __init__(self):
+        super().__init__()
+        self.alert_engine = AlertEngine()
+        self.alert_engine.load([])
+
+
+class StatementCounter:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement.split()[0].upper())
+
+
+def test_batch_matches_leg_by_leg_writes(user_context):
+    calc = BatchCalculator()
+    rng = random.Random(11)
+    open_ids = [calc.add_trade(rng.choice(MARKETS), round(rng.uniform(1, 1000), 2), 10.0)['id'] for _ in range(40)]
+
+    operations = [{'type': 'buy', 'market': rng.choice(MARKETS).lower(), 'entryPrice': round(rng.uniform(1, 1000), 2),
+                   'units': round(rng.uniform(0.1, 10), 4)} for _ in range(100)]
+    for trade_id in open_ids:
+        for units in (4.0, 6.0) if rng.random() < 0.3 else (2.5,):
+            operations.append({'type': 'sell', 'tradeId': trade_id, 'units': units,
+                               'exitPrice': round(rng.uniform(1, 1000), 2)})
+    rng.shuffle(operations)
+
+    counter = StatementCounter()
+    event.listen(db.engine, 'before_cursor_execute', counter)
+    try:
+        result = calc.apply_batch(operations)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', counter)
+
+    sells = [op for op in operations if op['type'] == 'sell']
+    assert len(result['newTrades']) == 100 and len(result['sales']) == len(sells)
+    assert {t['id'] for t in result['updatedTrades']} == set(open_ids)
+    assert [t['Market'] for t in result['newTrades']] == \
+        [op['market'].upper() for op in operations if op['type'] == 'buy']
+    # Bulk statements: the statement count doesn't grow with the number of legs
+    assert len(counter.statements) < 20, counter.statements
+
+    closed = {t['id'] for t in result['updatedTrades'] if t['Remaining Units'] == 0}
+    assert closed == {trade_id for trade_id in open_ids if db.session.get(Trade, trade_id).remaining_units == 0}
+    for trade in result['updatedTrades']:
+        assert trade['Position Size'] == pytest.approx(trade['Entry Price'] * trade['Remaining Units'])
+
+    assert_summaries_match(calc.get_summary(), legacy_summary(calc, user_context.id))
+    assert portfolio_rollup.rebuild(user_context.id) == 0
+
+
+def test_invalid_batch_writes_nothing(user_context):
+    calc = BatchCalculator()
+    trade = calc.add_trade('BTC/USDT', 100.0, 2.0)
+    stats_before = PortfolioStats.query.one().trade_count
+
+    with pytest.raises(BatchValidationError) as error:
+        calc.apply_batch([
+            {'type': 'buy', 'market': 'ETH/USDT', 'entryPrice': 10, 'units': 1},
+            {'type': 'sell', 'tradeId': trade['id'], 'units': 1.5, 'exitPrice': 110},
+            {'type': 'sell', 'tradeId': trade['id'], 'units': 1, 'exitPrice': 120},
+            {'type': 'sell', 'tradeId': 999, 'units': 1, 'exitPrice': 120},
+        ])
+    assert error.value.errors == [{'index': 2, 'error': 'Cannot sell more units than remaining'},
+                                  {'index': 3, 'error': 'Trade not found'}]
+    assert Trade.query.count() == 1 and Sale.query.count() == 0
+    assert PortfolioStats.query.one().trade_count == stats_before
+
+    with pytest.raises(BatchValidationError) as error:
+        calc.apply_batch([{'type': 'buy', 'market': 'ETH/USDT', 'units': 1},
+                          {'type': 'hold'},
+                          {'type': 'sell', 'tradeId': '1', 'units': 1, 'exitPrice': 1}])
+    assert [e['index'] for e in error.value.errors] == [0, 1, 2]
+    with pytest.raises(BatchValidationError) as error:
+        calc.apply_batch([{'type': 'buy', 'market': 'ETH/USDT', 'entryPrice': 0, 'units': 1},
+                          {'type': 'buy', 'market': 'ETH/USDT', 'entryPrice': 10, 'units': '0'},
+                          {'type': 'sell', 'tradeId': trade['id'], 'units': 1, 'exitPrice': 0.0}])
+    assert [e['error'] for e in error.value.errors] == [
+        'Entry price is required and must be a positive number',
+        'Units is required and must be a positive number',
+        'Exit price is required and must be a positive number',
+    ]
+    with pytest.raises(ValueError):
+        calc.apply_batch([])
+
+
+def test_batch_keeps_alert_engine_in_sync(user_context):
+    calc = BatchCalculator()
+    held = calc.add_trade('BTC/USDT', 100.0, 2.0, stop_price=90.0)
+
+    result = calc.apply_batch([
+        {'type': 'buy', 'market': 'ETH/USDT', 'entryPrice': 10, 'units': 1, 'stopPrice': 9, 'targetPrice': 12},
+        {'type': 'sell', 'tradeId': held['id'], 'units': 2, 'exitPrice': 105},
+    ])
+    new_id = result['newTrades'][0]['id']
+    assert result['newTrades'][0]['Stop Price'] == 9.0
+    assert calc.alert_engine.on_quotes({'BTC': 80.0}) == []
+    assert [a['tradeId'] for a in calc.alert_engine.on_quotes({'ETH': 12.5})] == [new_id]
+
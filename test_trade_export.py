@@ -0,0 +1,44 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from financial_calculator import TradeCalculator
+import trade_export
+
+
+def make_history(calc):
+    trade = calc.add_trade('BTC/USDT', 40000, 2)
+    calc.sell_units(trade['id'], 0.5, 42000)
+    calc.add_trade('ETH/USDT', 2000, 3)
+    return trade
+
+
+def test_csv_and_ndjson_match_ui_dicts(user_context):
+    calc = TradeCalculator()
+    make_history(calc)
+    expected = sorted(calc.get_trades_json(), key=lambda t: t['id'])
+
+    ndjson = b''.join(trade_export.export_stream('trades', user_context.id, fmt='ndjson', chunk_size=1))
+    assert [json.loads(line) for line in ndjson.decode().splitlines()] == expected
+
+    csv = b''.join(trade_export.export_stream('trades', user_context.id, fmt='csv', chunk_size=1))
+    frame = pd.read_csv(io.BytesIO(csv))
+    assert list(frame.columns) == trade_export.TRADE_COLUMNS
+    assert frame['Market'].tolist() == ['BTC/USDT', 'ETH/USDT']
+
+
+def test_parquet_sales_export(user_context):
+    pytest.importorskip('pyarrow')
+    calc = TradeCalculator()
+    trade = make_history(calc)
+
+    data = b''.join(trade_export.export_stream('sales', user_context.id, fmt='parquet'))
+    frame = pd.read_parquet(io.BytesIO(data))
+    assert frame.to_dict('records') == calc.get_trade_sales_history(trade['id'])
+
+
+def test_unknown_format(user_context):
+    with pytest.raises(ValueError):
+        trade_export.export_stream('trades', user_context.id, fmt='xml')
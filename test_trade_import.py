@@ -0,0 +1,70 @@
+import io
+import json
+
+import pytest
+
+from financial_calculator import TradeCalculator
+from models.user import Trade, Sale
+import portfolio_rollup
+from test_summary import assert_summaries_match, legacy_summary, StubCalculator
+import trade_import
+
+CSV = """Date and Time,Ticker,Price,Total Units,Remaining Units,Action,Sales
+2024-01-02 10:00:00,btc/usdt,40000,2,1.5,Open,0.5@42000@2024-01-05T12:00:00
+2024-01-03 09:30:00,ETH/USDT,2000,10,0,Closed,4@2100;6@1900
+2024-01-04,SOL/USDT,-5,1,1,Open,
+2024-01-04,,100,1,1,Open,
+not a date,ADA/USDT,0.5,100,100,Open,
+2024-01-05,ADA/USDT,0.5,100,90,Open,20@0.6
+2024-01-06,ADA/USDT,0.4,50,,Open,
+"""
+
+
+def test_csv_import_with_row_errors(user_context):
+    progress = []
+    report = trade_import.import_trades(io.StringIO(CSV), user_context.id, chunk_size=3,
+                                        progress=lambda r: progress.append(r['rowsRead']))
+
+    assert progress == [3, 6, 7]
+    assert report['rowsRead'] == 7
+    assert report['tradesImported'] == 3
+    assert report['salesImported'] == 3
+    assert [e['row'] for e in report['errors']] == [3, 4, 5, 6]
+
+    btc = Trade.query.filter_by(market='BTC/USDT').one()
+    assert btc.remaining_units == 1.5 and btc.position_size == 60000.0
+    assert [(s.units_sold, s.exit_price, s.partial_pl) for s in btc.sales] == [(0.5, 42000.0, 1000.0)]
+    assert Trade.query.filter_by(market='ADA/USDT').one().remaining_units == 50
+
+    calc = StubCalculator()
+    assert_summaries_match(calc.get_summary(), legacy_summary(calc, user_context.id))
+
+
+def test_jsonl_import(user_context):
+    lines = [
+        {'date': '2024-02-01T00:00:00', 'market': 'BTC/USDT', 'entryPrice': 50000, 'units': 1,
+         'remainingUnits': 0.25, 'sales': [{'units': 0.75, 'exitPrice': 45000, 'date': '2024-02-03T00:00:00'}]},
+        {'market': 'ETH/USDT', 'entryPrice': 'abc', 'units': 1},
+    ]
+    stream = io.StringIO('\n'.join(json.dumps(line) for line in lines) + '\n')
+    report = trade_import.import_trades(stream, user_context.id, fmt='jsonl')
+
+    assert report['tradesImported'] == 1
+    assert report['errors'] == [{'row': 2, 'error': 'Entry price must be a positive number'}]
+    sale = Sale.query.one()
+    assert sale.partial_pl == TradeCalculator.calculate_profit_loss(50000, 45000, 0.75)
+
+
+def test_failed_import_keeps_rollups_of_committed_chunks(user_context):
+    def progress(report):
+        if report['rowsRead'] == 6:
+            raise RuntimeError('client went away')
+
+    calc = StubCalculator()
+    calc.add_trade('BTC/USDT', 30000.0, 1.0)
+    with pytest.raises(RuntimeError):
+        trade_import.import_trades(io.StringIO(CSV), user_context.id, chunk_size=3, progress=progress)
+
+    assert Trade.query.count() == 3
+    assert_summaries_match(calc.get_summary(), legacy_summary(calc, user_context.id))
+    assert portfolio_rollup.rebuild(user_context.id) == 0
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from financial_calculator import TradeCalculator
+from models.user import db, Trade
+
+
+def add_trades(user, count):
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        # Every pair of trades shares a timestamp to exercise the id tie-breaker
+        db.session.add(Trade(market='BTC/USDT' if i % 3 else 'ETH/USDT', entry_price=10.0, units=1.0,
+                             remaining_units=0.0 if i % 4 == 0 else 1.0, position_size=10.0,
+                             user_id=user.id, date=start + timedelta(days=i // 2)))
+    db.session.commit()
+
+
+def test_keyset_pages_cover_every_trade_once(user_context):
+    add_trades(user_context, 25)
+    calc = TradeCalculator()
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = calc.get_trades_page(cursor=cursor, limit=7)
+        seen.extend(page)
+        if not cursor:
+            break
+
+    expected = Trade.query.order_by(Trade.date.desc(), Trade.id.desc()).all()
+    assert seen == [TradeCalculator.clean_trade_data(TradeCalculator.trade_to_dict(t)) for t in expected]
+
+
+def test_filters(user_context):
+    add_trades(user_context, 20)
+    calc = TradeCalculator()
+
+    page, _ = calc.get_trades_page(limit=100, market='eth/usdt', status='open')
+    assert page and all(t['Market'] == 'ETH/USDT' and t['Remaining Units'] > 0 for t in page)
+
+    page, _ = calc.get_trades_page(limit=100, date_from='2024-01-03', date_to='2024-01-05')
+    assert {t['Date'][:10] for t in page} == {'2024-01-03', '2024-01-04'}
+
+
+def test_invalid_cursor(user_context):
+    with pytest.raises(ValueError):
+        TradeCalculator().get_trades_page(cursor='not-a-cursor')
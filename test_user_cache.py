@@ -0,0 +1,83 @@
+from contextlib import contextmanager
+
+from flask_login import login_user
+from sqlalchemy import event
+
+from conftest import make_user
+from financial_calculator import TradeCalculator
+from models.user import db
+from quote_cache import QuoteCache
+from summary_cache import SummaryCache
+from user_cache import UserCache, user_cache
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_cached_user_is_loaded_once(app):
+    cache = UserCache(max_size=2, ttl=60)
+    with app.app_context():
+        user_id = make_user('cached@example.com').id
+        db.session.remove()
+
+        with count_queries() as statements:
+            first = cache.get(user_id)
+            second = cache.get(user_id)
+        assert len(statements) == 1
+        assert first is not second
+        assert second.email == 'cached@example.com' and second.check_password('secret')
+        assert cache.get(999) is None
+
+
+def test_user_updates_invalidate_the_shared_cache(app):
+    with app.app_context():
+        user = make_user('before@example.com')
+        assert user_cache.get(user.id).email == 'before@example.com'
+
+        user.email = 'after@example.com'
+        db.session.commit()
+        assert user_cache.get(user.id).email == 'after@example.com'
+
+
+def test_cache_is_bounded_and_expires(app):
+    with app.app_context():
+        ids = [make_user(f"u{i}@example.com").id for i in range(3)]
+        cache = UserCache(max_size=2, ttl=60)
+        for user_id in ids:
+            cache.get(user_id)
+        assert list(cache._entries) == ids[1:]
+
+        expiring = UserCache(max_size=2, ttl=0)
+        expiring.get(ids[0])
+        with count_queries() as statements:
+            expiring.get(ids[0])
+        assert len(statements) == 1
+
+
+def test_sell_units_runs_only_the_needed_queries(app):
+    with app.test_request_context():
+        user_id = make_user('seller@example.com').id
+        login_user(UserCache().get(user_id))
+        calc = TradeCalculator(quote_cache=QuoteCache(), summary_cache=SummaryCache())
+        trade = calc.add_trade('BTC/USDT', 100.0, 5.0)
+
+        with count_queries() as statements:
+            result = calc.sell_units(trade['id'], 2.0, 110.0)
+            history = calc.get_trade_sales_history(trade['id'])
+
+    # trade lookup, sale insert, trade update, rollup update, sales history
+    assert len(statements) == 5, statements
+    assert result['updated_trade']['Remaining Units'] == 3.0
+    assert history == [result['sale']]
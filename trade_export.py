@@ -0,0 +1,111 @@
+import io
+import json
+
+from sqlalchemy import select
+
+import serializers
+from models.user import db, Trade, Sale
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Column layout of the UI's trade and sale dicts
+TRADE_COLUMNS = serializers.TRADE_KEYS
+SALE_COLUMNS = serializers.SALE_KEYS
+
+
+def export_rows(kind, user_id, chunk_size=5000):
+    """Yield lists of UI-shaped row dicts, streamed from a server-side cursor"""
+    if kind == 'trades':
+        statement = select(*serializers.TRADE_COLUMNS).where(Trade.user_id == user_id).order_by(Trade.id)
+        to_dicts = serializers.trade_rows
+    elif kind == 'sales':
+        statement = select(*serializers.SALE_COLUMNS).join(Trade, Sale.trade_id == Trade.id).where(
+            Trade.user_id == user_id
+        ).order_by(Sale.id)
+        to_dicts = serializers.sale_rows
+    else:
+        raise ValueError("Export kind must be 'trades' or 'sales'")
+
+    result = db.session.execute(statement.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield to_dicts(partition)
+
+
+def export_stream(kind, user_id, fmt='csv', chunk_size=5000):
+    """Yield the encoded export file in pieces, one per chunk of rows"""
+    if kind not in ('trades', 'sales'):
+        raise ValueError("Export kind must be 'trades' or 'sales'")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    columns = TRADE_COLUMNS if kind == 'trades' else SALE_COLUMNS
+    chunks = export_rows(kind, user_id, chunk_size)
+
+    if fmt == 'csv':
+        return _csv_stream(chunks, columns)
+    if fmt == 'ndjson':
+        return _ndjson_stream(chunks)
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ValueError("Parquet export requires pyarrow to be installed")
+    return _parquet_stream(chunks, columns)
+
+
+def _csv_stream(chunks, columns):
+    import pandas as pd
+
+    yield pd.DataFrame(columns=columns).to_csv(index=False).encode()
+    for rows in chunks:
+        yield pd.DataFrame(rows, columns=columns).to_csv(index=False, header=False).encode()
+
+
+def _ndjson_stream(chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(row) + '\n' for row in rows).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _parquet_stream(chunks, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # id columns are integers, Date stays an ISO string as in the UI, the rest are floats
+    schema = pa.schema([
+        (c, pa.int64() if c in ('id', 'trade_id') else pa.string() if c in ('Date', 'Market') else pa.float64())
+        for c in columns
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in chunks:
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
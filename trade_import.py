@@ -0,0 +1,197 @@
+import json
+import logging
+import math
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+
+import portfolio_rollup
+from financial_calculator import TradeCalculator
+from models.user import db, Sale
+
+logger = logging.getLogger(__name__)
+
+# Accepted header spellings, including the trade_history.csv layout
+COLUMN_ALIASES = {
+    'date': 'date', 'date and time': 'date', 'datetime': 'date',
+    'market': 'market', 'ticker': 'market',
+    'entry_price': 'entry_price', 'entryprice': 'entry_price', 'entry price': 'entry_price', 'price': 'entry_price',
+    'units': 'units', 'total units': 'units', 'total_units': 'units',
+    'remaining_units': 'remaining_units', 'remainingunits': 'remaining_units', 'remaining units': 'remaining_units',
+    'sales': 'sales',
+}
+REQUIRED_COLUMNS = ['market', 'entry_price', 'units']
+MAX_REPORTED_ERRORS = 1000
+
+
+def import_trades(stream, user_id, fmt='csv', chunk_size=10000, progress=None):
+    """Stream trades (and their partial sales) from a CSV or JSONL file into the database.
+
+    Each chunk is validated with vectorized checks and written with bulk
+    inserts in its own transaction. Returns a report with row counts and
+    per-row errors; `progress` is called with the running report after
+    every chunk.
+    """
+    if fmt == 'csv':
+        chunks = pd.read_csv(stream, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    elif fmt == 'jsonl':
+        chunks = pd.read_json(stream, lines=True, chunksize=chunk_size, dtype=False)
+    else:
+        raise ValueError("Format must be 'csv' or 'jsonl'")
+
+    report = {'rowsRead': 0, 'tradesImported': 0, 'salesImported': 0, 'errorCount': 0, 'errors': []}
+    try:
+        for chunk in chunks:
+            first_row = report['rowsRead'] + 1
+            report['rowsRead'] += len(chunk)
+            trades, sales, errors = _prepare_chunk(chunk, first_row, user_id)
+            report['errorCount'] += len(errors)
+            report['errors'].extend(errors[:MAX_REPORTED_ERRORS - len(report['errors'])])
+
+            if trades:
+                _insert_chunk(trades, sales)
+                report['tradesImported'] += len(trades)
+                report['salesImported'] += sum(len(s) for s in sales)
+            if progress:
+                progress(report)
+    finally:
+        # Chunks are committed as they go, so a later failure still leaves
+        # imported rows behind; the rollups must cover them either way
+        if report['tradesImported']:
+            portfolio_rollup.rebuild(user_id)
+    logger.info("Import finished for user %s: %d trades, %d sales, %d errors",
+                user_id, report['tradesImported'], report['salesImported'], report['errorCount'])
+    return report
+
+
+def _prepare_chunk(chunk, first_row, user_id):
+    """Validate a chunk; returns trade rows, their sale rows and row errors"""
+    chunk = chunk.rename(columns=lambda c: COLUMN_ALIASES.get(str(c).strip().lower(), str(c)))
+    missing = [c for c in REQUIRED_COLUMNS if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    n = len(chunk)
+    market = chunk['market'].astype('string').str.strip().str.upper().fillna('')
+    entry_price = pd.to_numeric(chunk['entry_price'], errors='coerce').to_numpy(dtype=float)
+    units = pd.to_numeric(chunk['units'], errors='coerce').to_numpy(dtype=float)
+    if 'remaining_units' in chunk.columns:
+        remaining = _blank_to_nan(chunk['remaining_units'])
+        remaining = np.where(np.isnan(remaining), units, remaining)
+    else:
+        remaining = units.copy()
+
+    if 'date' in chunk.columns:
+        raw_dates = chunk['date'].astype('string').str.strip().fillna('')
+        dates = pd.to_datetime(raw_dates.replace('', None), errors='coerce', format='mixed')
+        bad_date = (raw_dates != '').to_numpy() & dates.isna().to_numpy()
+        dates = dates.fillna(pd.Timestamp(datetime.utcnow()))
+    else:
+        bad_date = np.zeros(n, dtype=bool)
+        dates = pd.Series([pd.Timestamp(datetime.utcnow())] * n)
+
+    messages = np.select([
+        (market == '').to_numpy(),
+        np.isnan(entry_price) | (entry_price <= 0),
+        np.isnan(units) | (units < 0),
+        np.isnan(remaining) | (remaining < 0) | (remaining > units),
+        bad_date,
+    ], [
+        "Market symbol is required",
+        "Entry price must be a positive number",
+        "Units must be a non-negative number",
+        "Remaining units must be between 0 and units",
+        "Invalid date",
+    ], default='')
+
+    sales_column = chunk['sales'].tolist() if 'sales' in chunk.columns else None
+    market = market.to_numpy()
+    dates = list(dates.dt.to_pydatetime())
+
+    trades, sales, errors = [], [], []
+    for i in range(n):
+        row_number = first_row + i
+        if messages[i]:
+            errors.append({'row': row_number, 'error': str(messages[i])})
+            continue
+
+        trade_sales = []
+        if sales_column is not None:
+            try:
+                trade_sales = _parse_sales(sales_column[i], entry_price[i], dates[i])
+            except ValueError as e:
+                errors.append({'row': row_number, 'error': str(e)})
+                continue
+            sold = sum(s['units_sold'] for s in trade_sales)
+            if trade_sales and not math.isclose(units[i] - sold, remaining[i], rel_tol=1e-9, abs_tol=1e-9):
+                errors.append({'row': row_number, 'error': "Remaining units do not match units minus sales"})
+                continue
+
+        trades.append({
+            'date': dates[i],
+            'market': market[i],
+            'entry_price': float(entry_price[i]),
+            'units': float(units[i]),
+            'remaining_units': float(remaining[i]),
+            'position_size': TradeCalculator.calculate_position_size(float(entry_price[i]), float(remaining[i])),
+            'user_id': user_id,
+        })
+        sales.append(trade_sales)
+    return trades, sales, errors
+
+
+def _blank_to_nan(column):
+    return pd.to_numeric(column.replace('', None), errors='coerce').to_numpy(dtype=float)
+
+
+def _parse_sales(value, entry_price, trade_date):
+    """Parse a trade's sales: a JSON list of {units, exitPrice, date} or 'units@price[@date];...'"""
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value == '':
+        return []
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith('['):
+            value = json.loads(text)
+        else:
+            value = []
+            for part in filter(None, (p.strip() for p in text.split(';'))):
+                fields = part.split('@')
+                if len(fields) not in (2, 3):
+                    raise ValueError(f"Invalid sale entry '{part}'")
+                value.append({'units': fields[0], 'exitPrice': fields[1],
+                              'date': fields[2] if len(fields) == 3 else None})
+
+    parsed = []
+    for sale in value:
+        try:
+            units_sold = float(sale['units'])
+            exit_price = float(sale['exitPrice'])
+            date = datetime.fromisoformat(sale['date']) if sale.get('date') else trade_date
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Invalid sale data")
+        if units_sold < 0 or exit_price < 0 or math.isnan(units_sold) or math.isnan(exit_price):
+            raise ValueError("Sale units and exit price must be non-negative")
+        parsed.append({
+            'date': date,
+            'units_sold': units_sold,
+            'exit_price': exit_price,
+            'partial_pl': TradeCalculator.calculate_profit_loss(entry_price, exit_price, units_sold),
+            'partial_pl_percentage': TradeCalculator.calculate_win_loss_percentage(entry_price, exit_price),
+        })
+    return parsed
+
+
+def _insert_chunk(trades, sales):
+    """Bulk insert one chunk of trades and their sales in a single transaction"""
+    try:
+        trade_ids = TradeCalculator.insert_trades(trades)
+        sale_rows = [dict(sale, trade_id=trade_id)
+                     for trade_id, trade_sales in zip(trade_ids, sales) for sale in trade_sales]
+        if sale_rows:
+            db.session.execute(insert(Sale.__table__), sale_rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
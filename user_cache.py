@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from models.user import db, User
+
+
+class UserCache:
+    """Bounded LRU of user rows for the Flask-Login user loader.
+
+    Entries are plain column values, so each request gets its own detached
+    User instance and nothing is shared between sessions or threads. Rows
+    are dropped when a User is updated or deleted in this process; the TTL
+    bounds staleness for changes made by other processes.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = int(max_size if max_size is not None else os.getenv('USER_CACHE_MAX_SIZE', 4096))
+        self.ttl = float(ttl if ttl is not None else os.getenv('USER_CACHE_TTL', 300))
+        self._entries = OrderedDict()  # user_id -> (values, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Detached User for `user_id`, loading and caching the row on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                return self._build(entry[0])
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        with self._lock:
+            self._entries[user_id] = (values, now)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return self._build(values)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _build(values):
+        user = User(**values)
+        # Detached with an identity, as if loaded by an earlier session
+        make_transient_to_detached(user)
+        return user
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)